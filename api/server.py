@@ -1,6 +1,13 @@
+import asyncio
+import functools
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 import polars as pl
-from fastapi import FastAPI, HTTPException, Body
+from fastapi import FastAPI, HTTPException, Body, Header, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import Optional, List, Any, Dict
 from dotenv import load_dotenv
@@ -8,39 +15,146 @@ from dotenv import load_dotenv
 # Import Core
 from core.context import get_user_context, UserContext
 from core.engine import DataEngine
+from core.rollups import default_rollups
+from core.catalog import load_catalog
+from core.ingest import Compactor, DeltaTable, is_incremental
 from core.ai import AIEngine
 from core.agent import PerformanceAgent
+from core.streaming import iter_arrow_ipc, iter_ndjson
+from core.formats import encode_frame, negotiate_format
+from core.downsample import downsample
+from core.summary import KpiSummary
+from core.question_cache import QuestionCache
+from core.cache import permission_hash
+from core.pagination import CursorAccessError, CursorNotFoundError, ResultPager
+from core.deadline import CancelToken, QueryCancelledError, QueryTimeoutError
+from core.cost import QueryTooExpensiveError
+from core.admission import AdmissionController, AdmissionRejectedError
 
 load_dotenv()
 
 app = FastAPI(title="PPC Analysis AI API", version="1.1")
 
 # --- INITIALIZATION ---
-DATA_PATH = os.path.abspath("../scrape_tool/exports/Big_Master_PPC_Data.parquet")
-if not os.path.exists(DATA_PATH):
-    DATA_PATH = os.path.abspath("../scrape_tool/exports/Master_PPC_Data.parquet")
+# Dataset catalog: CATALOG_PATH (file JSON, xem core/catalog.py) hoặc mặc định master + exports/snapshots
+CATALOG = load_catalog(os.getenv("CATALOG_PATH"))
+# DATA_PATH env: file Parquet, thư mục partitioned theo niche (xem core/partitioning.py)
+# hoặc dataset incremental base + delta (xem core/ingest.py)
+DATA_PATH = os.getenv("DATA_PATH") or CATALOG.primary.path
 
 api_key = os.getenv("GEMINI_API_KEY")
 
+# Admission control: tối đa DATA_MAX_CONCURRENT query DuckDB chạy cùng lúc, phần dư xếp hàng theo role
+DATA_THREADS = int(os.getenv("DATA_THREADS", "0")) or os.cpu_count() or 1
+admission = AdmissionController(
+    max_concurrent=int(os.getenv("DATA_MAX_CONCURRENT", "4")),
+    max_queue=int(os.getenv("DATA_MAX_QUEUE", "32")),
+    queue_timeout=float(os.getenv("DATA_QUEUE_TIMEOUT", "30")),
+)
+
 # Engine & Agent Setup
-data_engine = DataEngine(DATA_PATH, brand_col="Main niche")
+data_engine = DataEngine(
+    DATA_PATH,
+    brand_col="Main niche",
+    result_cache_bytes=int(os.getenv("RESULT_CACHE_MB", "256")) * 1024 * 1024,
+    # Load Parquet 1 lần vào table native (DATA_PERSIST_DIR -> lưu thành file .duckdb để restart nhanh)
+    resident=os.getenv("DATA_RESIDENT", "1") == "1",
+    persist_dir=os.getenv("DATA_PERSIST_DIR") or None,
+    # Rollup ngày × niche: query aggregate được chuyển sang bảng tổng hợp nhỏ hơn hàng nghìn lần
+    rollups=default_rollups("Main niche") if os.getenv("DATA_ROLLUPS", "1") == "1" else None,
+    # Sample phân tầng theo niche cho approximate mode (0 -> tắt)
+    sample_fraction=float(os.getenv("DATA_SAMPLE_FRACTION", "0.02")) or None,
+    # Dataset phụ (snapshots...): secure view chỉ được đăng ký khi SQL tham chiếu tới
+    datasets=CATALOG.secondary,
+    admission=admission,
+    threads=DATA_THREADS,
+    # Request chỉ kiểm tra file nguồn đổi tối đa 1 lần / DATA_UPDATE_CHECK_INTERVAL giây (watcher vẫn poll riêng)
+    update_check_interval=float(os.getenv("DATA_UPDATE_CHECK_INTERVAL", "1")),
+)
+# Pool thread riêng cho việc blocking: endpoint async không bao giờ chặn event loop.
+# - LLM_POOL: chờ I/O Gemini (nhiều thread, gần như không tốn CPU)
+# - DB_POOL : DuckDB compute (ít thread; nên > DATA_MAX_CONCURRENT để còn chỗ cho schema / stream)
+LLM_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_WORKERS", "16")), thread_name_prefix="llm")
+DB_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("DATA_WORKERS", "8")), thread_name_prefix="duckdb")
+
+# Kết quả phân trang: spill Arrow IPC ra đĩa, TTL trượt (PAGE_TTL giây), tổng dung lượng PAGE_SPILL_MB
+result_pager = ResultPager(
+    spill_dir=os.getenv("PAGE_SPILL_DIR") or None,
+    ttl=float(os.getenv("PAGE_TTL", "600")),
+    max_bytes=int(os.getenv("PAGE_SPILL_MB", "2048")) * 1024 * 1024,
+)
+
 ai_engine = AIEngine(api_key)
-agent = PerformanceAgent(data_engine, ai_engine)
+# Cache câu hỏi -> SQL (persist ra đĩa): câu hỏi lặp lại / gần giống không phải chờ AI 10-20s
+question_cache = None
+if os.getenv("QUESTION_CACHE", "1") == "1":
+    question_cache = QuestionCache(
+        os.getenv("QUESTION_CACHE_PATH", "../scrape_tool/exports/question_cache.jsonl"),
+        threshold=float(os.getenv("QUESTION_CACHE_THRESHOLD", "0.75")),
+    )
+agent = PerformanceAgent(data_engine, ai_engine, db_executor=DB_POOL, question_cache=question_cache)
 
 # Cache all niches for context mapping
 ALL_NICHES = data_engine.get_all_brands()
 
+def _refresh_niches(version: str):
+    """
+    Dataset hot-reload xong -> cập nhật lại ALL_NICHES (không phải đợi restart).
+    Đọc lỗi -> giữ danh sách cũ thay vì xóa trắng quyền của mọi group.
+    """
+    global ALL_NICHES
+    try:
+        ALL_NICHES = data_engine.get_all_brands(strict=True)
+    except Exception as e:
+        print(f"⚠️ Niche refresh failed (keep previous list): {e}")
+
+data_engine.on_reload(_refresh_niches)
+
+# KPI tổng hợp theo niche cho trang chủ / Dashboard (/metrics/summary), cập nhật tăng dần theo file
+kpi_summary = KpiSummary(DATA_PATH, "Main niche")
+
+def _refresh_summary(version: str):
+    """Reload xong -> aggregate các file mới ngay trong thread reload, request sau không phải chờ."""
+    try:
+        kpi_summary.refresh()
+    except Exception as e:
+        print(f"⚠️ KPI summary refresh failed: {e}")
+
+data_engine.on_reload(_refresh_summary)
+_refresh_summary("startup")
+data_engine.start_watcher(interval=float(os.getenv("DATA_WATCH_INTERVAL", "30")))
+
+# Dataset incremental: gộp delta ở background khi vượt ngưỡng (watcher tự nhận manifest mới)
+compactor = None
+if is_incremental(DATA_PATH) and os.getenv("DATA_COMPACT", "1") == "1":
+    compactor = Compactor(
+        DeltaTable(DATA_PATH, "Main niche"),
+        interval=float(os.getenv("DATA_COMPACT_INTERVAL", "60")),
+        max_deltas=int(os.getenv("DATA_COMPACT_MAX_DELTAS", "8")),
+    )
+    compactor.start()
+
 # --- DTO MODELS (Request/Response) ---
 class QueryRequest(BaseModel):
     question: str
     token: str
     history: Optional[List[dict]] = []
+    timeout: Optional[float] = None  # Deadline (giây) mỗi lần chạy SQL, bị chặn trên bởi giới hạn của role
+    approximate: bool = False        # Câu hỏi thăm dò -> chạy trên sample, kết quả kèm khoảng tin cậy
+    profile: bool = False            # metrics.profile = thời gian / cardinality từng operator DuckDB
+    format: Optional[str] = None     # json | columnar | arrow | parquet (ưu tiên hơn header Accept)
+    page_size: Optional[int] = None  # Chỉ trả page đầu + `cursor`, các page sau lấy qua /data/page
 
 class QueryResponse(BaseModel):
     status: str
     message: str
     data: Optional[Any] = None
     sql: Optional[str] = None
+    error: Optional[Dict[str, Any]] = None  # Lỗi có cấu trúc (VD: query_timeout)
+    metrics: Optional[Dict[str, Any]] = None  # Thời gian AI / DB, rollup, approximate + sample_fraction...
+    cursor: Optional[str] = None       # Phân trang (page_size): id để lấy page tiếp theo qua /data/page
+    total_rows: Optional[int] = None
+    next_offset: Optional[int] = None
 
 # Models cho Whitebox Endpoints
 class AuthRequest(BaseModel):
@@ -51,25 +165,190 @@ class GenSQLRequest(BaseModel):
     schema_info: str
     history: Optional[List[dict]] = []
 
+class DownsampleOptions(BaseModel):
+    max_points: int = 2000            # Số dòng tối đa trả về (mỗi series khi có `group`: max_points / số series)
+    method: str = "lttb"              # lttb (giữ hình dạng) | minmax (giữ spike)
+    x: Optional[str] = None           # Mặc định: cột ngày/giờ đầu tiên
+    y: Optional[List[str]] = None     # Mặc định: các cột số còn lại
+    group: Optional[str] = None       # VD: "SKU" -> downsample từng series riêng
+
 class ExecuteSQLRequest(BaseModel):
     sql: str
     user_context: UserContext # FastAPI sẽ tự parse JSON thành object UserContext
+    stream: Optional[str] = None  # None (JSON thường) | "ndjson" | "arrow" (Arrow IPC stream)
+    batch_size: int = 10_000      # Số dòng mỗi chunk khi stream
+    timeout: Optional[float] = None  # Deadline (giây), bị chặn trên bởi giới hạn của role
+    approximate: bool = False        # Aggregate chạy trên sample (chỉ áp dụng cho response JSON)
+    profile: bool = False            # Trả kèm `profile` (profiler DuckDB theo operator)
+    format: Optional[str] = None     # json | columnar | arrow | parquet (ưu tiên hơn header Accept)
+    page_size: Optional[int] = None  # Phân trang: chỉ trả page đầu + `cursor` (kết quả spill ra đĩa)
+    downsample: Optional[DownsampleOptions] = None  # Time-series cho chart: giảm số điểm trước khi trả về
+
+class PageRequest(BaseModel):
+    cursor: str
+    user_context: UserContext  # Kiểm tra lại quyền ở mỗi page (phải cùng filter RLS với lúc chạy query)
+    offset: int = 0
+    page_size: int = 1000
+    format: Optional[str] = None
+
+STREAM_FORMATS = {
+    "ndjson": (iter_ndjson, "application/x-ndjson"),
+    "arrow": (iter_arrow_ipc, "application/vnd.apache.arrow.stream"),
+}
+
+# Status code khi client đóng kết nối trước khi có response (quy ước của nginx)
+CLIENT_CLOSED_REQUEST = 499
+DISCONNECT_POLL_INTERVAL = 0.25
+
+async def run_blocking(executor: ThreadPoolExecutor, func, *args, **kwargs):
+    """Chạy func blocking trong `executor` (LLM_POOL / DB_POOL), event loop vẫn phục vụ request khác."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+async def run_cancellable(http_request: Request, executor: ThreadPoolExecutor, func, *args, **kwargs):
+    """
+    Chạy func (blocking: DuckDB / AI) trong `executor`, đồng thời theo dõi kết nối của client.
+    Client ngắt kết nối -> CancelToken.cancel() -> DuckDB interrupt query đang chạy,
+    không để query mồ côi chiếm CPU / cursor của pool.
+    func nhận thêm kwarg `cancel_token`.
+    """
+    token = CancelToken()
+    task = asyncio.ensure_future(run_blocking(executor, func, *args, cancel_token=token, **kwargs))
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+        if done:
+            return task.result()
+        if await http_request.is_disconnected():
+            token.cancel()
+            # Chờ thread thoát hẳn (interrupt) để cursor về pool trước khi trả lời
+            return await task
+
+def format_response(df: pl.DataFrame, fmt: str, meta: dict) -> Response:
+    """
+    Response columnar JSON (meta nằm trong body) hoặc Arrow / Parquet (meta đưa lên header X-*,
+    giá trị text được percent-encode vì header chỉ nhận latin-1).
+    """
+    if fmt == "columnar":
+        body, media_type = encode_frame(df, fmt, meta)
+        return Response(content=body, media_type=media_type)
+    body, media_type = encode_frame(df, fmt)
+    headers = {"X-Rows": str(len(df))}
+    for key, value in meta.items():
+        if value is None or isinstance(value, (dict, list)):
+            continue
+        name = "X-" + "-".join(part.capitalize() for part in key.split("_"))
+        headers[name] = quote(str(value), safe=" :/,.=()*<>'")
+    return Response(content=body, media_type=media_type, headers=headers)
+
+def first_page(df_or_stream, user_context: UserContext, page_size: int, meta: Optional[dict] = None):
+    """
+    Spill toàn bộ kết quả (DataFrame hoặc QueryStream) ra Arrow rồi đọc page đầu.
+    Kết quả vừa 1 page -> xóa cursor luôn (cursor=None).
+    Returns: (page DataFrame, info: cursor / total_rows / next_offset / expires_in).
+    """
+    owner = data_engine.permission_key(user_context)
+    meta = {"version": data_engine.dataset_version(), **(meta or {})}
+    if isinstance(df_or_stream, pl.DataFrame):
+        cursor = result_pager.spill_frame(df_or_stream, owner, meta)
+    else:
+        with df_or_stream as stream:
+            cursor = result_pager.spill(stream, stream.schema, owner, meta)
+    df, info = result_pager.page(cursor, owner, 0, page_size)
+    if info["next_offset"] is None:
+        result_pager.close(cursor, owner)
+        cursor = None
+    return df, {"cursor": cursor, **info}
+
+def spill_query(sql: str, user_context: UserContext, page_size: int, timeout: Optional[float] = None,
+                cancel_token: Optional[CancelToken] = None):
+    """Chạy query dạng stream, ghi thẳng ra file Arrow (RAM không phụ thuộc kích thước kết quả)."""
+    stream = data_engine.execute_query_stream(sql, user_context, timeout=timeout, cancel_token=cancel_token)
+    return first_page(stream, user_context, page_size)
+
+def page_payload(df: pl.DataFrame, info: dict, fmt: str):
+    meta = {"status": "success", "rows": len(df), **info}
+    if fmt == "json":
+        return {**meta, "data": df.to_dicts()}
+    return format_response(df, fmt, meta)
+
+def etag_matches(if_none_match: Optional[str], tag: str) -> bool:
+    """
+    So `If-None-Match` với tag (weak comparison như RFC 9110): danh sách cách nhau dấu phẩy, `*`,
+    tag weak `W/"..."`, và cả tag không có nháy (n8n gửi lại `version` trần).
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate[:2].upper() == "W/":
+            candidate = candidate[2:]
+        if candidate.strip('"') == tag:
+            return True
+    return False
+
+def conditional_response(response: Response, tag: str, if_none_match: Optional[str]) -> Optional[Response]:
+    """Gắn ETag cho response; client đã có bản mới nhất -> trả Response 304 (không body), ngược lại None."""
+    etag = f'"{tag}"'
+    if etag_matches(if_none_match, tag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return None
+
+def query_error_to_http(e: Exception) -> HTTPException:
+    """Map lỗi deadline / cancel / vượt budget / quá tải sang HTTP status có cấu trúc."""
+    if isinstance(e, QueryTimeoutError):
+        return HTTPException(status_code=408, detail=e.to_dict())
+    if isinstance(e, QueryTooExpensiveError):
+        return HTTPException(status_code=422, detail=e.to_dict())
+    if isinstance(e, QueryCancelledError):
+        return HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail=str(e))
+    if isinstance(e, CursorNotFoundError):
+        return HTTPException(status_code=410, detail=str(e))
+    if isinstance(e, CursorAccessError):
+        return HTTPException(status_code=403, detail=str(e))
+    if isinstance(e, AdmissionRejectedError):
+        return HTTPException(status_code=503, detail=e.to_dict(),
+                             headers={"Retry-After": str(max(1, round(e.retry_after)))})
+    return HTTPException(status_code=400, detail=f"Execution Error: {str(e)}")
 
 # --- 1. BLACKBOX ENDPOINT (Backward Compatibility) ---
 @app.post("/query", response_model=QueryResponse)
-async def query_agent(request: QueryRequest):
+async def query_agent(request: QueryRequest, http_request: Request):
     """
     All-in-one endpoint: Auth -> AI -> Execute -> Result.
     Dùng cho: Quick Demo, Simple Apps.
+    Client ngắt kết nối giữa chừng -> query DuckDB đang chạy bị hủy.
+    `format` / header Accept: columnar JSON, Arrow IPC hoặc Parquet thay cho list dict theo dòng.
     """
+    try:
+        fmt = negotiate_format(request.format, http_request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
         user_ctx = get_user_context(request.token, ALL_NICHES)
         
         if user_ctx.role == "viewer" and not user_ctx.allowed_brands:
              raise HTTPException(status_code=401, detail="Invalid Token or No Permissions")
 
-        result = agent.process_request(request.question, user_ctx, request.history)
+        # Agent chờ Gemini trong LLM_POOL, phần SQL tự chuyển sang DB_POOL (xem PerformanceAgent)
+        result = await run_cancellable(http_request, LLM_POOL, agent.process_request, request.question, user_ctx,
+                                       request.history, timeout=request.timeout,
+                                       approximate=request.approximate, profile=request.profile)
         
+        df = result.get("data")
+        if isinstance(df, pl.DataFrame) and request.page_size:
+            # Phân trang: spill kết quả, response chỉ chứa page đầu
+            df, info = await run_blocking(DB_POOL, first_page, df, user_ctx, request.page_size)
+            result.update(data=df, cursor=info["cursor"], total_rows=info["total_rows"],
+                          next_offset=info["next_offset"])
+        if isinstance(df, pl.DataFrame) and fmt != "json":
+            meta = {k: v for k, v in result.items() if k not in ("data", "metrics")}
+            if fmt == "columnar":
+                meta["metrics"] = result.get("metrics")
+            return await run_blocking(DB_POOL, format_response, df, fmt, meta)
+
         # Convert Polars to Dict
         if "data" in result and isinstance(result["data"], pl.DataFrame):
             result["data"] = result["data"].to_dicts()
@@ -90,47 +369,189 @@ async def get_auth_context(req: AuthRequest):
     return ctx
 
 @app.post("/agent/schema")
-async def get_schema(user_context: UserContext):
+async def get_schema(user_context: UserContext, response: Response, if_none_match: Optional[str] = Header(default=None)):
     """
     Step 2: Get Secure Schema based on UserContext.
     n8n Node: Context Loader
+    Schema được cache theo (data fingerprint, permission set). Trả kèm `version` + header ETag;
+    n8n gửi lại `If-None-Match: <version>` -> 304 nếu schema chưa đổi (khỏi fetch lại).
     """
     try:
-        # Note: DataEngine logic might need IO, usually fast but keep in mind
-        schema = data_engine.get_schema_info(user_context)
-        return {"schema": schema}
+        schema, version = await run_blocking(DB_POOL, data_engine.get_versioned_schema, user_context)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Schema Error: {str(e)}")
 
+    not_modified = conditional_response(response, version, if_none_match)
+    if not_modified is not None:
+        return not_modified
+    return {"schema": schema, "version": version}
+
+def generate_sql_cached(question: str, schema_info: str, history: Optional[list]) -> dict:
+    """
+    Tra question_cache trước khi gọi AI. Luồng n8n không báo lại kết quả execute, nên SQL mới chỉ được
+    lưu khi qua được validate_sql (Agent /query thì chỉ lưu SQL đã chạy thành công).
+    """
+    if question_cache is None:
+        return ai_engine.generate_sql(question, schema_info, history)
+    cached = question_cache.get(question, schema_info, history)
+    if cached:
+        return {
+            "sql": cached["sql"],
+            "explanation": cached["explanation"],
+            "cache": {"hit": True, "match": cached["match"], "similarity": cached["similarity"],
+                      "saved_s": cached["saved_s"]},
+        }
+    started = time.time()
+    response = ai_engine.generate_sql(question, schema_info, history)
+    sql = response.get("sql")
+    if sql:
+        try:
+            data_engine.validate_sql(sql)
+            question_cache.put(question, schema_info, history, sql, response.get("explanation"),
+                               ai_seconds=time.time() - started)
+        except ValueError:
+            pass
+    return {**response, "cache": {"hit": False}}
+
 @app.post("/agent/generate-sql")
 async def generate_sql(req: GenSQLRequest):
     """
     Step 3: Generate SQL from Question + Schema.
     n8n Node: AI Brain
+    Câu hỏi đã gặp (kể cả khác chữ hoa / dấu / khoảng trắng / số, hoặc gần giống) -> SQL lấy từ
+    question cache, response có `cache` (hit, match, similarity, saved_s).
     """
     try:
-        response = ai_engine.generate_sql(req.question, req.schema_info, req.history)
-        return response # {"sql": "...", "explanation": "..."}
+        response = await run_blocking(LLM_POOL, generate_sql_cached, req.question, req.schema_info, req.history)
+        return response # {"sql": "...", "explanation": "...", "cache": {...}}
     except Exception as e:
          raise HTTPException(status_code=500, detail=f"AI Error: {str(e)}")
 
 @app.post("/data/execute")
-async def execute_sql(req: ExecuteSQLRequest):
+async def execute_sql(req: ExecuteSQLRequest, http_request: Request):
     """
     Step 4: Execute SQL with Guardrails & Shadow View.
     n8n Node: Data Execution
+    `stream="ndjson" | "arrow"` -> chunked response theo từng Arrow batch, RAM server không
+    phụ thuộc kích thước kết quả (không build list dict cho toàn bộ kết quả).
+    `timeout` quá hạn -> 408 kèm gợi ý làm query rẻ hơn; client ngắt kết nối -> query bị hủy (499).
+    `format` / header Accept (không stream): "columnar" (JSON theo cột), "arrow" (Arrow IPC), "parquet";
+    mặc định list dict theo dòng như cũ.
+    `page_size`: chỉ trả page đầu + `cursor`; toàn bộ kết quả được spill ra file Arrow (TTL),
+    các page sau lấy qua /data/page mà không chạy lại query.
+    `downsample`: kết quả time-series được giảm còn ~max_points dòng (LTTB / min-max) trước khi encode,
+    response có thêm `downsampled` (method, original_rows...). Không dùng cùng `stream` / `page_size`.
     """
+    if req.stream is not None and req.stream not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported stream format: {req.stream}")
+    if req.downsample is not None and (req.stream or req.page_size):
+        raise HTTPException(status_code=400, detail="downsample cannot be combined with stream or page_size")
+    try:
+        fmt = negotiate_format(req.format, http_request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     try:
+        if req.page_size:
+            df, info = await run_cancellable(http_request, DB_POOL, spill_query, req.sql, req.user_context,
+                                             req.page_size, timeout=req.timeout)
+            return await run_blocking(DB_POOL, page_payload, df, info, fmt)
+
+        if req.stream:
+            # DataEngine handles Security & Validation (lỗi nổ ra ở đây, trước khi gửi header 200)
+            stream = await run_cancellable(http_request, DB_POOL, data_engine.execute_query_stream, req.sql,
+                                           req.user_context, batch_size=req.batch_size, timeout=req.timeout)
+            encoder, media_type = STREAM_FORMATS[req.stream]
+            return StreamingResponse(encoder(stream), media_type=media_type, background=BackgroundTask(stream.close))
+
         # DataEngine handles Security & Validation
-        df = data_engine.execute_query(req.sql, req.user_context)
-        
+        metrics = {}
+        df = await run_cancellable(http_request, DB_POOL, data_engine.execute_query, req.sql, req.user_context,
+                                   metrics=metrics, timeout=req.timeout, approximate=req.approximate,
+                                   profile=req.profile)
+        downsampled = None
+        if req.downsample is not None:
+            opts = req.downsample
+            df, downsampled = await run_blocking(DB_POOL, downsample, df, opts.max_points, opts.method,
+                                                 opts.x, opts.y, opts.group)
+
+        if fmt != "json":
+            meta = {
+                "status": "success",
+                "rows": len(df),
+                "approximate": metrics.get("approximate", False),
+                "sample_fraction": metrics.get("sample_fraction"),
+                "downsampled": downsampled,
+            }
+            if fmt == "columnar":
+                meta["profile"] = metrics.get("profile")
+            # Encode (CPU) trong DB_POOL, không chặn event loop
+            return await run_blocking(DB_POOL, format_response, df, fmt, meta)
+
         return {
             "status": "success",
             "rows": len(df),
-            "data": df.to_dicts() # Polars -> JSON
+            "data": df.to_dicts(), # Polars -> JSON
+            "approximate": metrics.get("approximate", False),
+            "sample_fraction": metrics.get("sample_fraction"),
+            "profile": metrics.get("profile"),
+            "downsampled": downsampled,
         }
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Execution Error: {str(e)}")
+        raise query_error_to_http(e)
+
+@app.post("/data/page")
+async def get_page(req: PageRequest, http_request: Request):
+    """
+    Page tiếp theo của kết quả đã spill (từ /data/execute hoặc /query với `page_size`).
+    Quyền được kiểm tra lại ở MỌI page: user_context phải có cùng filter RLS với user đã chạy query (403),
+    cursor hết hạn -> 410 (chạy lại query).
+    """
+    try:
+        fmt = negotiate_format(req.format, http_request.headers.get("accept"))
+        owner = data_engine.permission_key(req.user_context)
+        df, info = await run_blocking(DB_POOL, result_pager.page, req.cursor, owner, req.offset, req.page_size)
+        return await run_blocking(DB_POOL, page_payload, df, {"cursor": req.cursor, **info}, fmt)
+    except Exception as e:
+        raise query_error_to_http(e)
+
+@app.delete("/data/page/{cursor}")
+async def close_page(cursor: str, user_context: UserContext):
+    """Client đọc xong -> xóa file spill ngay thay vì đợi TTL."""
+    try:
+        return {"closed": result_pager.close(cursor, data_engine.permission_key(user_context))}
+    except Exception as e:
+        raise query_error_to_http(e)
+
+@app.post("/metrics/summary")
+async def metrics_summary(user_context: UserContext, response: Response,
+                          if_none_match: Optional[str] = Header(default=None)):
+    """
+    KPI tổng (revenue, ads spend, TACOS, số SKU active) + breakdown theo niche, chỉ gồm các niche
+    user được phép xem. Đọc từ aggregate theo niche đã duy trì sẵn (không quét raw data),
+    cache theo (dataset version, permission set). ETag -> `If-None-Match` trả 304 khi chưa đổi.
+    """
+    try:
+        result = await run_blocking(DB_POOL, kpi_summary.summary, user_context)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Summary Error: {str(e)}")
+
+    not_modified = conditional_response(response, f'{result["version"]}-{permission_hash(user_context)}', if_none_match)
+    if not_modified is not None:
+        return not_modified
+    return result
+
+@app.get("/system/stats")
+async def system_stats():
+    """Monitoring: hàng đợi admission (độ sâu, thời gian chờ, số request bị từ chối), pool cursor, result cache."""
+    return {
+        "admission": data_engine.admission_stats(),
+        "pool": data_engine.pool_stats(),
+        "result_cache": data_engine.result_cache_stats(),
+        "pages": result_pager.stats(),
+        "summary": kpi_summary.stats(),
+        "question_cache": question_cache.stats() if question_cache is not None else None,
+    }
 
 if __name__ == "__main__":
     import uvicorn
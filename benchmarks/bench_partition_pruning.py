@@ -0,0 +1,82 @@
+"""
+Benchmark: latency query của user bị giới hạn quyền (2 niche) trên
+  - before: 1 file Parquet nguyên khối, RLS = WHERE "Main niche" IN (...)
+  - after : dataset Hive-partitioned theo niche, shadow view chỉ đọc partition được phép
+
+Usage:
+    python benchmarks/bench_partition_pruning.py --rows 1000000 10000000 --runs 7
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.context import UserContext
+from core.engine import DataEngine
+from core.partitioning import write_brand_partitions
+from benchmarks.synthetic import generate_synthetic
+
+QUERIES = {
+    "total_revenue": 'SELECT SUM("Revenue (Actual)") AS rev FROM secure_sales',
+    "revenue_by_niche": 'SELECT "Main niche", SUM("Revenue (Actual)") AS rev, SUM("Ads Spend (Actual)") AS spend '
+                        'FROM secure_sales GROUP BY 1 ORDER BY 2 DESC',
+    "daily_trend": 'SELECT "Report_Date", SUM("Revenue (Actual)") AS rev FROM secure_sales GROUP BY 1 ORDER BY 1',
+    "top_skus": 'SELECT "SKU", SUM("Units Sold") AS units FROM secure_sales GROUP BY 1 ORDER BY 2 DESC LIMIT 20',
+}
+
+
+def time_query(engine, sql, ctx, runs):
+    engine.execute_query(sql, ctx)  # warm-up (OS page cache, footer)
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        engine.execute_query(sql, ctx)
+        samples.append(time.perf_counter() - t0)
+    return {"median_ms": statistics.median(samples) * 1000, "max_ms": max(samples) * 1000}
+
+
+def run(rows_list, runs, workdir):
+    results = []
+    for rows in rows_list:
+        master = generate_synthetic(os.path.join(workdir, f"ppc_{rows}.parquet"), rows)
+        part_dir = os.path.join(workdir, f"ppc_{rows}_by_niche")
+        if not os.path.isdir(part_dir):
+            write_brand_partitions(master, part_dir, "Main niche")
+
+        before = DataEngine(master, brand_col="Main niche", result_cache_bytes=0)
+        after = DataEngine(part_dir, brand_col="Main niche", result_cache_bytes=0)
+        niches = sorted(before.get_all_brands())
+        ctx = UserContext(user_id="bench", role="sales", allowed_brands=niches[:2])
+
+        for name, sql in QUERIES.items():
+            b = time_query(before, sql, ctx, runs)
+            a = time_query(after, sql, ctx, runs)
+            row = {
+                "rows": rows,
+                "query": name,
+                "before_median_ms": round(b["median_ms"], 2),
+                "after_median_ms": round(a["median_ms"], 2),
+                "speedup": round(b["median_ms"] / a["median_ms"], 2) if a["median_ms"] else None,
+            }
+            results.append(row)
+            print(f"{rows:>11,} | {name:<17} | before {row['before_median_ms']:>9.2f} ms | "
+                  f"after {row['after_median_ms']:>9.2f} ms | x{row['speedup']}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--workdir", default=os.path.join(os.path.dirname(__file__), ".data"))
+    parser.add_argument("--output", default=None, help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    res = run(args.rows, args.runs, args.workdir)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(res, f, indent=2)
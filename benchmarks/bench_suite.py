@@ -0,0 +1,270 @@
+"""
+Benchmark suite tái lập được: cùng dataset giả lập (seed cố định, schema của gen_big_data_v2 /
+Master_PPC_Data), cùng bộ query, chạy qua 3 tầng:
+  - engine: DataEngine.execute_query
+  - agent : PerformanceAgent.process_request với FakeAI (trả SQL cố định, không gọi Gemini)
+  - api   : FastAPI app (/data/execute và /query) qua TestClient in-process
+Kết quả: p50 / p95 / p99 / mean (ms) + RSS đỉnh của process trong lúc chạy từng query, ghi JSON
+để so sánh giữa các release.
+
+Usage:
+    python benchmarks/bench_suite.py --rows 1000000 10000000 50000000 --runs 20 --output bench.json
+    python benchmarks/bench_suite.py --rows 1000000 --layers engine agent --roles sales
+"""
+import argparse
+import importlib
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import duckdb
+import polars as pl
+
+from core.agent import PerformanceAgent
+from core.context import UserContext
+from core.engine import DataEngine
+from benchmarks.synthetic import generate_synthetic
+
+# Bộ query cố định: (tên, câu hỏi cho Agent / FakeAI, SQL). Đổi corpus = đổi baseline -> tăng CORPUS_VERSION.
+CORPUS_VERSION = 1
+CORPUS = [
+    ("total_revenue", "What is total revenue?",
+     'SELECT SUM("Revenue (Actual)") AS rev FROM secure_sales'),
+    ("revenue_by_niche", "Revenue and spend by niche",
+     'SELECT "Main niche", SUM("Revenue (Actual)") AS rev, SUM("Ads Spend (Actual)") AS spend '
+     'FROM secure_sales GROUP BY 1 ORDER BY 2 DESC'),
+    ("acos_by_niche", "ACOS by niche",
+     'SELECT "Main niche", SUM("Ads Spend (Actual)") / NULLIF(SUM("Revenue (Actual)"), 0) AS acos '
+     'FROM secure_sales GROUP BY 1 ORDER BY 2'),
+    ("daily_trend", "Daily revenue trend",
+     'SELECT "Report_Date", SUM("Revenue (Actual)") AS rev FROM secure_sales GROUP BY 1 ORDER BY 1'),
+    ("monthly_trend", "Monthly revenue and clicks",
+     'SELECT date_trunc(\'month\', "Report_Date") AS month, SUM("Revenue (Actual)") AS rev, SUM("Clicks") AS clicks '
+     'FROM secure_sales GROUP BY 1 ORDER BY 1'),
+    ("top_skus_last_30d", "Top 20 SKUs by units in the last 30 days",
+     'SELECT "SKU", SUM("Units Sold") AS units FROM secure_sales '
+     'WHERE "Report_Date" >= DATE \'2025-12-01\' GROUP BY 1 ORDER BY 2 DESC LIMIT 20'),
+    ("ctr_by_niche_filtered", "CTR by niche for products with impressions",
+     'SELECT "Main niche", SUM("Clicks")::DOUBLE / NULLIF(SUM("Impressions"), 0) AS ctr '
+     'FROM secure_sales WHERE "Impressions" > 0 GROUP BY 1 ORDER BY 2 DESC'),
+    ("niche_rank_window", "Top 3 SKUs per niche by revenue",
+     'SELECT * FROM (SELECT "Main niche", "SKU", SUM("Revenue (Actual)") AS rev, '
+     'row_number() OVER (PARTITION BY "Main niche" ORDER BY SUM("Revenue (Actual)") DESC) AS rk '
+     'FROM secure_sales GROUP BY 1, 2) WHERE rk <= 3 ORDER BY 1, 4'),
+    ("detail_rows", "List the 1000 most recent rows",
+     'SELECT * FROM secure_sales ORDER BY "Report_Date" DESC LIMIT 1000'),
+]
+
+# Token của auth giả lập (core/context.py) tương ứng với từng role benchmark
+ROLE_TOKENS = {"admin": "admin_secret", "sales": "group_ab"}
+
+
+class FakeAI:
+    """AIEngine tất định: câu hỏi trong CORPUS -> SQL cố định, `latency` giây giả lập thời gian gọi LLM."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.sql_by_question = {question: sql for _, question, sql in CORPUS}
+
+    def generate_sql(self, question, schema_info, history=None):
+        if self.latency:
+            time.sleep(self.latency)
+        sql = self.sql_by_question.get(question)
+        if sql is None:
+            return {"sql": None, "explanation": "Unknown benchmark question."}
+        return {"sql": sql, "explanation": "benchmark"}
+
+
+def _rss_bytes() -> int:
+    """RSS hiện tại của process (Linux /proc; nơi khác dùng ru_maxrss)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakMemory:
+    """Lấy mẫu RSS mỗi `interval` giây trong block `with` (gồm cả RAM của DuckDB, không chỉ heap Python)."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = _rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+def percentile(samples, q: float) -> float:
+    """Percentile nội suy tuyến tính (q trong [0, 100])."""
+    ordered = sorted(samples)
+    if len(ordered) == 1:
+        return ordered[0]
+    pos = (len(ordered) - 1) * q / 100
+    lo, hi = math.floor(pos), math.ceil(pos)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def measure(fn, runs: int, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    with PeakMemory() as mem:
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - t0) * 1000)
+    return {
+        "runs": runs,
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+        "mean_ms": round(sum(samples) / len(samples), 3),
+        "peak_rss_mb": round(mem.peak / 1024 ** 2, 1),
+    }
+
+
+def _contexts(engine: DataEngine, roles):
+    niches = sorted(engine.get_all_brands())
+    contexts = {
+        "admin": UserContext(user_id="bench", role="admin", allowed_brands=["ALL"]),
+        # Giống token group_ab của auth giả lập: niche bắt đầu bằng A / B
+        "sales": UserContext(user_id="bench", role="sales_ab",
+                             allowed_brands=[n for n in niches if n[:1].upper() in ("A", "B")]),
+    }
+    return {role: contexts[role] for role in roles}
+
+
+def _check(result):
+    if isinstance(result, dict) and result.get("status") not in (None, "success"):
+        raise RuntimeError(f"Benchmark query failed: {result.get('message')}")
+    if hasattr(result, "status_code") and result.status_code != 200:
+        raise RuntimeError(f"Benchmark request failed ({result.status_code}): {result.text[:200]}")
+    return result
+
+
+def _load_api(engine: DataEngine, ai: FakeAI):
+    """
+    Import api.server rồi thay engine (dùng chung với tầng engine -> cùng cấu hình, so sánh được)
+    và AI thật bằng FakeAI. Tắt question cache: câu hỏi lặp lại giữa các run sẽ bỏ qua FakeAI
+    (và ghi vào file cache của server) -> số đo tầng API không còn so sánh được.
+    """
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    os.environ["DATA_PATH"] = engine.db_path
+    os.environ["DATA_RESIDENT"] = "0"
+    os.environ["DATA_WATCH_INTERVAL"] = "3600"
+    os.environ["QUESTION_CACHE"] = "0"
+    server = importlib.import_module("api.server")
+    server.data_engine = engine
+    server.agent.data_engine = engine
+    server.ALL_NICHES = engine.get_all_brands()
+    server.ai_engine = ai
+    server.agent.ai_engine = ai
+    server.question_cache = None
+    server.agent.question_cache = None
+    from fastapi.testclient import TestClient
+    return TestClient(server.app)
+
+
+def run(rows_list, runs, workdir, layers, roles, ai_latency=0.0, resident=False):
+    results = []
+    for rows in rows_list:
+        path = generate_synthetic(os.path.join(workdir, f"ppc_{rows}.parquet"), rows)
+        # Không result cache / guardrail chi phí: đo đúng thời gian thực thi của từng query
+        engine = DataEngine(path, brand_col="Main niche", result_cache_bytes=0, resident=resident, cost_budgets={})
+        ai = FakeAI(ai_latency)
+        agent = PerformanceAgent(engine, ai)
+        contexts = _contexts(engine, roles)
+        client = _load_api(engine, ai) if "api" in layers else None
+
+        for name, question, sql in CORPUS:
+            for role, ctx in contexts.items():
+                calls = {
+                    "engine": lambda: engine.execute_query(sql, ctx),
+                    "agent": lambda: _check(agent.process_request(question, ctx)),
+                }
+                if client is not None:
+                    calls["api_execute"] = lambda: _check(client.post(
+                        "/data/execute", json={"sql": sql, "user_context": ctx.model_dump()}))
+                    calls["api_query"] = lambda: _check(client.post(
+                        "/query", json={"question": question, "token": ROLE_TOKENS[role]}))
+                for layer, fn in calls.items():
+                    if layer.split("_")[0] not in layers:
+                        continue
+                    stats = measure(fn, runs)
+                    row = {"rows": rows, "layer": layer, "role": role, "query": name, **stats}
+                    results.append(row)
+                    print(f"{rows:>11,} | {layer:<11} | {role:<5} | {name:<21} | p50 {stats['p50_ms']:>9.2f} ms | "
+                          f"p95 {stats['p95_ms']:>9.2f} | p99 {stats['p99_ms']:>9.2f} | RSS {stats['peak_rss_mb']:>7.1f} MB")
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def metadata(args) -> dict:
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "corpus_version": CORPUS_VERSION,
+        "python": platform.python_version(),
+        "duckdb": duckdb.__version__,
+        "polars": pl.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "runs": args.runs,
+        "resident": args.resident,
+        "ai_latency_s": args.ai_latency,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark engine / agent / API trên dataset PPC giả lập.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000, 50_000_000])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--layers", nargs="+", choices=["engine", "agent", "api"], default=["engine", "agent", "api"])
+    parser.add_argument("--roles", nargs="+", choices=sorted(ROLE_TOKENS), default=["admin", "sales"])
+    parser.add_argument("--ai-latency", type=float, default=0.0, help="Giây giả lập cho mỗi lần gọi LLM")
+    parser.add_argument("--resident", action="store_true", help="Load dataset vào table native (DATA_RESIDENT=1)")
+    parser.add_argument("--workdir", default=os.path.join(os.path.dirname(__file__), ".data"))
+    parser.add_argument("--output", default=None, help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    report = {
+        "meta": metadata(args),
+        "results": run(args.rows, args.runs, args.workdir, args.layers, args.roles,
+                       ai_latency=args.ai_latency, resident=args.resident),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Wrote {len(report['results'])} results to {args.output}")
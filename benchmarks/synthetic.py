@@ -0,0 +1,36 @@
+import os
+
+import duckdb
+
+# Schema PPC giả lập (cùng tên cột với Master_PPC_Data.parquet mà Dashboard / gen_big_data_v2 dùng)
+SYNTHETIC_SQL = """
+SELECT
+    DATE '2025-01-01' + CAST(i % {days} AS INTEGER)                       AS "Report_Date",
+    chr(65 + CAST((i * 7919) % {niches} AS INTEGER) % 26)
+        || '_Niche_' || CAST((i * 7919) % {niches} AS VARCHAR)          AS "Main niche",
+    'SKU_' || CAST(i % 50000 AS VARCHAR)                                AS "SKU",
+    'B0' || CAST(1000000 + i % 50000 AS VARCHAR)                        AS "ASIN",
+    'Product ' || CAST(i % 50000 AS VARCHAR)                            AS "Product Name",
+    CAST(hash(i) % 5000 AS BIGINT)                                      AS "Impressions",
+    CAST(hash(i + 1) % 200 AS BIGINT)                                   AS "Clicks",
+    CAST(hash(i + 2) % 20 AS BIGINT)                                    AS "Units Sold",
+    round((hash(i + 3) % 100000) / 100.0, 2)                            AS "Revenue (Actual)",
+    round((hash(i + 4) % 30000) / 100.0, 2)                             AS "Ads Spend (Actual)"
+FROM range({rows}) t(i)
+"""
+
+
+def generate_synthetic(path: str, rows: int, niches: int = 60, days: int = 365) -> str:
+    """Sinh file Parquet PPC giả lập `rows` dòng (niche trộn lẫn trong mọi row group). Bỏ qua nếu đã có."""
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    con = duckdb.connect(":memory:")
+    try:
+        query = SYNTHETIC_SQL.format(rows=rows, niches=niches, days=days)
+        con.execute(f"COPY ({query}) TO '{tmp_path}' (FORMAT PARQUET, COMPRESSION ZSTD)")
+    finally:
+        con.close()
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,181 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from .context import UserContext
+from .deadline import CancelToken, QueryCancelledError
+
+# Ưu tiên theo role (nhỏ hơn = được chạy trước). Role dạng "sales_ab" dùng prefix "sales".
+DEFAULT_ROLE_PRIORITIES = {"admin": 0, "manager": 1, "sales": 2, "viewer": 3, "default": 3}
+# Chờ mỗi giây được cộng 1/AGING_SECONDS bậc ưu tiên -> viewer không bị admin chặn mãi
+AGING_SECONDS = 10.0
+_POLL_INTERVAL = 0.1
+
+
+class AdmissionRejectedError(RuntimeError):
+    """Server quá tải: hàng đợi đầy hoặc chờ quá lâu. Client nên thử lại sau `retry_after` giây."""
+
+    def __init__(self, reason: str, queue_depth: int, retry_after: float = 1.0):
+        self.reason = reason
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+        super().__init__(f"Server is busy: {reason}.")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "error": "server_busy",
+            "message": str(self),
+            "queue_depth": self.queue_depth,
+            "retry_after_s": self.retry_after,
+        }
+
+
+class _Waiter:
+    def __init__(self, priority: int, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.admitted = False
+
+    def rank(self, now: float) -> tuple:
+        return (self.priority - (now - self.enqueued) / AGING_SECONDS, self.seq)
+
+
+class AdmissionSlot:
+    """Quyền chạy 1 query + thời gian chờ / số query đang chạy tại thời điểm được nhận."""
+
+    def __init__(self, wait_s: float, queue_depth: int, active: int):
+        self.wait_s = wait_s
+        self.queue_depth = queue_depth
+        self.active = active
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "wait_ms": round(self.wait_s * 1000, 3),
+            "queue_depth": self.queue_depth,
+            "active": self.active,
+        }
+
+
+class AdmissionController:
+    """
+    Giới hạn số query DuckDB chạy đồng thời trên database dùng chung.
+    - Tối đa `max_concurrent` query chạy; query dư chờ trong hàng đợi giới hạn `max_queue`
+      (đầy -> AdmissionRejectedError ngay, không để request dồn vô hạn).
+    - Hàng đợi ưu tiên theo role (admin > manager > sales > viewer), cùng mức thì FIFO, có aging.
+    - DuckDB áp `threads` / `memory_limit` cho cả database (cấu hình đã khóa, không set riêng từng
+      cursor được), nên tài nguyên chỉ được chia gián tiếp bằng cách giới hạn số query chạy cùng lúc.
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_queue: int = 32, queue_timeout: float = 30.0,
+                 role_priorities: Optional[dict] = None):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.role_priorities = DEFAULT_ROLE_PRIORITIES if role_priorities is None else role_priorities
+
+        self._cond = threading.Condition()
+        self._counter = itertools.count()
+        self._waiting: list = []
+        self._active = 0
+
+        self._admitted = 0
+        self._queued = 0
+        self._queued_admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._queue_depth_max = 0
+
+    def priority(self, context: UserContext) -> int:
+        role = context.role or ""
+        prios = self.role_priorities
+        return prios.get(role, prios.get(role.split("_")[0], prios.get("default", 0)))
+
+    def _grant(self, now: float):
+        """Nhận waiter có rank tốt nhất vào các slot trống (gọi khi đang giữ _cond)."""
+        while self._waiting and self._active < self.max_concurrent:
+            best = min(self._waiting, key=lambda w: w.rank(now))
+            self._waiting.remove(best)
+            best.admitted = True
+            self._active += 1
+        self._cond.notify_all()
+
+    def _slot(self, wait_s: float, depth: int) -> AdmissionSlot:
+        return AdmissionSlot(wait_s, depth, self._active)
+
+    def acquire(self, context: UserContext, timeout: Optional[float] = None,
+                cancel_token: Optional[CancelToken] = None) -> AdmissionSlot:
+        """
+        Chờ tới lượt chạy. `timeout`: thời gian chờ tối đa (mặc định queue_timeout).
+        Raises: AdmissionRejectedError (hàng đợi đầy / chờ quá hạn), QueryCancelledError.
+        """
+        limit = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        with self._cond:
+            depth = len(self._waiting)
+            if self._active < self.max_concurrent and not self._waiting:
+                self._active += 1
+                self._admitted += 1
+                return self._slot(0.0, 0)
+            if depth >= self.max_queue:
+                self._rejected += 1
+                raise AdmissionRejectedError(f"{depth} queries already queued", depth)
+
+            waiter = _Waiter(self.priority(context), next(self._counter))
+            self._waiting.append(waiter)
+            self._queued += 1
+            self._queue_depth_max = max(self._queue_depth_max, depth + 1)
+            deadline = waiter.enqueued + limit
+            while not waiter.admitted:
+                now = time.monotonic()
+                cancelled = cancel_token is not None and cancel_token.cancelled
+                if cancelled or now >= deadline:
+                    self._waiting.remove(waiter)
+                    if cancelled:
+                        raise QueryCancelledError()
+                    self._timed_out += 1
+                    raise AdmissionRejectedError(f"waited {limit:.1f}s in the queue", len(self._waiting))
+                # Poll ngắn để nhận cancel từ client đã ngắt kết nối
+                self._cond.wait(min(deadline - now, _POLL_INTERVAL))
+
+            wait_s = time.monotonic() - waiter.enqueued
+            self._admitted += 1
+            self._queued_admitted += 1
+            self._wait_total += wait_s
+            self._wait_max = max(self._wait_max, wait_s)
+            return self._slot(wait_s, depth)
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._grant(time.monotonic())
+
+    @contextmanager
+    def admit(self, context: UserContext, timeout: Optional[float] = None,
+              cancel_token: Optional[CancelToken] = None):
+        """`with controller.admit(ctx) as slot: ...` -> slot luôn được trả kể cả khi query lỗi."""
+        slot = self.acquire(context, timeout, cancel_token)
+        try:
+            yield slot
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            waited = self._queued_admitted
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queue_depth": len(self._waiting),
+                "queue_depth_max": self._queue_depth_max,
+                "admitted": self._admitted,
+                "queued": self._queued,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "wait_avg_ms": (self._wait_total / waited * 1000) if waited else 0.0,
+                "wait_max_ms": self._wait_max * 1000,
+            }
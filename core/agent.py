@@ -1,18 +1,45 @@
 import time
-from typing import Dict, Any, Union
+from concurrent.futures import Executor
+from typing import Dict, Any, Optional, Union
 import polars as pl
 from .engine import DataEngine
+from .deadline import CancelToken, QueryCancelledError, QueryTimeoutError
+from .cost import QueryTooExpensiveError
+from .admission import AdmissionRejectedError
+from .parsed_query import parse_query
 from .ai import AIEngine
 from .context import UserContext
+from .question_cache import QuestionCache
 
 class PerformanceAgent:
-    def __init__(self, data_engine: DataEngine, ai_engine: AIEngine):
+    def __init__(self, data_engine: DataEngine, ai_engine: AIEngine, db_executor: Optional[Executor] = None,
+                 question_cache: Optional[QuestionCache] = None):
+        """
+        db_executor (optional): pool thread riêng cho DuckDB. Agent chạy trong pool LLM (chờ Gemini),
+        phần SQL được đẩy sang pool này -> số query chạy song song bị giới hạn bởi pool DuckDB,
+        không phải bởi số request AI đang chờ.
+        question_cache (optional): cache câu hỏi -> SQL; câu hỏi lặp lại (kể cả khác chữ hoa / dấu / số)
+        bỏ qua AI. Chỉ SQL chạy thành công mới được lưu.
+        """
         self.data_engine = data_engine
         self.ai_engine = ai_engine
+        self.db_executor = db_executor
+        self.question_cache = question_cache
+
+    def _run_db(self, func, *args, **kwargs):
+        if self.db_executor is None:
+            return func(*args, **kwargs)
+        return self.db_executor.submit(func, *args, **kwargs).result()
     
-    def process_request(self, question: str, user_context: UserContext, history: list = None, max_retries: int = 2) -> Dict[str, Any]:
+    def process_request(self, question: str, user_context: UserContext, history: list = None, max_retries: int = 2,
+                        timeout: Optional[float] = None, cancel_token: Optional[CancelToken] = None,
+                        approximate: bool = False, profile: bool = False) -> Dict[str, Any]:
         """
         Main Agent Loop with Self-Correction & Manual SQL Support.
+        timeout: deadline (giây) cho mỗi lần chạy SQL. Query quá hạn -> AI được yêu cầu viết lại rẻ hơn.
+        cancel_token: client hủy request -> dừng ngay, không retry.
+        approximate: câu hỏi thăm dò -> aggregate chạy trên sample (metrics["approximate"], ["sample_fraction"]).
+        profile: bật profiler DuckDB -> metrics["profile"] (thời gian / cardinality từng operator).
         """
         # Global Timer
         t_start_total = time.time()
@@ -26,21 +53,37 @@ class PerformanceAgent:
 
         # 1. Lấy Schema
         try:
-            schema_info = self.data_engine.get_schema_info(user_context)
+            schema_info = self._run_db(self.data_engine.get_schema_info, user_context)
         except Exception as e:
             return {"status": "error", "message": f"Data Access Error: {str(e)}"}
         
         # --- LOGIC BYPASS AI (MANUAL SQL) ---
         clean_q = question.strip().upper()
-        if clean_q.startswith("SELECT") or clean_q.startswith("WITH") or clean_q.startswith("DESCRIBE") or clean_q.startswith("SHOW"):
+        if clean_q.startswith("SELECT") or clean_q.startswith("WITH"):
             sql = question
             explanation = "🚀 Manual SQL Execution Mode (AI Bypassed)"
             is_manual = True
+            cached = None
         else:
             # Normal AI Flow - Measure AI Time
             t_ai_start = time.time()
-            ai_response = self.ai_engine.generate_sql(question, schema_info, history)
+            # Câu hỏi đã gặp (chính xác / gần giống) -> lấy SQL từ cache, bỏ qua 10-20s của AI
+            cached = self.question_cache.get(question, schema_info, history) if self.question_cache else None
+            if cached:
+                ai_response = cached
+            else:
+                ai_response = self.ai_engine.generate_sql(question, schema_info, history)
             metrics["ai_thinking"] = time.time() - t_ai_start
+            if self.question_cache is not None:
+                cache_stats = self.question_cache.stats()
+                metrics["question_cache"] = {
+                    "hit": cached is not None,
+                    "match": cached["match"] if cached else None,
+                    "similarity": cached["similarity"] if cached else None,
+                    "saved_s": cached["saved_s"] if cached else 0.0,
+                    "hit_rate": cache_stats["hit_rate"],
+                    "seconds_saved_total": cache_stats["seconds_saved"],
+                }
             
             sql = ai_response.get("sql")
             explanation = ai_response.get("explanation")
@@ -56,6 +99,7 @@ class PerformanceAgent:
 
         # Retry Loop
         last_error = None
+        last_error_info = None
         attempts = 1 if is_manual else (max_retries + 1)
         
         for attempt in range(attempts):
@@ -63,34 +107,90 @@ class PerformanceAgent:
                 # 4. Thực thi SQL & Đo Time DB
                 t_db_start = time.time()
                 
-                df = self.data_engine.execute_query(sql, user_context)
+                # Parse 1 lần: validate / result cache / rollup / format hiển thị dùng chung AST
+                query = parse_query(sql)
+                df = self._run_db(self.data_engine.execute_query, query, user_context, metrics=metrics,
+                                  timeout=timeout, cancel_token=cancel_token,
+                                  approximate=approximate, profile=profile)
                 
                 db_exec_time = time.time() - t_db_start
                 metrics["db_execution"] = db_exec_time # New Metric
+
+                # Result Cache Counters (engine đã ghi result_cache_hit cho query này)
+                cache_stats = self.data_engine.result_cache_stats()
+                metrics["result_cache_hits"] = cache_stats["hits"]
+                metrics["result_cache_misses"] = cache_stats["misses"]
+                
+                # SQL do AI viết (hoặc AI sửa lại từ SQL cache) đã chạy OK -> lưu cho lần hỏi sau
+                if self.question_cache is not None and not is_manual and (cached is None or sql != cached["sql"]):
+                    self.question_cache.put(question, schema_info, history, sql, explanation,
+                                            ai_seconds=metrics["ai_thinking"])
                 
                 # Total Time
                 metrics["total_latency"] = time.time() - t_start_total
                 
                 msg = f"Found {len(df)} records in {db_exec_time:.4f}s." if not df.is_empty() else f"Query executed in {db_exec_time:.4f}s (No data)."
+                if metrics.get("approximate"):
+                    msg += f" ≈ Approximate result from a {metrics['sample_fraction']:.1%} sample (±95% CI in *_ci95 columns)."
                 
                 return {
                     "status": "success",
                     "data": df,
                     "sql": sql,
+                    "sql_pretty": query.pretty,
                     "message": msg,
                     "exec_time": db_exec_time, # KEEP FOR BACKWARD COMPAT
                     "metrics": metrics         # NEW DETAILED METRICS
                 }
             
+            except AdmissionRejectedError as e:
+                # Server quá tải (SQL không sai) -> không nhờ AI viết lại, báo client thử lại sau
+                metrics["total_latency"] = time.time() - t_start_total
+                return {
+                    "status": "busy",
+                    "sql": sql,
+                    "message": str(e),
+                    "error": e.to_dict(),
+                    "metrics": metrics
+                }
+
+            except QueryCancelledError as e:
+                # Client đã bỏ đi -> không tốn thêm AI / DB cho request này
+                metrics["total_latency"] = time.time() - t_start_total
+                return {
+                    "status": "cancelled",
+                    "sql": sql,
+                    "message": str(e),
+                    "metrics": metrics
+                }
+
             except Exception as e:
                 last_error = str(e)
+                last_error_info = e.to_dict() if isinstance(e, (QueryTimeoutError, QueryTooExpensiveError)) else None
                 print(f"⚠️ SQL Execution Failed (Attempt {attempt+1}/{attempts}): {last_error}")
+                if cached is not None and sql == cached["sql"] and not last_error_info:
+                    # SQL trong cache không còn chạy được -> bỏ entry, AI sửa như bình thường
+                    self.question_cache.invalidate(question, schema_info, history, sql)
                 
                 if not is_manual and attempt < max_retries:
                     # Self-Correction (Measure AI Time again)
                     t_fix_start = time.time()
                     
-                    fix_prompt = f"""
+                    if last_error_info:
+                        # Query đúng nhưng quá nặng (timeout / vượt budget EXPLAIN) -> yêu cầu viết lại RẺ hơn
+                        fix_prompt = f"""
+                    The previous SQL query was too expensive: {last_error_info["message"]}
+                    
+                    Original Question: "{question}"
+                    Slow SQL: {sql}
+                    
+                    Please REWRITE the SQL so it answers the same question but is much cheaper to run.
+                    - {last_error_info["hint"]}
+                    - Ensure you use valid DuckDB syntax.
+                    - Return ONLY JSON with the fixed 'sql'.
+                    """
+                    else:
+                        fix_prompt = f"""
                     The previous SQL query failed with this error: "{last_error}".
                     
                     Original Question: "{question}"
@@ -119,6 +219,7 @@ class PerformanceAgent:
             "status": "sql_error",
             "sql": sql,
             "message": f"SQL Execution Failed. Error: {last_error}",
+            "error": last_error_info,
             "original_explanation": explanation,
             "metrics": metrics
         }
\ No newline at end of file
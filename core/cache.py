@@ -0,0 +1,174 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import polars as pl
+import pyarrow as pa
+
+from .context import UserContext
+from .ingest import DELTA_FINGERPRINT, DeltaTable, is_incremental
+
+
+def file_fingerprint(path: str) -> Tuple:
+    """
+    Fingerprint của file data: (path, mtime_ns, size).
+    File bị ghi đè (scraper chạy lại) -> fingerprint đổi -> cache tự invalidate.
+    Dataset dạng thư mục (partitioned): (path, mtime_ns lớn nhất, tổng size) + hash danh sách file.
+    Dataset incremental: theo manifest (xem DeltaTable.fingerprint).
+    """
+    st = os.stat(path)
+    if not os.path.isdir(path):
+        return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    if is_incremental(path):
+        return DeltaTable(path).fingerprint()
+
+    listing = []
+    for root, _, files in os.walk(path):
+        for name in files:
+            if name.endswith(".parquet"):
+                f_st = os.stat(os.path.join(root, name))
+                listing.append((os.path.relpath(os.path.join(root, name), path), f_st.st_mtime_ns, f_st.st_size))
+    listing.sort()
+    max_mtime = max([item[1] for item in listing], default=st.st_mtime_ns)
+    total_size = sum(item[2] for item in listing)
+    digest = hashlib.sha1(repr(listing).encode("utf-8")).hexdigest()[:12]
+    return (os.path.abspath(path), max_mtime, total_size, digest)
+
+
+def fingerprint_version(fingerprint) -> str:
+    """Version tag ngắn gọn (12 ký tự hex) từ fingerprint, dùng làm ETag / cache key."""
+    if len(fingerprint) == 4 and fingerprint[1] == DELTA_FINGERPRINT:
+        # Dataset incremental: compaction chỉ đổi danh sách file, data giữ nguyên -> giữ version
+        fingerprint = fingerprint[:3]
+    return hashlib.sha1(repr(fingerprint).encode("utf-8")).hexdigest()[:12]
+
+
+def permission_hash(context: UserContext) -> str:
+    """
+    Hash của tập quyền (allowed_brands). Thứ tự / trùng lặp không ảnh hưởng.
+    Admin ('ALL') luôn có cùng 1 hash.
+    """
+    if "ALL" in context.allowed_brands:
+        return "ALL"
+    payload = "\x1f".join(sorted(set(context.allowed_brands)))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class SchemaCache:
+    """
+    Cache schema string theo (dataset fingerprint, permission hash).
+    Khi fingerprint đổi, toàn bộ entry của version cũ bị bỏ.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple, Tuple[str, str]] = {}
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, fingerprint, perm_hash: str, builder: Callable[[], str]) -> Tuple[str, str]:
+        """
+        Returns: (schema, version). `builder` chỉ được gọi khi cache miss.
+        """
+        key = (fingerprint, perm_hash)
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                # Data đã đổi -> invalidate toàn bộ
+                self._entries.clear()
+                self._fingerprint = fingerprint
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        schema = builder()
+        version = hashlib.sha1(f"{fingerprint_version(fingerprint)}|{perm_hash}|{schema}".encode("utf-8")).hexdigest()[:12]
+        with self._lock:
+            if fingerprint == self._fingerprint:
+                self._entries[key] = (schema, version)
+        return schema, version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._fingerprint = None
+
+
+class ResultCache:
+    """
+    Cache kết quả query (LRU) giới hạn theo BYTE.
+    Mỗi entry là Arrow IPC stream đã nén (zstd) -> tốn ít RAM hơn giữ nguyên DataFrame.
+    max_bytes=0 -> tắt cache.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, compression: str = "zstd"):
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _serialize(self, df: pl.DataFrame) -> bytes:
+        table = df.to_arrow()
+        sink = pa.BufferOutputStream()
+        options = pa.ipc.IpcWriteOptions(compression=self.compression)
+        with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    def _deserialize(self, payload: bytes) -> pl.DataFrame:
+        return pl.from_arrow(pa.ipc.open_stream(payload).read_all())
+
+    def get(self, key: str) -> Optional[pl.DataFrame]:
+        if not self.max_bytes:
+            return None
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return self._deserialize(payload)
+
+    def put(self, key: str, df: pl.DataFrame):
+        if not self.max_bytes:
+            return
+        payload = self._serialize(df)
+        if len(payload) > self.max_bytes:
+            # Kết quả quá to so với budget -> không cache
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = payload
+            self._bytes += len(payload)
+            # Evict LRU cho tới khi về lại budget
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
@@ -0,0 +1,120 @@
+import json
+import os
+from typing import List, Optional, Set
+
+from sqlglot import exp
+
+from .ingest import DeltaTable, is_incremental
+from .partitioning import is_partitioned
+
+# Schema nội bộ chứa view gốc (chưa lọc RLS) của các dataset phụ -> user SQL không được đọc trực tiếp.
+CATALOG_SCHEMA = "catalog"
+# Tên bảng của dataset chính, không dùng làm tên dataset phụ
+RESERVED_NAMES = {"secure_sales", "raw_sales"}
+
+
+class DatasetSource:
+    """
+    1 nguồn Parquet trong catalog: file, thư mục (đọc mọi *.parquet bên trong), dataset incremental hoặc glob.
+    Được expose cho user SQL dưới tên `name` (secure view, lọc RLS theo `brand_col`).
+    """
+
+    def __init__(self, name: str, path: str, brand_col: Optional[str] = "Main niche", description: str = ""):
+        if not name.isidentifier():
+            raise ValueError(f"Invalid dataset name: {name!r}")
+        self.name = name
+        self.path = path
+        self.brand_col = brand_col
+        self.description = description
+
+    def source_sql(self) -> str:
+        if is_incremental(self.path):
+            return DeltaTable(self.path, self.brand_col or "Main niche").source_sql()
+        safe_path = self.path.replace("'", "''")
+        if is_partitioned(self.path):
+            # Thư mục snapshot: mỗi file có thể khác schema -> union_by_name
+            return f"SELECT * FROM read_parquet('{safe_path}/**/*.parquet', union_by_name=true)"
+        return f"SELECT * FROM read_parquet('{safe_path}', union_by_name=true)"
+
+
+class Catalog:
+    """
+    Danh sách dataset: 1 dataset chính (raw_sales / secure_sales, có rollup, sample...) + các dataset phụ
+    chỉ được đăng ký (lazy) khi query thực sự tham chiếu tới.
+
+    File config JSON (đường dẫn tương đối tính từ thư mục của file config):
+        {
+          "primary": "sales",
+          "datasets": [
+            {"name": "sales", "path": ["Big_Master_PPC_Data.parquet", "Master_PPC_Data.parquet"]},
+            {"name": "snapshots", "path": "snapshots", "brand_col": "Main niche"}
+          ]
+        }
+    `path` là list -> dùng file đầu tiên tồn tại.
+    """
+
+    def __init__(self, datasets: List[DatasetSource], primary: str = "sales"):
+        self.datasets = datasets
+        self.primary_name = primary
+
+    @property
+    def primary(self) -> DatasetSource:
+        for ds in self.datasets:
+            if ds.name == self.primary_name:
+                return ds
+        raise ValueError(f"Primary dataset '{self.primary_name}' is not in the catalog")
+
+    @property
+    def secondary(self) -> List[DatasetSource]:
+        return [ds for ds in self.datasets if ds.name != self.primary_name]
+
+    @staticmethod
+    def _resolve(path, base_dir: str) -> str:
+        candidates = path if isinstance(path, list) else [path]
+        resolved = [os.path.abspath(os.path.join(base_dir, p)) for p in candidates]
+        for candidate in resolved:
+            if os.path.exists(candidate):
+                return candidate
+        return resolved[-1]
+
+    @classmethod
+    def from_file(cls, config_path: str) -> "Catalog":
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        base_dir = os.path.dirname(os.path.abspath(config_path))
+        datasets = [
+            DatasetSource(
+                entry["name"],
+                cls._resolve(entry["path"], base_dir),
+                brand_col=entry.get("brand_col", "Main niche"),
+                description=entry.get("description", ""),
+            )
+            for entry in config["datasets"]
+        ]
+        return cls(datasets, primary=config.get("primary", "sales"))
+
+    @classmethod
+    def default(cls, exports_dir: str = "../scrape_tool/exports") -> "Catalog":
+        """Master Parquet (bản Big nếu có) + thư mục snapshot mà AI Assistant lưu ra."""
+        return cls([
+            DatasetSource("sales", cls._resolve(["Big_Master_PPC_Data.parquet", "Master_PPC_Data.parquet"], exports_dir)),
+            DatasetSource("snapshots", cls._resolve("snapshots", exports_dir),
+                          description="Saved query result snapshots (schema varies per file)"),
+        ])
+
+
+def load_catalog(config_path: Optional[str] = None, exports_dir: str = "../scrape_tool/exports") -> Catalog:
+    """CATALOG_PATH (file JSON) nếu có, không thì catalog mặc định trong exports_dir."""
+    if config_path:
+        return Catalog.from_file(config_path)
+    return Catalog.default(exports_dir)
+
+
+def referenced_tables(ast: exp.Expression) -> Set[str]:
+    """Tên bảng (không schema, lowercase) mà query tham chiếu, trừ tên CTE."""
+    ctes = {cte.alias_or_name.lower() for cte in ast.find_all(exp.CTE)}
+    return {
+        table.name.lower()
+        for table in ast.find_all(exp.Table)
+        if not table.db and table.name and table.name.lower() not in ctes
+    }
@@ -0,0 +1,108 @@
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+# Budget mặc định theo role. Role dạng "sales_ab" dùng prefix "sales", role lạ dùng "default".
+#   max_scan_rows        : tổng số dòng ước lượng đọc từ bảng / file
+#   max_intermediate_rows: cardinality ước lượng lớn nhất của 1 operator (join nổ, cross product...)
+DEFAULT_ROLE_BUDGETS = {
+    "admin": {"max_scan_rows": 5_000_000_000, "max_intermediate_rows": 5_000_000_000},
+    "manager": {"max_scan_rows": 1_000_000_000, "max_intermediate_rows": 1_000_000_000},
+    "sales": {"max_scan_rows": 500_000_000, "max_intermediate_rows": 200_000_000},
+    "viewer": {"max_scan_rows": 100_000_000, "max_intermediate_rows": 50_000_000},
+    "default": {"max_scan_rows": 100_000_000, "max_intermediate_rows": 50_000_000},
+}
+
+_CARDINALITY_KEY = "Estimated Cardinality"
+_CROSS_OPERATORS = {"CROSS_PRODUCT", "NESTED_LOOP_JOIN", "BLOCKWISE_NL_JOIN", "PIECEWISE_MERGE_JOIN"}
+
+
+class PlanCost:
+    """Chi phí ước lượng của 1 physical plan (từ EXPLAIN, không chạy query)."""
+
+    def __init__(self):
+        self.rows_scanned = 0
+        self.max_intermediate_rows = 0
+        self.joins: List[str] = []
+        self.cross_products = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "rows_scanned": self.rows_scanned,
+            "max_intermediate_rows": self.max_intermediate_rows,
+            "joins": self.joins,
+            "cross_products": self.cross_products,
+        }
+
+
+class QueryTooExpensiveError(ValueError):
+    """Plan vượt budget của role -> từ chối TRƯỚC khi chạy. Payload có cấu trúc cho AI / API."""
+
+    def __init__(self, reason: str, cost: PlanCost):
+        self.reason = reason
+        self.cost = cost
+        super().__init__(f"Query rejected before execution: {reason}.")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "error": "query_too_expensive",
+            "message": str(self),
+            "estimate": self.cost.to_dict(),
+            "hint": "Make this query cheaper: filter by Report_Date / niche first, aggregate before joining, "
+                    "join on equality keys instead of cross joins, and avoid self-joins on the full table.",
+        }
+
+
+def _cardinality(info: dict) -> Optional[int]:
+    match = re.search(r"\d+", str(info.get(_CARDINALITY_KEY, "")))
+    return int(match.group()) if match else None
+
+
+def _walk(node: dict, cost: PlanCost) -> int:
+    """Duyệt operator tree, trả về cardinality ước lượng ở output của node."""
+    children = [_walk(child, cost) for child in node.get("children", [])]
+    name = node.get("name", "")
+    info = node.get("extra_info") or {}
+    card = _cardinality(info)
+
+    if "JOIN" in name or name in _CROSS_OPERATORS:
+        cost.joins.append(name)
+    if name in _CROSS_OPERATORS and not info.get("Conditions"):
+        cost.cross_products += 1
+        if card is None:
+            # DuckDB không ước lượng cardinality cho cross product -> tích các input
+            card = 1
+            for child in children:
+                card *= max(child, 1)
+    if not children:
+        cost.rows_scanned += card or 0
+    if card is None:
+        card = max(children, default=0)
+    cost.max_intermediate_rows = max(cost.max_intermediate_rows, card)
+    return card
+
+
+def estimate_cost(con, sql: str) -> PlanCost:
+    """Chạy `EXPLAIN (FORMAT JSON)` (chỉ plan, không execute) và tổng hợp chi phí."""
+    cost = PlanCost()
+    for key, plan in con.execute(f"EXPLAIN (FORMAT JSON) {sql}").fetchall():
+        if key != "physical_plan":
+            continue
+        for root in json.loads(plan):
+            _walk(root, cost)
+    return cost
+
+
+def check_budget(cost: PlanCost, budget: Optional[dict]):
+    """Raises QueryTooExpensiveError nếu cost vượt budget (budget None -> không giới hạn)."""
+    if not budget:
+        return
+    reasons = []
+    if budget.get("max_scan_rows") is not None and cost.rows_scanned > budget["max_scan_rows"]:
+        reasons.append(f"scans ~{cost.rows_scanned:,} rows (budget {budget['max_scan_rows']:,})")
+    limit = budget.get("max_intermediate_rows")
+    if limit is not None and cost.max_intermediate_rows > limit:
+        shape = " via a cross product" if cost.cross_products else ""
+        reasons.append(f"produces ~{cost.max_intermediate_rows:,} intermediate rows{shape} (budget {limit:,})")
+    if reasons:
+        raise QueryTooExpensiveError("; ".join(reasons), cost)
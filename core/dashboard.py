@@ -0,0 +1,161 @@
+import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import polars as pl
+
+from .context import UserContext
+
+# Cột mà Dashboard dùng (cùng tên với Master_PPC_Data.parquet)
+DATE_COL = "Report_Date"
+REVENUE_COL = "Revenue (Actual)"
+SPEND_COL = "Ads Spend (Actual)"
+SKU_COL = "SKU"
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _lit(value: Any) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class DashboardFilters:
+    """Bộ lọc của Dashboard -> WHERE clause đẩy xuống DuckDB (zonemap / rollup lo phần còn lại)."""
+
+    def __init__(self, start: Optional[datetime.date] = None, end: Optional[datetime.date] = None,
+                 niches: Optional[List[str]] = None):
+        self.start = start
+        self.end = end
+        self.niches = list(niches) if niches else None
+
+    def where(self, brand_col: str) -> str:
+        conds = []
+        if self.start is not None:
+            conds.append(f"{_q(DATE_COL)} >= {_lit(self.start)}")
+        if self.end is not None:
+            conds.append(f"{_q(DATE_COL)} <= {_lit(self.end)}")
+        if self.niches:
+            conds.append(f"{_q(brand_col)} IN ({', '.join(_lit(n) for n in self.niches)})")
+        return f" WHERE {' AND '.join(conds)}" if conds else ""
+
+
+def summary_kpis(overview: Dict[str, Any], niches: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    KPI của Dashboard lấy từ KpiSummary.summary() (aggregate theo niche đã duy trì sẵn) thay vì query.
+    Chỉ đúng khi bộ lọc ngày phủ toàn bộ khoảng ngày của dataset.
+    """
+    picked = [n for n in overview["niches"] if not niches or n["niche"] in niches]
+    revenue = sum(n["revenue"] or 0.0 for n in picked)
+    spend = sum(n["spend"] or 0.0 for n in picked)
+    return {
+        "revenue": revenue,
+        "spend": spend,
+        "tacos": (spend / revenue * 100) if revenue else 0.0,
+        "rows": sum(n["rows"] for n in picked),
+    }
+
+
+class DashboardQueries:
+    """
+    Dashboard chạy trên DataEngine thay vì đọc cả file Parquet vào RAM của session Streamlit:
+    mọi KPI / trend là query aggregate (GROUP BY trong DuckDB, có rollup daily_niche thì đọc rollup),
+    bảng chi tiết lấy từng page bằng keyset pagination -> RAM mỗi session chỉ cỡ 1 page + vài dòng aggregate.
+    RLS áp dụng như mọi query khác (secure_sales theo UserContext).
+    """
+
+    def __init__(self, engine, context: UserContext):
+        self.engine = engine
+        self.context = context
+
+    def _run(self, sql: str) -> pl.DataFrame:
+        return self.engine.execute_query(sql, self.context)
+
+    def columns(self) -> List[str]:
+        return self._run("SELECT * FROM secure_sales LIMIT 0").columns
+
+    def date_bounds(self) -> Tuple[Optional[datetime.date], Optional[datetime.date]]:
+        row = self._run(f"SELECT MIN({_q(DATE_COL)}) AS lo, MAX({_q(DATE_COL)}) AS hi FROM secure_sales").row(0)
+        return row[0], row[1]
+
+    def kpis(self, filters: DashboardFilters) -> Dict[str, Any]:
+        """Tổng doanh thu / ads spend / TACOS / số dòng (1 dòng aggregate)."""
+        sql = (
+            f"SELECT SUM({_q(REVENUE_COL)}) AS revenue, SUM({_q(SPEND_COL)}) AS spend, COUNT(*) AS row_count "
+            f"FROM secure_sales{filters.where(self.engine.brand_col)}"
+        )
+        revenue, spend, rows = self._run(sql).row(0)
+        revenue, spend = revenue or 0.0, spend or 0.0
+        return {
+            "revenue": revenue,
+            "spend": spend,
+            "tacos": (spend / revenue * 100) if revenue else 0.0,
+            "rows": rows or 0,
+        }
+
+    def daily_trend(self, filters: DashboardFilters) -> pl.DataFrame:
+        """Doanh thu / ads spend theo ngày (số dòng = số ngày, không phụ thuộc kích thước dataset)."""
+        sql = (
+            f"SELECT {_q(DATE_COL)}, SUM({_q(REVENUE_COL)}) AS {_q(REVENUE_COL)}, "
+            f"SUM({_q(SPEND_COL)}) AS {_q(SPEND_COL)} "
+            f"FROM secure_sales{filters.where(self.engine.brand_col)} GROUP BY {_q(DATE_COL)} ORDER BY {_q(DATE_COL)}"
+        )
+        return self._run(sql)
+
+    def _detail_key(self, columns: List[str]) -> List[str]:
+        """Khóa ngắn của bảng chi tiết: ngày (mới nhất trước), niche, SKU (cột nào có trong data)."""
+        return [c for c in (DATE_COL, self.engine.brand_col, SKU_COL) if c in columns]
+
+    def detail_page(self, filters: DashboardFilters, page_size: int,
+                    after: Optional[Dict[str, Any]] = None) -> Tuple[pl.DataFrame, Optional[Dict[str, Any]]]:
+        """
+        Keyset pagination: page kế tiếp sau cursor `after` (None = page đầu), mới nhất trước.
+        WHERE (ngày, niche, SKU) "sau" khóa cuối của page trước + LIMIT -> DuckDB chạy top-N
+        (heap cỡ 1 page) thay vì sort toàn bộ dữ liệu đã lọc rồi bỏ qua OFFSET sâu ở mỗi lần lật trang.
+        Các cột còn lại chỉ dùng để phân xử dòng trùng khóa (thứ tự ổn định); dòng trùng khóa nằm vắt qua
+        2 page được bỏ qua bằng `skip` (số dòng trùng khóa cuối đã trả).
+        Returns: (page, cursor của page kế tiếp hoặc None nếu đã hết).
+        """
+        if page_size <= 0:
+            raise ValueError("page_size must be > 0")
+        columns = self.columns()
+        key = self._detail_key(columns)
+        order = [f"{_q(c)} {'DESC' if c == DATE_COL else 'ASC'} NULLS LAST" for c in key]
+        order += [f"{_q(c)} ASC NULLS LAST" for c in columns if c not in key]
+        where = filters.where(self.engine.brand_col)
+        skip = 0
+        if after is not None:
+            cond = _keyset_after(key, after["key"])
+            where = f"{where} AND {cond}" if where else f" WHERE {cond}"
+            skip = int(after["skip"])
+        sql = (
+            f"SELECT * FROM secure_sales{where} "
+            f"ORDER BY {', '.join(order)} LIMIT {int(page_size)} OFFSET {skip}"
+        )
+        df = self._run(sql)
+        if df.height < page_size:
+            return df, None
+        last = list(df.select(key).row(-1)) if key else []
+        ties = sum(1 for row in df.select(key).iter_rows() if list(row) == last) if key else df.height
+        if after is not None and list(after["key"]) == last:
+            ties += skip
+        return df, {"key": last, "skip": ties}
+
+
+def _keyset_after(key: List[str], values: List[Any]) -> str:
+    """
+    Điều kiện "dòng đứng sau hoặc trùng khóa `values`" theo thứ tự ngày DESC, các cột khác ASC, NULLS LAST.
+    Dòng trùng khóa được lấy lại rồi bỏ qua bằng OFFSET `skip`.
+    """
+    if not key:
+        return "TRUE"
+    col, value = _q(key[0]), values[0]
+    if value is None:
+        # NULL đứng cuối: chỉ còn các dòng cũng NULL ở cột này
+        strict, equal = "FALSE", f"{col} IS NULL"
+    else:
+        op = "<" if key[0] == DATE_COL else ">"
+        strict, equal = f"({col} {op} {_lit(value)} OR {col} IS NULL)", f"{col} = {_lit(value)}"
+    if len(key) == 1:
+        return f"({strict} OR {equal})"
+    return f"({strict} OR ({equal} AND {_keyset_after(key[1:], values[1:])}))"
@@ -0,0 +1,145 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class QueryTimeoutError(TimeoutError):
+    """Query chạy quá deadline và đã bị interrupt. Có payload có cấu trúc để trả về AI / API."""
+
+    def __init__(self, timeout: float, sql: str = None):
+        self.timeout = timeout
+        self.sql = sql
+        super().__init__(f"Query exceeded the {timeout:.1f}s time limit and was cancelled.")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "error": "query_timeout",
+            "timeout_s": self.timeout,
+            "message": str(self),
+            "hint": "Make this query cheaper: add filters on Report_Date / niche, aggregate before joining, "
+                    "avoid cross joins and unbounded window frames, and add a LIMIT.",
+        }
+
+
+class QueryCancelledError(RuntimeError):
+    """Query bị hủy chủ động (VD: client API đã ngắt kết nối)."""
+
+    def __init__(self, message: str = "Query was cancelled by the client."):
+        super().__init__(message)
+
+
+class CancelToken:
+    """
+    Token để hủy query từ bên ngoài (thread khác). Query đang chạy sẽ bị interrupt ngay,
+    query chưa chạy sẽ không được bắt đầu.
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._handles = set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            handles = list(self._handles)
+        for handle in handles:
+            handle.interrupt(cancelled=True)
+
+    def _attach(self, handle):
+        with self._lock:
+            self._handles.add(handle)
+        if self.cancelled:
+            handle.interrupt(cancelled=True)
+
+    def _detach(self, handle):
+        with self._lock:
+            self._handles.discard(handle)
+
+
+class QueryHandle:
+    """Một query đang chạy trên 1 cursor. Interrupt chỉ có hiệu lực khi query còn active."""
+
+    def __init__(self, con, timeout: Optional[float], token: Optional[CancelToken]):
+        self.con = con
+        self.timeout = timeout
+        self.token = token
+        self.timed_out = False
+        self.cancelled = False
+        self._active = True
+        self._lock = threading.Lock()
+
+    def interrupt(self, cancelled: bool = False):
+        # Lock: không interrupt nhầm query của request khác sau khi cursor đã trả về pool
+        with self._lock:
+            if not self._active:
+                return
+            if cancelled:
+                self.cancelled = True
+            else:
+                self.timed_out = True
+            self.con.interrupt()
+
+    def finish(self):
+        with self._lock:
+            self._active = False
+        if self.token is not None:
+            self.token._detach(self)
+
+    def translate(self, error: Exception, sql: str = None) -> Exception:
+        """Đổi lỗi INTERRUPT của DuckDB thành lỗi có cấu trúc."""
+        if self.timed_out:
+            return QueryTimeoutError(self.timeout, sql)
+        if self.cancelled:
+            return QueryCancelledError()
+        return error
+
+
+class QueryWatchdog:
+    """
+    1 thread nền duy nhất theo dõi deadline của mọi query (heap theo thời điểm hết hạn)
+    và interrupt connection DuckDB khi quá hạn.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="query-watchdog", daemon=True)
+            self._thread.start()
+
+    def watch(self, con, timeout: Optional[float], token: Optional[CancelToken] = None) -> QueryHandle:
+        if token is not None and token.cancelled:
+            raise QueryCancelledError()
+        handle = QueryHandle(con, timeout, token)
+        if token is not None:
+            token._attach(handle)
+        if timeout:
+            with self._cond:
+                heapq.heappush(self._heap, (time.monotonic() + timeout, next(self._counter), handle))
+                self._ensure_thread()
+                self._cond.notify()
+        return handle
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                deadline, _, handle = self._heap[0]
+                now = time.monotonic()
+                if deadline > now:
+                    self._cond.wait(deadline - now)
+                    continue
+                heapq.heappop(self._heap)
+            handle.interrupt()
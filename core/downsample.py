@@ -0,0 +1,115 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import polars as pl
+
+# lttb   : Largest-Triangle-Three-Buckets — giữ điểm tạo tam giác lớn nhất với bucket kề, giữ được hình dạng đường
+# minmax : mỗi bucket giữ dòng min và max của từng cột y — không bỏ sót spike (hợp với số liệu có đỉnh đột biến)
+METHODS = ("lttb", "minmax")
+_ROW = "__row"
+
+
+def _as_float(series: pl.Series) -> np.ndarray:
+    if series.dtype.is_temporal():
+        series = series.to_physical()
+    return series.cast(pl.Float64).fill_null(np.nan).to_numpy()
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Index các điểm giữ lại theo LTTB (x đã sort tăng dần). Luôn giữ điểm đầu và cuối."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    y = np.nan_to_num(y)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Điểm "ảo" của bucket kế tiếp = trung bình bucket đó (bucket cuối -> điểm cuối)
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nlo:nhi].mean() if nhi > nlo else x[-1]
+        avg_y = y[nlo:nhi].mean() if nhi > nlo else y[-1]
+        area = np.abs((x[prev] - avg_x) * (y[lo:hi] - y[prev]) - (x[prev] - x[lo:hi]) * (avg_y - y[prev]))
+        prev = lo + int(area.argmax())
+        picked[i + 1] = prev
+    return picked
+
+
+def minmax_indices(y_columns: Sequence[np.ndarray], n: int, n_out: int) -> np.ndarray:
+    """Index các dòng min / max của mỗi cột y trong từng bucket (số bucket = n_out / (2 * số cột))."""
+    if n_out >= n:
+        return np.arange(n)
+    buckets = max(1, (n_out - 2) // (2 * max(len(y_columns), 1)))
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    keep = {0, n - 1}
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if hi <= lo:
+            continue
+        for y in y_columns:
+            chunk = y[lo:hi]
+            if np.isnan(chunk).all():
+                keep.add(int(lo))
+                continue
+            keep.add(int(lo + np.nanargmin(chunk)))
+            keep.add(int(lo + np.nanargmax(chunk)))
+    return np.array(sorted(keep), dtype=np.int64)
+
+
+def _pick_columns(df: pl.DataFrame, x: Optional[str], y: Optional[List[str]],
+                  group: Optional[str]) -> Tuple[str, List[str]]:
+    """Mặc định: x = cột ngày/giờ đầu tiên (không có thì cột số đầu tiên), y = các cột số còn lại."""
+    for col in [x, group, *(y or [])]:
+        if col is not None and col not in df.columns:
+            raise ValueError(f"Downsample column not found: {col}")
+    if x is None:
+        temporal = [c for c, t in df.schema.items() if t.is_temporal() and c != group]
+        numeric = [c for c, t in df.schema.items() if t.is_numeric() and c != group]
+        if not temporal and not numeric:
+            raise ValueError("Downsample needs a date/time or numeric x column")
+        x = (temporal or numeric)[0]
+    if not y:
+        y = [c for c, t in df.schema.items() if t.is_numeric() and c not in (x, group)]
+    if not y:
+        raise ValueError("Downsample needs at least one numeric y column")
+    return x, y
+
+
+def downsample(df: pl.DataFrame, max_points: int, method: str = "lttb", x: Optional[str] = None,
+               y: Optional[List[str]] = None, group: Optional[str] = None) -> Tuple[pl.DataFrame, Dict[str, Any]]:
+    """
+    Giảm số điểm của kết quả time-series trước khi vẽ chart (giữ hình dạng đường, số dòng bị chặn trên).
+    - Giữ nguyên mọi cột của các dòng được chọn, sort theo x (và group).
+    - `group` (VD: SKU / niche): mỗi series được downsample riêng, chia đều `max_points`
+      (tối thiểu 3 điểm / series -> quá nhiều series thì tổng có thể vượt max_points).
+    - LTTB nhiều cột y: mỗi cột chọn điểm riêng rồi hợp lại (tổng vẫn <= max_points).
+    Returns: (DataFrame, info {"method", "x", "y", "original_rows", "rows"}).
+    Raises: ValueError (method / cột không hợp lệ).
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unsupported downsample method: {method} (use one of {', '.join(METHODS)})")
+    if max_points < 3:
+        raise ValueError("max_points must be >= 3")
+    x, y = _pick_columns(df, x, y, group)
+    info = {"method": method, "x": x, "y": y, "original_rows": df.height, "rows": df.height}
+    if df.height <= max_points:
+        return df, info
+
+    ordered = df.sort([group, x] if group else [x], nulls_last=True).with_row_index(_ROW)
+    parts = ordered.partition_by(group, maintain_order=True) if group else [ordered]
+    budget = max(3, max_points // len(parts))
+    keep = []
+    for part in parts:
+        rows = part[_ROW].to_numpy()
+        ys = [_as_float(part[c]) for c in y]
+        if method == "lttb":
+            xs = _as_float(part[x])
+            per_col = max(3, budget // len(ys))
+            idx = np.unique(np.concatenate([lttb_indices(xs, yv, per_col) for yv in ys]))
+        else:
+            idx = minmax_indices(ys, part.height, budget)
+        keep.append(rows[idx])
+    out = ordered[np.concatenate(keep)].drop(_ROW)
+    info["rows"] = out.height
+    return out, info
@@ -1,129 +1,934 @@
+import hashlib
+import os
+import threading
+import time
+from contextlib import ExitStack, nullcontext
+from typing import Callable, List, Optional, Union
+
 import duckdb
 import sqlglot
+from sqlglot import exp
 import polars as pl
 
 from .context import UserContext
+from .pool import CursorPool
+from .cache import ResultCache, SchemaCache, file_fingerprint, fingerprint_version, permission_hash
+from .partitioning import is_partitioned, partition_glob, scan_partitions
+from .ingest import DeltaTable, is_incremental
+from .streaming import QueryStream
+from .deadline import CancelToken, QueryWatchdog
+from .admission import AdmissionController
+from .cost import DEFAULT_ROLE_BUDGETS, check_budget, estimate_cost
+from .profiling import explain_analyze, summarize_profile
+from .parsed_query import ParsedQuery, parse_query
+from .sampling import SAMPLE_SCHEMA, build_sample, rewrite_approximate
+from .catalog import CATALOG_SCHEMA, RESERVED_NAMES, DatasetSource, referenced_tables
+from .rollups import ROLLUP_SCHEMA, RollupSpec, build_rollups, eligible_rollups, rewrite_for_rollup, source_table
+
+# Các node AST bị cấm. Database giờ DÙNG CHUNG giữa các request nên ngoài lệnh ghi dữ liệu
+# còn phải chặn DDL / lệnh session (CREATE OR REPLACE VIEW raw_sales, SET, ATTACH...)
+# vì chúng sẽ ảnh hưởng tới mọi user khác.
+_FORBIDDEN_NODES = tuple(
+    getattr(sqlglot.exp, name)
+    for name in (
+        "Drop", "Delete", "Insert", "Update", "Merge", "Create", "Alter", "TruncateTable",
+        "Copy", "Set", "Pragma", "Attach", "Detach", "Use", "Install", "Command",
+    )
+    if hasattr(sqlglot.exp, name)
+)
+
+# Deadline mặc định theo role (giây). Role dạng "sales_ab" dùng prefix "sales".
+DEFAULT_ROLE_TIMEOUTS = {"admin": 120.0, "manager": 60.0, "sales": 30.0, "viewer": 15.0}
+
+# Schema nội bộ chứa bảng quyền của từng permission set. User SQL không được đọc schema này.
+_RLS_SCHEMA = "rls"
+# Schema nội bộ không cho user SQL đọc trực tiếp (bảng quyền, rollup chứa data mọi niche)
+_INTERNAL_SCHEMAS = {_RLS_SCHEMA, ROLLUP_SCHEMA, SAMPLE_SCHEMA, CATALOG_SCHEMA}
+# Database gắn READ_ONLY chứa bảng gốc đã persist (DATA_PERSIST_DIR)
+_PERSIST_CATALOG = "dataset"
+# Tên bảng user SQL được đọc (cùng với tên dataset phụ và CTE của chính query). TEMP VIEW chỉ che tên
+# không qualify: main.raw_sales / memory.main.raw_sales / dataset.main.raw_sales, raw_base, 'file.parquet'...
+# đọc thẳng bảng gốc (bỏ qua RLS) -> mọi tên khác / tên qualify đều bị chặn.
+_USER_TABLES = {"secure_sales", "raw_sales"}
+# Table function được phép: query() / query_table() / read_*() / duckdb_*() đọc được bảng nội bộ hoặc file
+_TABLE_FUNCTIONS = {"range", "generate_series", "unnest"}
+
+
+def _quote_literal(value: str) -> str:
+    """String literal SQL an toàn. ESCAPE SINGLE QUOTES: Quan trọng để chống SQL Injection."""
+    return "'" + value.replace("'", "''") + "'"
+
+class DatasetSnapshot:
+    """
+    Một version bất biến của dataset: fingerprint file nguồn + database DuckDB + pool cursor riêng.
+    Hot-reload = dựng snapshot mới rồi swap con trỏ; query đang chạy vẫn giữ cursor của snapshot cũ
+    tới khi xong (pool cũ chỉ đóng database khi cursor cuối cùng được trả về).
+    """
+
+    def __init__(self, fingerprint, version: str):
+        self.fingerprint = fingerprint
+        self.version = version
+        self.columns: List[str] = []
+        self.brands: Optional[list] = None
+        # Tên bảng gốc đầy đủ ("<catalog>".main.raw_sales): cursor của user bị giới hạn quyền có
+        # TEMP VIEW raw_sales che bảng gốc, nên code nội bộ luôn tham chiếu bảng gốc qua tên đầy đủ.
+        self.base_table = "raw_sales"
+        # Dataset partitioned (mode VIEW): brand -> danh sách file Parquet của partition
+        self.partitions: Optional[dict] = None
+        # Dataset incremental: manifest (base + deltas) đọc 1 lần lúc dựng snapshot
+        self.manifest: Optional[dict] = None
+        # File .duckdb resident của snapshot (persist_dir), None nếu không persist
+        self.persist_path: Optional[str] = None
+        # Rollup đã materialize lúc ingest (nhỏ nhất trước)
+        self.rollups: list = []
+        # Sample phân tầng theo niche cho approximate mode (None = không có)
+        self.sample = None
+        # permission hash -> SQL nguồn của secure_sales (bảng quyền đã materialize)
+        self.rls_sources: dict = {}
+        # id(cursor) -> permission hash mà TEMP VIEW của cursor đó đang phản ánh
+        self.cursor_rls: dict = {}
+        # Dataset phụ của catalog: tên -> cột / version của view gốc đã tạo trong schema catalog
+        self.catalog_columns: dict = {}
+        self.catalog_versions: dict = {}
+        # id(cursor) -> {tên dataset: permission hash} của các TEMP VIEW dataset phụ trên cursor đó
+        self.cursor_datasets: dict = {}
+        self.lock = threading.Lock()
+        self.pool: Optional[CursorPool] = None
+        self.loaded_at = None
 
 
 class DataEngine:
-    def __init__(self, db_path: str, brand_col: str = "Brand"):
+    def __init__(self, db_path: str, brand_col: str = "Brand", pool_size: int = 4,
+                 result_cache_bytes: int = 256 * 1024 * 1024,
+                 resident: bool = False, persist_dir: Optional[str] = None, memory_limit: str = "2GB",
+                 default_timeout: Optional[float] = 30.0, role_timeouts: Optional[dict] = None,
+                 rollups: Optional[List[RollupSpec]] = None, sample_fraction: Optional[float] = None,
+                 cost_budgets: Optional[dict] = None, datasets: Optional[List[DatasetSource]] = None,
+                 admission: Optional[AdmissionController] = None, threads: Optional[int] = None,
+                 update_check_interval: float = 0.0):
+        """
+        resident=False: raw_sales là VIEW trên read_parquet (đọc file mỗi query).
+        resident=True : load file 1 lần vào TABLE native của DuckDB (in-memory, hoặc file
+                        `persist_dir/raw_sales_<version>.duckdb` để restart không phải load lại).
+                        File nguồn đổi mtime -> load version mới ở background rồi swap nguyên tử.
+        default_timeout / role_timeouts: deadline (giây) của mỗi query, query quá hạn bị interrupt.
+        rollups: bảng tổng hợp materialize mỗi lần load dataset; query aggregate trên secure_sales
+                 được tự động chuyển sang rollup phù hợp (vẫn áp RLS).
+        sample_fraction: tỉ lệ sample phân tầng theo niche cho approximate mode (None -> tắt).
+        cost_budgets: budget chi phí (EXPLAIN) theo role, xem core/cost.py ({} -> tắt guardrail).
+        datasets: dataset phụ của catalog (core/catalog.py), mỗi dataset là 1 secure view cùng tên,
+                  chỉ được đăng ký trên cursor khi query tham chiếu tới.
+        admission: giới hạn số query chạy đồng thời + hàng đợi ưu tiên theo role (core/admission.py).
+        threads: số thread DuckDB của database dùng chung (None -> mặc định của DuckDB = số core).
+        update_check_interval: số giây tối thiểu giữa 2 lần request kiểm tra file nguồn đổi chưa
+                 (dataset partitioned phải stat mọi file Parquet; 0 -> kiểm tra mỗi request).
+                 Watcher / check_for_update() luôn kiểm tra.
+        """
         self.db_path = db_path
         self.brand_col = brand_col
-        # TODO: Cấu hình connection pool nếu cần, nhưng với DuckDB in-memory thì init per request là an toàn nhất.
+        self.pool_size = pool_size
+        self.resident = resident
+        self.persist_dir = persist_dir
+        self.memory_limit = memory_limit
+        self.threads = threads
+        self.rollup_specs = list(rollups or [])
+        self.sample_fraction = sample_fraction
+        self.datasets = {}
+        for ds in datasets or []:
+            if ds.name.lower() in RESERVED_NAMES:
+                raise ValueError(f"Dataset name '{ds.name}' is reserved")
+            self.datasets[ds.name.lower()] = ds
+        # Snapshot hiện tại (database dùng chung + pool cursor). Dựng lazy ở request đầu tiên.
+        self._snapshot: Optional[DatasetSnapshot] = None
+        self._reload_lock = threading.Lock()
+        self._reload_thread: Optional[threading.Thread] = None
+        self._failed_fingerprint = None
+        self.update_check_interval = update_check_interval
+        self._last_update_check = 0.0
+        self._reload_listeners: List[Callable[[str], None]] = []
+        self._notify_state = threading.local()
+        self._watcher: Optional[threading.Thread] = None
+        self._watcher_stop = threading.Event()
+        # Cache schema theo (fingerprint file data, hash quyền) -> /query & /agent/schema không phải DESCRIBE lại
+        self.schema_cache = SchemaCache()
+        # Cache kết quả (Arrow nén, LRU theo byte). result_cache_bytes=0 -> tắt.
+        self.result_cache = ResultCache(max_bytes=result_cache_bytes)
+        # Deadline: watchdog interrupt connection DuckDB khi query chạy quá hạn (cross join, window vô hạn...)
+        self.default_timeout = default_timeout
+        self.role_timeouts = DEFAULT_ROLE_TIMEOUTS if role_timeouts is None else role_timeouts
+        self.watchdog = QueryWatchdog()
+        # Guardrail chi phí: EXPLAIN trước khi chạy, query vượt budget của role bị từ chối
+        self.cost_budgets = DEFAULT_ROLE_BUDGETS if cost_budgets is None else cost_budgets
+        # Admission control: query dư chờ trong hàng đợi thay vì cùng tranh CPU / RAM của database
+        self.admission = admission
+
+    # --- SNAPSHOT / HOT-RELOAD ---
+
+    def _persist_path(self, version: str) -> str:
+        return os.path.join(self.persist_dir, f"raw_sales_{version}.duckdb")
+
+    def _delta_table(self) -> Optional[DeltaTable]:
+        return DeltaTable(self.db_path, self.brand_col) if is_incremental(self.db_path) else None
+
+    def _layered_deltas(self, snap: DatasetSnapshot) -> bool:
+        """Resident + incremental đã có base: delta không load vào table mà đọc chồng lên base."""
+        return self.resident and snap.manifest is not None and bool(snap.manifest["base"])
 
-    def _init_connection(self):
+    def _source_sql(self, snap: Optional[DatasetSnapshot] = None) -> str:
+        if snap is not None and snap.manifest is not None:
+            # Resident: chỉ load base vào table, delta đọc thẳng từ Parquet (xem _init_connection)
+            return self._delta_table().source_sql(snap.manifest, deltas=not self._layered_deltas(snap))
+        safe_path = self.db_path.replace("'", "''")
+        if is_partitioned(self.db_path):
+            # Cột brand nằm sẵn trong file -> không cần đọc lại từ path Hive
+            return f"SELECT * FROM read_parquet('{partition_glob(safe_path)}', hive_partitioning=false)"
+        return f"SELECT * FROM read_parquet('{safe_path}')"
+
+    def _init_connection(self, snap: DatasetSnapshot):
         """
-        Khởi tạo connection in-memory.
-        TODO: Set memory_limit='2GB' để tránh user query xàm làm sập app.
+        Khởi tạo database DÙNG CHUNG cho 1 snapshot (chạy 1 lần khi pool của snapshot mở).
+        - memory_limit='2GB' để tránh user query xàm làm sập app.
+        - raw_sales (VIEW hoặc TABLE resident) được tạo 1 lần ở đây,
+          các cursor chỉ tạo thêm TEMP VIEW secure_sales riêng.
+        - Resident: sort theo brand_col khi load -> zonemap (min/max) của từng row group
+          giúp filter RLS `brand IN (...)` bỏ qua các row group không liên quan.
+        - Dataset incremental + resident: chỉ base được load (file .duckdb persist theo base, dùng lại
+          qua các lần ingest); delta đọc từ Parquet và UNION ALL BY NAME vào raw_sales
+          -> reload sau ingest không phải load lại toàn bộ lịch sử.
         """
+        source = self._source_sql(snap)
+        delta_sql = self._delta_table().delta_sql(snap.manifest) if self._layered_deltas(snap) else None
+
+        def _create_table(target_con, name="raw_sales"):
+            cols = [row[0] for row in target_con.execute(f"DESCRIBE {source}").fetchall()]
+            order_by = f' ORDER BY "{self.brand_col}"' if self.brand_col in cols else ""
+            target_con.execute(f"CREATE TABLE {name} AS {source}{order_by}")
+
+        persisted = self.resident and self.persist_dir
+        if persisted:
+            path = snap.persist_path
+            if not os.path.exists(path):
+                # Ghi ra file tạm rồi rename -> không bao giờ mở phải file load dở
+                os.makedirs(self.persist_dir, exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                builder = duckdb.connect(tmp_path)
+                try:
+                    builder.execute(f"SET memory_limit='{self.memory_limit}';")
+                    _create_table(builder)
+                finally:
+                    builder.close()
+                os.replace(tmp_path, path)
+
         con = duckdb.connect(":memory:")
-        con.execute("SET memory_limit='2GB';")
+        try:
+            con.execute(f"SET memory_limit='{self.memory_limit}';")
+            if self.threads:
+                con.execute(f"SET threads={int(self.threads)}")
+            if persisted:
+                # File .duckdb gắn READ_ONLY; database gốc vẫn là in-memory để chứa bảng quyền
+                con.execute(f"ATTACH {_quote_literal(path)} AS {_PERSIST_CATALOG} (READ_ONLY)")
+                resident_table = f"{_PERSIST_CATALOG}.main.raw_sales"
+            elif self.resident:
+                resident_table = "raw_base" if snap.manifest is not None else "raw_sales"
+                _create_table(con, resident_table)
+            else:
+                resident_table = None
+                con.execute(f"CREATE VIEW raw_sales AS {source}")
+            if resident_table is not None and resident_table != "raw_sales":
+                union = f" UNION ALL BY NAME {delta_sql}" if delta_sql else ""
+                con.execute(f"CREATE VIEW raw_sales AS SELECT * FROM {resident_table}{union}")
+            # Schema chứa bảng quyền (semi-join RLS), dùng chung cho mọi cursor của snapshot
+            con.execute(f"CREATE SCHEMA {_RLS_SCHEMA}")
+            if self.datasets:
+                con.execute(f"CREATE SCHEMA {CATALOG_SCHEMA}")
+            catalog = con.execute("SELECT current_database()").fetchone()[0]
+            snap.base_table = f'"{catalog}".main.raw_sales'
+            # Lấy danh sách cột để verify, tránh crash nếu sai tên cột config
+            snap.columns = [row[0] for row in con.execute("DESCRIBE raw_sales").fetchall()]
+            if is_partitioned(self.db_path) and not self.resident:
+                snap.partitions = scan_partitions(self.db_path)
+            if self.rollup_specs:
+                snap.rollups = build_rollups(con, snap.base_table, self.rollup_specs)
+            if self.sample_fraction and self.brand_col in snap.columns:
+                snap.sample = build_sample(con, snap.base_table, self.brand_col, self.sample_fraction)
+            self._lock_down(con)
+        except Exception:
+            con.close()
+            raise
         return con
 
-    def _setup_shadow_view(self, con, context: UserContext):
+    def _lock_down(self, con):
         """
-        CORE SECURITY LOGIC: Shadow View Injection.
+        Dựng snapshot xong -> khóa database dùng chung: chỉ đọc được file trong thư mục data (view Parquet,
+        delta, dataset phụ), không đổi được cấu hình (threads / memory_limit / external access...).
+        Chặn thêm 1 lớp ngoài validate_sql: SQL lọt qua cũng không đọc được file khác trên máy chủ.
         """
-        # 1. Load Raw
-        con.execute(
-            f"CREATE VIEW raw_sales AS SELECT * FROM read_parquet('{self.db_path}')"
-        )
-        
-        # 2. Check if brand column exists in schema
-        # Lấy danh sách cột để verify, tránh crash nếu sai tên cột config
-        cols = [row[0] for row in con.execute("DESCRIBE raw_sales").fetchall()]
-        
-        # 3. Apply Guardrails
-        if "ALL" in context.allowed_brands:
-            sql = "CREATE VIEW secure_sales AS SELECT * FROM raw_sales"
+        dirs = set()
+        for path in [self.db_path] + [ds.path for ds in self.datasets.values()]:
+            path = os.path.abspath(path)
+            dirs.add(path if os.path.isdir(path) else os.path.dirname(path))
+        allowed = ", ".join(_quote_literal(os.path.join(d, "")) for d in sorted(dirs))
+        con.execute(f"SET allowed_directories=[{allowed}]")
+        con.execute("SET enable_external_access=false")
+        con.execute("SET lock_configuration=true")
+
+    def _build_snapshot(self, fingerprint) -> DatasetSnapshot:
+        snap = DatasetSnapshot(fingerprint, fingerprint_version(fingerprint))
+        delta = self._delta_table()
+        if delta is not None:
+            snap.manifest = delta.read_manifest()
+        on_close = None
+        if self.resident and self.persist_dir:
+            # Incremental: file resident chỉ chứa base -> key theo danh sách file base, ingest delta không đổi key
+            key = snap.version if delta is None else fingerprint_version((delta.root, tuple(snap.manifest["base"])))
+            path = snap.persist_path = self._persist_path(key)
+            on_close = lambda: self._discard_persisted(path)
+        snap.pool = CursorPool(lambda: self._init_connection(snap), size=self.pool_size, on_close=on_close)
+        # Mở database ngay (load data) để lỗi nổ ra ở đây, không phải ở request của user
+        snap.pool.open()
+        snap.loaded_at = time.time()
+        return snap
+
+    def _discard_persisted(self, path: str):
+        # File .duckdb của version cũ: chỉ xóa khi không còn là version đang phục vụ
+        current = self._snapshot
+        if current is not None and path == current.persist_path:
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _swap(self, snap: DatasetSnapshot):
+        """Swap nguyên tử sang snapshot mới, đóng (trễ) snapshot cũ."""
+        old = self._snapshot
+        self._snapshot = snap
+        if old is not None:
+            old.pool.close()
+
+    def _notify_reload(self, snap: DatasetSnapshot):
+        """
+        Báo cho listener SAU khi nhả _reload_lock: listener đọc lại engine (VD: get_all_brands ->
+        check_for_update -> reload khi file vừa đổi tiếp) sẽ không tự deadlock trên lock không reentrant.
+        Reload lồng nhau trên cùng thread không gọi listener đệ quy: snapshot mới được xếp hàng và
+        vòng ngoài báo tiếp sau khi lượt hiện tại xong (chỉ giữ snapshot mới nhất).
+        """
+        state = self._notify_state
+        if getattr(state, "active", False):
+            state.pending = snap
+            return
+        state.active = True
+        try:
+            while snap is not None:
+                state.pending = None
+                for listener in list(self._reload_listeners):
+                    try:
+                        listener(snap.version)
+                    except Exception as e:
+                        print(f"⚠️ Reload listener failed: {e}")
+                snap = state.pending
+        finally:
+            state.active = False
+            state.pending = None
+
+    def reload(self, fingerprint=None) -> str:
+        """
+        Load version mới của file nguồn (đồng bộ) và swap vào. Returns: version đang phục vụ.
+        """
+        with self._reload_lock:
+            if fingerprint is None:
+                self._last_update_check = time.monotonic()
+                fingerprint = file_fingerprint(self.db_path)
+            current = self._snapshot
+            if current is not None and current.fingerprint == fingerprint:
+                return current.version
+            try:
+                snap = self._build_snapshot(fingerprint)
+            except Exception:
+                # Nhớ fingerprint lỗi (VD: file đang ghi dở) để không retry liên tục
+                self._failed_fingerprint = fingerprint
+                raise
+            self._failed_fingerprint = None
+            self._swap(snap)
+        self._notify_reload(snap)
+        return snap.version
+
+    def _reload_in_background(self, fingerprint):
+        if self._reload_thread is not None and self._reload_thread.is_alive():
+            return
+
+        def _run():
+            try:
+                self.reload(fingerprint)
+            except Exception as e:
+                print(f"⚠️ Background reload failed (keep serving old version): {e}")
+
+        self._reload_thread = threading.Thread(target=_run, name="dataset-reload", daemon=True)
+        self._reload_thread.start()
+
+    def check_for_update(self):
+        """
+        So fingerprint file nguồn với snapshot đang phục vụ.
+        - Mode VIEW: swap đồng bộ (rẻ, chỉ tạo lại view).
+        - Mode resident: load version mới ở background, request hiện tại vẫn dùng version cũ.
+        """
+        snap = self._snapshot
+        if snap is None:
+            return
+        self._last_update_check = time.monotonic()
+        try:
+            fingerprint = file_fingerprint(self.db_path)
+        except OSError:
+            # File tạm thời không tồn tại (đang bị ghi đè) -> giữ version cũ
+            return
+        if fingerprint == snap.fingerprint or fingerprint == self._failed_fingerprint:
+            return
+        if self.resident:
+            self._reload_in_background(fingerprint)
         else:
-            if self.brand_col not in cols:
+            self.reload(fingerprint)
+
+    def _current_snapshot(self) -> DatasetSnapshot:
+        if self._snapshot is None:
+            self.reload()
+        elif time.monotonic() - self._last_update_check >= self.update_check_interval:
+            self.check_for_update()
+        return self._snapshot
+
+    def on_reload(self, listener: Callable[[str], None]):
+        """Đăng ký callback(version) chạy sau mỗi lần swap sang version mới (VD: refresh ALL_NICHES)."""
+        self._reload_listeners.append(listener)
+
+    def start_watcher(self, interval: float = 30.0):
+        """Thread nền poll mtime file nguồn để hot-reload kể cả khi không có request."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+
+        def _watch():
+            while not self._watcher_stop.wait(interval):
+                try:
+                    if self._snapshot is None:
+                        # Lúc start file chưa có -> thử load lại
+                        self.reload()
+                    else:
+                        self.check_for_update()
+                except Exception as e:
+                    print(f"⚠️ Dataset watcher error: {e}")
+
+        self._watcher_stop.clear()
+        self._watcher = threading.Thread(target=_watch, name="dataset-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._watcher_stop.set()
+
+    @property
+    def pool(self) -> CursorPool:
+        """Pool cursor của snapshot đang phục vụ."""
+        return self._current_snapshot().pool
+
+    def _secure_source(self, con, context: UserContext, snap: DatasetSnapshot, perm: str) -> str:
+        """
+        SQL nguồn của secure_sales cho 1 permission set, build 1 lần rồi cache trong snapshot.
+        Danh sách quyền được materialize thành bảng nhỏ `rls.perm_<hash>` (truyền vào bằng parameter,
+        không nối string) -> view chỉ là semi-join cố định, kích thước SQL / thời gian plan không
+        tăng theo số niche được phép.
+        Dataset partitioned: vẫn liệt kê file của các partition được phép để DuckDB không mở partition khác.
+        """
+        with snap.lock:
+            source = snap.rls_sources.get(perm)
+            if source is not None:
+                return source
+
+            base = snap.base_table
+            blocked = f"SELECT * FROM {base} WHERE 1=0"
+            if self.brand_col not in snap.columns or not context.allowed_brands:
                 # CRITICAL FAIL-SAFE: Nếu file data không có cột để lọc quyền -> Block luôn cho an toàn
                 # Hoặc chỉ cho phép nếu User là Admin? Hiện tại: Block All nếu không khớp schema.
-                sql = "CREATE VIEW secure_sales AS SELECT * FROM raw_sales WHERE 1=0"
+                source = blocked
+            elif snap.partitions is not None:
+                # Partition pruning: chỉ liệt kê file của các brand được phép
+                files = [f for brand in dict.fromkeys(context.allowed_brands) for f in snap.partitions.get(brand, [])]
+                if not files:
+                    source = blocked
+                else:
+                    files_str = ", ".join([_quote_literal(f) for f in files])
+                    source = f"SELECT * FROM read_parquet([{files_str}], hive_partitioning=false)"
             else:
-                # ESCAPE SINGLE QUOTES: Quan trọng để chống SQL Injection
-                safe_brands = [b.replace("'", "''") for b in context.allowed_brands]
-                brands_str = ", ".join([f"'{b}'" for b in safe_brands])
-                
-                if not safe_brands:
-                    sql = "CREATE VIEW secure_sales AS SELECT * FROM raw_sales WHERE 1=0"
+                table = self._permission_table(con, context, perm)
+                source = f'SELECT * FROM {base} WHERE "{self.brand_col}" IN (SELECT brand FROM {table})'
+
+            snap.rls_sources[perm] = source
+            return source
+
+    def _permission_table(self, con, context: UserContext, perm: str) -> str:
+        """Bảng `rls.perm_<hash>` chứa danh sách brand được phép (gọi khi đang giữ snap.lock)."""
+        table = f"{_RLS_SCHEMA}.perm_{perm}"
+        # Parameter binding -> tên brand có dấu nháy cũng không thể inject SQL
+        con.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} AS SELECT DISTINCT unnest(?::VARCHAR[]) AS brand",
+            [list(context.allowed_brands)],
+        )
+        return table
+
+    def _filtered_source(self, con, context: UserContext, snap: DatasetSnapshot, perm: str, table: str,
+                         brand_col: Optional[str] = None) -> str:
+        """
+        SQL nguồn của 1 bảng nội bộ (rollup / sample / dataset phụ) đã lọc RLS bằng cùng bảng quyền
+        với secure_sales, cache theo (perm, table).
+        """
+        brand_col = brand_col or self.brand_col
+        if "ALL" in context.allowed_brands:
+            return f"SELECT * FROM {table}"
+        with snap.lock:
+            key = (perm, table)
+            source = snap.rls_sources.get(key)
+            if source is None:
+                if not context.allowed_brands:
+                    source = f"SELECT * FROM {table} WHERE 1=0"
                 else:
-                    # Dùng f-string với tên cột động
-                    sql = f'CREATE VIEW secure_sales AS SELECT * FROM raw_sales WHERE "{self.brand_col}" IN ({brands_str})'
+                    perm_table = self._permission_table(con, context, perm)
+                    source = f'SELECT * FROM {table} WHERE "{brand_col}" IN (SELECT brand FROM {perm_table})'
+                snap.rls_sources[key] = source
+            return source
+
+    def _plan_rollup(self, query: ParsedQuery, context: UserContext, snap: DatasetSnapshot):
+        """Rollup nhỏ nhất trả lời được query. Returns: (rollup, AST đã rewrite, đổi tên output?) hoặc None."""
+        if not snap.rollups or not query.ok:
+            return None
+        candidates = eligible_rollups(snap.rollups, "ALL" not in context.allowed_brands, self.brand_col)
+        for rollup in candidates:
+            result = rewrite_for_rollup(query.ast, rollup)
+            if result is not None:
+                return (rollup,) + result
+        return None
+
+    def _setup_shadow_view(self, con, context: UserContext, snap: DatasetSnapshot):
+        """
+        CORE SECURITY LOGIC: Shadow View Injection.
+        secure_sales là TEMP VIEW -> chỉ tồn tại trong cursor đang mượn, không lộ sang request khác.
+        User bị giới hạn quyền còn có TEMP VIEW raw_sales che bảng gốc -> query thẳng raw_sales
+        cũng chỉ thấy phần data được phép. TEMP VIEW chỉ che tên không qualify: tên qualify
+        (main.raw_sales, memory.main.raw_sales, dataset.main.raw_sales) bị validate_sql chặn.
+        View được giữ lại trên cursor: cursor được mượn lại bởi cùng permission set thì không tạo lại.
+        """
+        perm = permission_hash(context)
+        if snap.cursor_rls.get(id(con)) == perm:
+            return
+        snap.cursor_rls.pop(id(con), None)
+        # TEMP VIEW dataset phụ của permission set trước -> bỏ, tránh lộ sang user khác
+        for name in snap.cursor_datasets.pop(id(con), {}):
+            con.execute(f'DROP VIEW IF EXISTS temp.main."{name}"')
+
+        # Apply Guardrails
+        if "ALL" in context.allowed_brands:
+            con.execute("DROP VIEW IF EXISTS temp.main.raw_sales")
+            con.execute(f"CREATE OR REPLACE TEMP VIEW secure_sales AS SELECT * FROM {snap.base_table}")
+        else:
+            source = self._secure_source(con, context, snap, perm)
+            con.execute(f"CREATE OR REPLACE TEMP VIEW raw_sales AS {source}")
+            con.execute(f"CREATE OR REPLACE TEMP VIEW secure_sales AS {source}")
+
+        snap.cursor_rls[id(con)] = perm
+
+    def _dataset_root(self, con, snap: DatasetSnapshot, ds: DatasetSource, version: str) -> str:
+        """
+        View gốc `catalog."<name>"` của dataset phụ, tạo ở lần đầu được tham chiếu.
+        File / thư mục đổi (VD: thêm snapshot khác schema) -> tạo lại để cột của view khớp data mới.
+        """
+        root = f'{CATALOG_SCHEMA}."{ds.name}"'
+        with snap.lock:
+            if snap.catalog_versions.get(ds.name) != version:
+                try:
+                    con.execute(f"CREATE OR REPLACE VIEW {root} AS {ds.source_sql()}")
+                    snap.catalog_columns[ds.name] = [row[0] for row in con.execute(f"DESCRIBE {root}").fetchall()]
+                except duckdb.Error as e:
+                    raise ValueError(f"Dataset '{ds.name}' is not available: {e}")
+                snap.catalog_versions[ds.name] = version
+        return root
+
+    def _dataset_versions(self, query: ParsedQuery) -> dict:
+        """Dataset phụ mà query tham chiếu (tìm qua AST) -> version theo fingerprint file / thư mục."""
+        if not self.datasets or not query.ok:
+            return {}
+        return {name: self._catalog_version(name) for name in sorted(referenced_tables(query.ast) & set(self.datasets))}
+
+    def _catalog_version(self, name: str) -> str:
+        try:
+            return fingerprint_version(file_fingerprint(self.datasets[name].path))
+        except OSError:
+            return "missing"
 
-        con.execute(sql)
+    def _register_datasets(self, con, versions: dict, context: UserContext, snap: DatasetSnapshot):
+        """
+        Lazy registration: chỉ dataset phụ mà query tham chiếu mới được tạo secure view trên cursor
+        -> request không trả chi phí setup cho bảng không dùng tới.
+        """
+        perm = permission_hash(context)
+        registered = snap.cursor_datasets.setdefault(id(con), {})
+        for name, version in versions.items():
+            ds = self.datasets[name]
+            if registered.get(ds.name) == (perm, version):
+                continue
+            root = self._dataset_root(con, snap, ds, version)
+            if "ALL" in context.allowed_brands:
+                source = f"SELECT * FROM {root}"
+            elif ds.brand_col and ds.brand_col in snap.catalog_columns[ds.name]:
+                source = self._filtered_source(con, context, snap, perm, root, brand_col=ds.brand_col)
+            else:
+                # CRITICAL FAIL-SAFE: dataset không có cột để lọc quyền -> chỉ Admin được đọc
+                source = f"SELECT * FROM {root} WHERE 1=0"
+            con.execute(f'CREATE OR REPLACE TEMP VIEW "{ds.name}" AS {source}')
+            registered[ds.name] = (perm, version)
 
-    def validate_sql(self, sql: str) -> bool:
+    def validate_sql(self, sql: Union[str, ParsedQuery]) -> bool:
         """
         Kiểm tra SQL Injection cơ bản & Từ khóa cấm.
+        Nhận SQL string hoặc ParsedQuery (đã parse sẵn -> không parse lại).
         """
+        query = parse_query(sql)
         try:
-            # Parse with DuckDB dialect explicitly to support QUALIFY, etc.
-            parsed = sqlglot.parse_one(sql, read="duckdb")
+            if not query.ok:
+                raise ValueError(query.error)
             # Check command type
-            if parsed.find(
-                sqlglot.exp.Drop,
-                sqlglot.exp.Delete,
-                sqlglot.exp.Insert,
-                sqlglot.exp.Update,
-            ):
+            if query.ast.find(*_FORBIDDEN_NODES):
                 raise ValueError("Forbidden: Write operations are not allowed.")
+            # Chỉ nhận đúng 1 câu SELECT / UNION / WITH (multi-statement -> Block, CHECKPOINT/DESCRIBE/PRAGMA... bị chặn)
+            if not isinstance(query.ast, exp.Query):
+                raise ValueError("Forbidden: Only a single SELECT / UNION / WITH statement is allowed.")
+            # Bảng quyền / rollup nội bộ (data của các group khác) không được đọc trực tiếp
+            if any(t.db.lower() in _INTERNAL_SCHEMAS for t in query.tables):
+                raise ValueError("Forbidden: Internal permission tables are not accessible.")
+            # Bảng gốc chỉ được đọc qua secure_sales / raw_sales (tên không qualify -> TEMP VIEW RLS)
+            allowed = _USER_TABLES | set(self.datasets) | {c.alias_or_name.lower() for c in query.ast.find_all(exp.CTE)}
+            for t in query.tables:
+                if isinstance(t.this, exp.Func):
+                    fn = t.this.name if isinstance(t.this, exp.Anonymous) else t.this.sql_name()
+                    if fn.lower() not in _TABLE_FUNCTIONS:
+                        raise ValueError(f"Forbidden: Table function '{fn}' is not allowed.")
+                elif t.catalog or t.db or t.name.lower() not in allowed:
+                    raise ValueError("Forbidden: Base tables must be queried through secure_sales.")
             return True
         except Exception as e:
             raise ValueError(f"Invalid SQL: {str(e)}")
 
-    def execute_query(self, sql: str, context: UserContext) -> pl.DataFrame:
+    def _rls_key(self, context: UserContext) -> str:
+        """Định danh của filter RLS thực tế (cột lọc + tập quyền) áp lên secure_sales."""
+        return f"{self.brand_col}:{permission_hash(context)}"
+
+    def permission_key(self, context: UserContext) -> str:
+        """Filter RLS của user dạng public (VD: gắn owner cho cursor phân trang, kiểm tra lại ở mỗi page)."""
+        return self._rls_key(context)
+
+    def _result_cache_key(self, query: ParsedQuery, context: UserContext, version: str,
+                          mode: str = "exact") -> Optional[str]:
         """
-        Hàm execute chính.
-        Returns: Polars DataFrame
+        Cache key = fingerprint của AST đã normalize (xem ParsedQuery.fingerprint)
+        + filter RLS + dataset version + mode (kết quả xấp xỉ không dùng chung entry với kết quả chính xác).
+        Returns None nếu query không nên cache (không parse được / có hàm không tất định).
         """
-        con = self._init_connection()
-        try:
-            self._setup_shadow_view(con, context)
-            self.validate_sql(sql)
+        if not query.deterministic:
+            return None
+        payload = "\x1e".join([query.fingerprint, self._rls_key(context), version, mode])
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def resolve_timeout(self, context: UserContext, timeout: Optional[float] = None) -> Optional[float]:
+        """
+        Deadline thực tế của query: giới hạn theo role (hoặc default_timeout), request chỉ được
+        đặt deadline NGẮN hơn giới hạn của role.
+        """
+        role = context.role or ""
+        role_limit = self.role_timeouts.get(role, self.role_timeouts.get(role.split("_")[0], self.default_timeout))
+        if timeout and role_limit:
+            return min(timeout, role_limit)
+        return timeout or role_limit
+
+    def resolve_cost_budget(self, context: UserContext) -> Optional[dict]:
+        """Budget chi phí theo role (prefix của role, rồi "default"). None -> không giới hạn."""
+        role = context.role or ""
+        budgets = self.cost_budgets
+        return budgets.get(role, budgets.get(role.split("_")[0], budgets.get("default")))
+
+    def _check_cost(self, con, sql: str, context: UserContext, metrics: Optional[dict] = None):
+        """EXPLAIN trước khi chạy; vượt budget của role -> QueryTooExpensiveError (chưa tốn CPU / RAM)."""
+        budget = self.resolve_cost_budget(context)
+        if not budget:
+            return
+        cost = estimate_cost(con, sql)
+        if metrics is not None:
+            metrics["estimated_cost"] = cost.to_dict()
+        check_budget(cost, budget)
 
-            # Thực thi -> Trả về Polars
-            # DuckDB support .pl() natively
-            return con.execute(sql).pl()
+    def _execute_profiled(self, con, sql: str, metrics: Optional[dict]) -> pl.DataFrame:
+        """Chạy query kèm profile JSON của DuckDB (EXPLAIN ANALYZE), ghi tóm tắt theo operator vào metrics["profile"]."""
+        summary = summarize_profile(explain_analyze(con, sql))
+        result = con.execute(sql)
+        t_fetch = time.perf_counter()
+        df = result.pl()
+        summary["fetch_ms"] = round((time.perf_counter() - t_fetch) * 1000, 3)
+        if summary["available"]:
+            # EXPLAIN ANALYZE không trả dòng nào cho client
+            summary["rows_returned"] = df.height
+        if metrics is not None:
+            metrics["profile"] = summary
+        return df
+
+    def _run_guarded(self, con, sql: str, timeout: Optional[float], cancel_token: Optional[CancelToken], fn):
+        """Chạy fn() dưới watchdog deadline / cancel token; lỗi INTERRUPT được đổi thành lỗi có cấu trúc."""
+        handle = self.watchdog.watch(con, timeout, cancel_token)
+        try:
+            return fn()
         except Exception as e:
-            raise e
+            translated = handle.translate(e, sql)
+            if translated is e:
+                raise
+            raise translated from e
         finally:
-            con.close()
+            handle.finish()
 
-    def get_schema_info(self, context: UserContext) -> str:
+    def execute_query(self, sql: Union[str, ParsedQuery], context: UserContext, metrics: Optional[dict] = None,
+                      timeout: Optional[float] = None, cancel_token: Optional[CancelToken] = None,
+                      approximate: bool = False, profile: bool = False) -> pl.DataFrame:
         """
-        Lấy schema của bảng secure_sales để đưa cho AI.
+        Hàm execute chính: check cache -> mượn cursor từ pool -> dựng shadow view -> query.
+        `sql`: SQL string hoặc ParsedQuery (Agent parse 1 lần rồi truyền xuống).
+        `approximate`: query aggregate chạy trên sample phân tầng (cần sample_fraction), SUM / COUNT
+        được scale theo trọng số và có thêm cột `<tên>_ci95`. Query không ước lượng được -> chạy chính xác.
+        `profile`: bật profiler DuckDB, metrics["profile"] = thời gian / cardinality từng operator
+        (kết quả lấy từ result cache thì không có profile).
+        `metrics` (optional): dict để engine ghi thông tin của query (cache hit...) cho Agent.
+        `timeout`: deadline (giây) của request, bị chặn trên bởi giới hạn của role.
+        `cancel_token`: hủy query từ thread khác (VD: client ngắt kết nối).
+        Có admission controller: chờ tới lượt trước khi mượn cursor (cache hit không phải chờ),
+        metrics["admission"] = thời gian chờ / độ sâu hàng đợi / số query đang chạy.
+        Raises: QueryTimeoutError / QueryCancelledError / QueryTooExpensiveError / AdmissionRejectedError.
+        Returns: Polars DataFrame
         """
-        con = self._init_connection()
+        query = parse_query(sql)
+        sql = query.sql
+        self.validate_sql(query)
+        snap = self._current_snapshot()
+
+        # Rollup trả lời chính xác và còn rẻ hơn sample -> ưu tiên rollup
+        plan = self._plan_rollup(query, context, snap)
+        approx = None
+        if approximate and plan is None and snap.sample is not None and query.ok:
+            approx = rewrite_approximate(query.ast)
+
+        version = snap.version
+        dataset_versions = self._dataset_versions(query)
+        if dataset_versions:
+            version = f"{version}|" + ",".join(f"{k}:{v}" for k, v in dataset_versions.items())
+        cache_key = self._result_cache_key(query, context, version, "approx" if approx else "exact")
+        if metrics is not None:
+            metrics["rollup"] = plan[0].name if plan else None
+            metrics["approximate"] = approx is not None
+            metrics["sample_fraction"] = snap.sample.fraction if approx else None
+        if cache_key is not None:
+            cached = self.result_cache.get(cache_key)
+            if metrics is not None:
+                metrics["result_cache_hit"] = cached is not None
+            if cached is not None:
+                return cached
+
+        effective_timeout = self.resolve_timeout(context, timeout)
+        if metrics is not None:
+            metrics["timeout_s"] = effective_timeout
+
+        admit = self.admission.admit(context, effective_timeout, cancel_token) if self.admission else nullcontext()
+        with admit as slot, snap.pool.connection() as con:
+            if slot is not None and metrics is not None:
+                metrics["admission"] = slot.to_dict()
+
+            def _run():
+                self._setup_shadow_view(con, context, snap)
+                self._register_datasets(con, dataset_versions, context, snap)
+                names = None
+                if approx is not None:
+                    # Approximate: chạy trên sample đã lọc RLS, giữ tên cột như query gốc
+                    names = [row[0] for row in con.execute(f"DESCRIBE {sql}").fetchall()]
+                    source = self._filtered_source(con, context, snap, permission_hash(context), snap.sample.table)
+                    run_sql = approx.finalize(parse_query(source).ast, names)
+                    names = None
+                elif plan is not None:
+                    # Rollup: thay secure_sales bằng rollup đã lọc RLS
+                    rollup, rewritten, renamed = plan
+                    rewritten = rewritten.copy()
+                    table = source_table(rewritten)
+                    source = self._filtered_source(con, context, snap, permission_hash(context), rollup.table)
+                    table.replace(parse_query(source).ast.copy().subquery(table.alias_or_name))
+                    run_sql = rewritten.sql(dialect="duckdb")
+                    if renamed:
+                        # COUNT(*) -> SUM(__rows)...: giữ tên cột output giống hệt query gốc
+                        names = [row[0] for row in con.execute(f"DESCRIBE {sql}").fetchall()]
+                else:
+                    run_sql = sql
+
+                # Guardrail chi phí: ước lượng trên SQL thực sự chạy (rollup / sample rẻ hơn nhiều)
+                self._check_cost(con, run_sql, context, metrics)
+
+                # Thực thi -> Trả về Polars
+                # DuckDB support .pl() natively
+                if profile:
+                    df = self._execute_profiled(con, run_sql, metrics)
+                else:
+                    df = con.execute(run_sql).pl()
+                if names is not None:
+                    df.columns = names
+                return df
+
+            df = self._run_guarded(con, sql, effective_timeout, cancel_token, _run)
+
+        if cache_key is not None:
+            self.result_cache.put(cache_key, df)
+        return df
+
+    def execute_query_stream(self, sql: Union[str, ParsedQuery], context: UserContext, batch_size: int = 10_000,
+                             timeout: Optional[float] = None, cancel_token: Optional[CancelToken] = None) -> QueryStream:
+        """
+        Biến thể streaming của execute_query: trả về QueryStream các Arrow RecordBatch (`batch_size` dòng).
+        Validate / shadow view / execute chạy NGAY (lỗi nổ ra trước khi trả response),
+        cursor được giữ tới khi stream đọc hết hoặc close(). Không đi qua result cache.
+        Deadline tính cho tới khi stream đóng.
+        """
+        query = parse_query(sql)
+        sql = query.sql
+        self.validate_sql(query)
+        snap = self._current_snapshot()
+
+        effective_timeout = self.resolve_timeout(context, timeout)
+        stack = ExitStack()
+        # Slot admission giữ tới khi stream đóng (query vẫn đang chạy trong lúc client đọc)
+        if self.admission is not None:
+            stack.enter_context(self.admission.admit(context, effective_timeout, cancel_token))
+        try:
+            con = stack.enter_context(snap.pool.connection())
+        except Exception:
+            stack.close()
+            raise
+        try:
+            handle = self.watchdog.watch(con, effective_timeout, cancel_token)
+        except Exception:
+            stack.close()
+            raise
+        # ExitStack LIFO: handle.finish chạy TRƯỚC khi cursor trả về pool
+        stack.callback(handle.finish)
         try:
-            self._setup_shadow_view(con, context)
+            self._setup_shadow_view(con, context, snap)
+            self._register_datasets(con, self._dataset_versions(query), context, snap)
+            self._check_cost(con, sql, context)
+            result = con.execute(sql)
+            if hasattr(result, "to_arrow_reader"):
+                reader = result.to_arrow_reader(batch_size)
+            else:
+                reader = result.fetch_record_batch(batch_size)
+        except Exception as e:
+            stack.close()
+            translated = handle.translate(e, sql)
+            if translated is e:
+                raise
+            raise translated from e
+        return QueryStream(reader, stack.close, translate=lambda e: handle.translate(e, sql))
+
+    def dataset_fingerprint(self):
+        """Fingerprint (path, mtime, size) của version dataset đang phục vụ."""
+        return self._current_snapshot().fingerprint
+
+    def dataset_version(self) -> str:
+        """Version tag của dataset đang phục vụ, đổi mỗi khi file data bị ghi đè (sau khi reload)."""
+        return self._current_snapshot().version
+
+    def _describe_secure_sales(self, context: UserContext, snap: DatasetSnapshot) -> str:
+        with snap.pool.connection() as con:
+            self._setup_shadow_view(con, context, snap)
             # DESCRIBE secure_sales
             schema = con.execute("DESCRIBE secure_sales").fetchall()
             # Format string: "Column (Type)"
-            return "\n".join([f"- {row[0]} ({row[1]})" for row in schema])
-        finally:
-            con.close()
+            lines = [f"- {row[0]} ({row[1]})" for row in schema]
+            lines.extend(self._describe_datasets(con, context, snap))
+            return "\n".join(lines)
+
+    def _describe_datasets(self, con, context: UserContext, snap: DatasetSnapshot) -> List[str]:
+        """Schema các dataset phụ user được đọc (bỏ qua dataset đang không có data)."""
+        lines = []
+        for name, ds in self.datasets.items():
+            try:
+                version = fingerprint_version(file_fingerprint(ds.path))
+                self._dataset_root(con, snap, ds, version)
+            except (OSError, ValueError):
+                continue
+            columns = snap.catalog_columns[ds.name]
+            if "ALL" not in context.allowed_brands and ds.brand_col not in columns:
+                continue
+            self._register_datasets(con, {name: version}, context, snap)
+            schema = con.execute(f'DESCRIBE "{ds.name}"').fetchall()
+            title = f"\nTable {ds.name}" + (f" ({ds.description})" if ds.description else "") + ":"
+            lines.append(title)
+            lines.extend(f"- {row[0]} ({row[1]})" for row in schema)
+        return lines
 
-    def get_all_brands(self) -> list:
+    def get_versioned_schema(self, context: UserContext) -> tuple:
+        """
+        Schema của secure_sales + dataset phụ kèm version tag (cache theo fingerprint của dataset chính
+        VÀ mọi dataset trong catalog + permission set): thêm / đổi schema dataset phụ -> schema & ETag mới.
+        Returns: (schema_str, version)
+        """
+        snap = self._current_snapshot()
+        fingerprint = (fingerprint_version(snap.fingerprint),
+                       tuple((name, self._catalog_version(name)) for name in sorted(self.datasets)))
+        return self.schema_cache.get_or_build(
+            fingerprint,
+            permission_hash(context),
+            lambda: self._describe_secure_sales(context, snap),
+        )
+
+    def get_schema_info(self, context: UserContext) -> str:
+        """
+        Lấy schema của bảng secure_sales để đưa cho AI.
+        """
+        return self.get_versioned_schema(context)[0]
+
+    def get_all_brands(self, strict: bool = False) -> list:
         """
         Helper cho Auth: Lấy danh sách tất cả Brand/Niche có trong DB.
         Dùng để map quyền group A/B/C vào list cụ thể.
+        Cache theo snapshot -> chỉ query lại khi dataset được reload.
+        strict: lỗi thì raise thay vì trả [] (caller phân biệt được "không có niche" với "đọc lỗi").
         """
-        con = self._init_connection()
         try:
-            # Load Raw View
-            con.execute(f"CREATE VIEW raw_sales AS SELECT * FROM read_parquet('{self.db_path}')")
-            
+            snap = self._current_snapshot()
+            if snap.brands is not None:
+                return list(snap.brands)
+
             # Check column existence
-            cols = [row[0] for row in con.execute("DESCRIBE raw_sales").fetchall()]
-            if self.brand_col not in cols:
+            if self.brand_col not in snap.columns:
                 return []
-                
-            # Query Distinct
-            res = con.execute(f'SELECT DISTINCT "{self.brand_col}" FROM raw_sales WHERE "{self.brand_col}" IS NOT NULL').fetchall()
-            return [row[0] for row in res]
+
+            if snap.partitions is not None:
+                # Dataset partitioned: danh sách brand chính là danh sách partition
+                snap.brands = [b for b in snap.partitions if b is not None]
+                return list(snap.brands)
+
+            with snap.pool.connection() as con:
+                # Query Distinct
+                res = con.execute(f'SELECT DISTINCT "{self.brand_col}" FROM {snap.base_table} WHERE "{self.brand_col}" IS NOT NULL').fetchall()
+            snap.brands = [row[0] for row in res]
+            return list(snap.brands)
         except Exception:
+            if strict:
+                raise
             return []
-        finally:
-            con.close()
+
+    def result_cache_stats(self) -> dict:
+        """Hit/miss/bytes của result cache."""
+        return self.result_cache.stats()
+
+    def pool_stats(self) -> dict:
+        """Stats của pool cursor (size, waits, checkout latency) cho monitoring."""
+        return self.pool.stats()
+
+    def admission_stats(self) -> Optional[dict]:
+        """Độ sâu hàng đợi / thời gian chờ / số request bị từ chối (None nếu không bật admission)."""
+        return self.admission.stats() if self.admission is not None else None
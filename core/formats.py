@@ -0,0 +1,81 @@
+import io
+import json
+from typing import Any, Dict, Optional, Tuple
+
+import polars as pl
+
+# Định dạng response của /query và /data/execute (content negotiation).
+#   json     : list dict theo dòng (mặc định, tương thích ngược)
+#   columnar : JSON theo cột {"col": [...]}, encode bằng writer Rust của Polars (không tạo object Python)
+#   arrow    : Arrow IPC stream
+#   parquet  : file Parquet (nén ZSTD)
+MEDIA_TYPES = {
+    "json": "application/json",
+    "columnar": "application/vnd.ppc.columnar+json",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+_ACCEPT_ALIASES = {
+    "application/vnd.apache.arrow.file": "arrow",
+    "application/x-parquet": "parquet",
+}
+
+
+def negotiate_format(requested: Optional[str] = None, accept: Optional[str] = None) -> str:
+    """
+    Chọn định dạng: field `format` của request (nếu có) > header Accept (theo q-value) > "json".
+    Raises: ValueError nếu `format` không được hỗ trợ.
+    """
+    if requested:
+        if requested not in MEDIA_TYPES:
+            raise ValueError(f"Unsupported format: {requested}")
+        return requested
+    if not accept:
+        return "json"
+    by_media = {media: fmt for fmt, media in MEDIA_TYPES.items()}
+    by_media.update(_ACCEPT_ALIASES)
+    candidates = []
+    for i, part in enumerate(accept.split(",")):
+        media, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        fmt = by_media.get(media.strip().lower())
+        if fmt and q > 0:
+            candidates.append((-q, i, fmt))
+    return min(candidates)[2] if candidates else "json"
+
+
+def columnar_json(df: pl.DataFrame, meta: Optional[Dict[str, Any]] = None) -> bytes:
+    """
+    {"<meta>"..., "columns": [...], "data": {"col": [v1, v2, ...]}} — `data` được Polars encode
+    thẳng từ Arrow (implode mỗi cột thành 1 list rồi write_json), pandas.DataFrame(data) đọc được luôn.
+    """
+    head = dict(meta or {})
+    head["columns"] = df.columns
+    if df.width:
+        # write_json -> [{"col": [...], ...}] (1 dòng duy nhất) -> bỏ cặp [] ngoài cùng
+        data = df.select(pl.all().implode()).write_json()[1:-1]
+    else:
+        data = "{}"
+    prefix = json.dumps(head, ensure_ascii=False, default=str)[:-1]
+    return f'{prefix}, "data": {data}}}'.encode("utf-8")
+
+
+def encode_frame(df: pl.DataFrame, fmt: str, meta: Optional[Dict[str, Any]] = None) -> Tuple[bytes, str]:
+    """Encode DataFrame theo định dạng nhị phân / columnar. Returns: (body, media type)."""
+    if fmt == "columnar":
+        return columnar_json(df, meta), MEDIA_TYPES[fmt]
+    buf = io.BytesIO()
+    if fmt == "arrow":
+        df.write_ipc_stream(buf)
+    elif fmt == "parquet":
+        df.write_parquet(buf, compression="zstd")
+    else:
+        raise ValueError(f"Unsupported binary format: {fmt}")
+    return buf.getvalue(), MEDIA_TYPES[fmt]
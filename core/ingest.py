@@ -0,0 +1,372 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import duckdb
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ khóa trong process
+    fcntl = None
+
+# Dataset incremental = thư mục có manifest liệt kê file base + các delta append-only:
+#   <root>/_manifest.json
+#   <root>/base/base_<seq>.parquet      (kết quả compaction, sort theo niche)
+#   <root>/deltas/delta_<seq>.parquet   (mỗi lần ingest 1 file, chỉ chứa dòng mới)
+# Reader chỉ đọc đúng các file có trong manifest -> file đang ghi dở / đã bị compaction thay thế
+# không bao giờ lọt vào query. Manifest được thay nguyên tử (ghi file tạm rồi os.replace).
+MANIFEST = "_manifest.json"
+BASE_DIR = "base"
+DELTA_DIR = "deltas"
+# Marker trong fingerprint (xem core/cache.py): compaction đổi file nhưng không đổi data_version
+DELTA_FINGERPRINT = "delta"
+# Lease compaction (khác khóa manifest: giữ suốt lần gộp, kể cả lúc ghi file)
+COMPACT_LOCK = ".compact.lock"
+
+_thread_locks: Dict[str, threading.Lock] = {}
+_thread_locks_guard = threading.Lock()
+
+
+def is_incremental(path: str) -> bool:
+    """Thư mục dataset incremental (có manifest)."""
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+def _quote_list(files: List[str]) -> str:
+    return "[" + ", ".join("'" + f.replace("'", "''") + "'" for f in files) + "]"
+
+
+def _read_sql(path: str) -> str:
+    """Biểu thức FROM đọc 1 file Parquet / CSV."""
+    safe = path.replace("'", "''")
+    reader = "read_csv_auto" if path.lower().endswith(".csv") else "read_parquet"
+    return f"{reader}('{safe}')"
+
+
+def read_date_window(path: str, date_col: str, start, end):
+    """
+    Các dòng của file export (Parquet / CSV) có `date_col` trong [start, end] (Polars DataFrame).
+    Scraper ghi lại toàn bộ lịch sử vào 1 file master -> chỉ khoảng ngày vừa cào được ingest thành delta.
+    """
+    con = duckdb.connect(":memory:")
+    try:
+        sql = f'SELECT * FROM {_read_sql(path)} WHERE CAST("{date_col}" AS DATE) BETWEEN ? AND ?'
+        return con.execute(sql, [start, end]).pl()
+    finally:
+        con.close()
+
+
+class DeltaTable:
+    """
+    1 bảng logic = base + deltas. Ingest chỉ ghi file delta chứa dòng mới (chi phí tỉ lệ với số dòng mới,
+    không phải toàn bộ lịch sử); Compactor gộp delta ở background khi vượt ngưỡng.
+    """
+
+    def __init__(self, root: str, brand_col: str = "Main niche"):
+        self.root = os.path.abspath(root)
+        self.brand_col = brand_col
+
+    # --- MANIFEST ---
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.root, MANIFEST)
+
+    @contextmanager
+    def _lock(self, name: str = ".manifest.lock"):
+        """Khóa ghi manifest: thread lock trong process + flock giữa các process (API, Streamlit, CLI)."""
+        with _thread_locks_guard:
+            lock = _thread_locks.setdefault(f"{self.root}/{name}", threading.Lock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.root, name), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read_manifest(self) -> Dict[str, Any]:
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _next_file(self, manifest: Dict[str, Any], folder: str, prefix: str) -> str:
+        """Tên file mới (tương đối với root), seq tăng dần và không bao giờ dùng lại."""
+        manifest["seq"] += 1
+        return os.path.join(folder, f"{prefix}_{manifest['seq']:06d}.parquet")
+
+    @classmethod
+    def create(cls, root: str, source=None, brand_col: str = "Main niche") -> "DeltaTable":
+        """
+        Khởi tạo dataset incremental (1 lần). `source` (file Parquet / CSV hoặc DataFrame) trở thành base.
+        """
+        table = cls(root, brand_col)
+        if is_incremental(table.root):
+            raise ValueError(f"Incremental dataset already exists: {table.root}")
+        os.makedirs(os.path.join(table.root, BASE_DIR), exist_ok=True)
+        os.makedirs(os.path.join(table.root, DELTA_DIR), exist_ok=True)
+        manifest = {"seq": 0, "data_version": 0, "base": [], "deltas": [], "retired": []}
+        if source is not None:
+            rel = table._next_file(manifest, BASE_DIR, "base")
+            manifest["base"] = [rel]
+            manifest["base_rows"] = table._write_parquet(source, rel)
+        table._write_manifest(manifest)
+        return table
+
+    # --- READ ---
+
+    def files(self, manifest: Optional[Dict[str, Any]] = None, deltas: bool = True) -> List[str]:
+        manifest = manifest or self.read_manifest()
+        rel = manifest["base"] + (manifest["deltas"] if deltas else [])
+        return [os.path.join(self.root, f) for f in rel]
+
+    def source_sql(self, manifest: Optional[Dict[str, Any]] = None, deltas: bool = True) -> str:
+        """SQL đọc base (+ deltas) như 1 bảng. Delta có thể thêm cột mới -> union_by_name."""
+        files = self.files(manifest, deltas)
+        if not files:
+            raise ValueError(f"Incremental dataset is empty: {self.root}")
+        return f"SELECT * FROM read_parquet({_quote_list(files)}, union_by_name=true)"
+
+    def delta_sql(self, manifest: Dict[str, Any]) -> Optional[str]:
+        """SQL chỉ đọc các delta (None nếu chưa có delta)."""
+        if not manifest["deltas"]:
+            return None
+        files = [os.path.join(self.root, f) for f in manifest["deltas"]]
+        return f"SELECT * FROM read_parquet({_quote_list(files)}, union_by_name=true)"
+
+    def fingerprint(self) -> tuple:
+        """
+        (root, DELTA_FINGERPRINT, data_version, danh sách file). data_version chỉ tăng khi ingest,
+        compaction giữ nguyên -> version tag (ETag / result cache) không đổi khi data không đổi.
+        """
+        manifest = self.read_manifest()
+        return (self.root, DELTA_FINGERPRINT, manifest["data_version"], tuple(manifest["base"] + manifest["deltas"]))
+
+    def stats(self) -> Dict[str, Any]:
+        manifest = self.read_manifest()
+
+        def _size(rel):
+            try:
+                return os.path.getsize(os.path.join(self.root, rel))
+            except OSError:
+                return 0
+
+        return {
+            "data_version": manifest["data_version"],
+            "base_files": len(manifest["base"]),
+            "base_bytes": sum(_size(f) for f in manifest["base"]),
+            "deltas": len(manifest["deltas"]),
+            "delta_bytes": sum(_size(f) for f in manifest["deltas"]),
+            "delta_rows": sum(manifest.get("delta_rows", {}).get(f, 0) for f in manifest["deltas"]),
+            "retired": len(manifest["retired"]),
+        }
+
+    # --- WRITE ---
+
+    def _write_parquet(self, source, rel_path: str, files: Optional[List[str]] = None) -> int:
+        """
+        Ghi `source` (path Parquet / CSV, DataFrame polars / pandas / Arrow) hoặc `files` (gộp nhiều Parquet)
+        ra rel_path, sort theo brand_col (zonemap cho filter RLS). Ghi file tạm rồi rename.
+        Returns: số dòng đã ghi.
+        """
+        target = os.path.join(self.root, rel_path)
+        tmp_path = f"{target}.tmp"
+        con = duckdb.connect(":memory:")
+        try:
+            if files is not None:
+                con.execute(f"CREATE VIEW src AS SELECT * FROM read_parquet({_quote_list(files)}, union_by_name=true)")
+            elif isinstance(source, str):
+                con.execute(f"CREATE VIEW src AS SELECT * FROM {_read_sql(source)}")
+            else:
+                con.register("src", source)
+            cols = [row[0] for row in con.execute("DESCRIBE src").fetchall()]
+            order_by = f' ORDER BY "{self.brand_col}"' if self.brand_col in cols else ""
+            safe_tmp = tmp_path.replace("'", "''")
+            con.execute(f"COPY (SELECT * FROM src{order_by}) TO '{safe_tmp}' (FORMAT PARQUET, COMPRESSION ZSTD)")
+            rows = con.execute(f"SELECT COUNT(*) FROM read_parquet('{safe_tmp}')").fetchone()[0]
+        finally:
+            con.close()
+        os.replace(tmp_path, target)
+        return rows
+
+    def append(self, source) -> Dict[str, Any]:
+        """
+        INGEST: ghi `source` thành 1 delta mới rồi thêm vào manifest.
+        File được ghi xong TRƯỚC khi vào manifest -> reader không bao giờ thấy delta ghi dở.
+        Returns: {"file", "rows", "data_version"}.
+        """
+        with self._lock():
+            manifest = self.read_manifest()
+            rel = self._next_file(manifest, DELTA_DIR, "delta")
+            # Giữ seq ngay để ingest song song không trùng tên file
+            self._write_manifest(manifest)
+        rows = self._write_parquet(source, rel)
+        with self._lock():
+            manifest = self.read_manifest()
+            manifest["deltas"].append(rel)
+            manifest.setdefault("delta_rows", {})[rel] = rows
+            manifest["data_version"] += 1
+            self._write_manifest(manifest)
+        return {"file": rel, "rows": rows, "data_version": manifest["data_version"]}
+
+    def compact(self, major: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Gộp delta:
+        - minor (mặc định): gộp các delta thành 1 delta (chi phí tỉ lệ với tổng delta, không đụng base).
+        - major: gộp base + deltas thành base mới.
+        File cũ được chuyển vào `retired` (chưa xóa ngay: snapshot cũ có thể vẫn đang đọc), xem vacuum().
+        Delta ingest trong lúc compaction vẫn được giữ nguyên trong manifest.
+        Chỉ 1 compaction chạy tại 1 thời điểm (lease `.compact.lock` giữ suốt lần gộp): Compactor minor
+        của API và nút major của Data Admin chạy chồng nhau sẽ gộp cùng delta 2 lần -> đếm trùng dòng.
+        Returns: {"mode", "files", "rows"} hoặc None nếu không có gì để gộp.
+        """
+        with self._lock(COMPACT_LOCK):
+            return self._compact(major)
+
+    def _compact(self, major: bool) -> Optional[Dict[str, Any]]:
+        with self._lock():
+            manifest = self.read_manifest()
+            merged = list(manifest["deltas"])
+            if not merged or (not major and len(merged) < 2):
+                return None
+            if major:
+                merged = manifest["base"] + merged
+            rel = self._next_file(manifest, BASE_DIR if major else DELTA_DIR, "base" if major else "delta")
+            self._write_manifest(manifest)
+
+        rows = self._write_parquet(None, rel, files=[os.path.join(self.root, f) for f in merged])
+
+        with self._lock():
+            manifest = self.read_manifest()
+            done = set(merged)
+            # Phòng thủ thêm (process cũ không giữ lease): file nguồn đã bị thay trong lúc ghi -> bỏ kết quả
+            if not done <= set(manifest["base"]) | set(manifest["deltas"]):
+                try:
+                    os.remove(os.path.join(self.root, rel))
+                except FileNotFoundError:
+                    pass
+                return None
+            remaining = [f for f in manifest["deltas"] if f not in done]
+            delta_rows = manifest.setdefault("delta_rows", {})
+            if major:
+                manifest["base"] = [rel]
+                manifest["base_rows"] = rows
+                manifest["deltas"] = remaining
+            else:
+                # Delta gộp đứng đúng vị trí của delta đầu tiên bị gộp (giữ thứ tự ingest)
+                manifest["deltas"] = [rel] + remaining
+                delta_rows[rel] = rows
+            for f in merged:
+                delta_rows.pop(f, None)
+            now = time.time()
+            manifest["retired"].extend([f, now] for f in merged)
+            self._write_manifest(manifest)
+        return {"mode": "major" if major else "minor", "files": len(merged), "rows": rows}
+
+    def vacuum(self, grace_seconds: float = 600.0) -> int:
+        """Xóa file đã bị compaction thay thế quá `grace_seconds` (đủ lâu để snapshot cũ đóng hết)."""
+        with self._lock():
+            manifest = self.read_manifest()
+            cutoff = time.time() - grace_seconds
+            keep, removed = [], 0
+            for rel, retired_at in manifest["retired"]:
+                if retired_at > cutoff:
+                    keep.append([rel, retired_at])
+                    continue
+                try:
+                    os.remove(os.path.join(self.root, rel))
+                except FileNotFoundError:
+                    pass
+                removed += 1
+            if removed:
+                manifest["retired"] = keep
+                self._write_manifest(manifest)
+        return removed
+
+
+class Compactor:
+    """
+    Thread nền gộp delta khi vượt ngưỡng:
+    - max_deltas: số delta tối đa trước khi gộp minor (query không phải mở quá nhiều file nhỏ).
+    - major_ratio: tổng size delta >= major_ratio * size base -> gộp vào base (chi phí rewrite base
+      được chia đều cho lượng data mới, không chạy mỗi lần ingest).
+    """
+
+    def __init__(self, table: DeltaTable, interval: float = 60.0, max_deltas: int = 8,
+                 major_ratio: float = 0.25, grace_seconds: float = 600.0):
+        self.table = table
+        self.interval = interval
+        self.max_deltas = max_deltas
+        self.major_ratio = major_ratio
+        self.grace_seconds = grace_seconds
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def run_once(self) -> Optional[Dict[str, Any]]:
+        """Gộp nếu vượt ngưỡng + dọn file cũ. Returns: kết quả compaction hoặc None."""
+        stats = self.table.stats()
+        result = None
+        if stats["deltas"] and stats["delta_bytes"] >= self.major_ratio * stats["base_bytes"]:
+            result = self.table.compact(major=True)
+        elif stats["deltas"] >= self.max_deltas:
+            result = self.table.compact()
+        self.table.vacuum(self.grace_seconds)
+        return result
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def _loop():
+            while not self._stop.wait(self.interval):
+                try:
+                    result = self.run_once()
+                    if result:
+                        print(f"🗜️ Compacted {result['files']} files ({result['mode']}, {result['rows']:,} rows)")
+                except Exception as e:
+                    print(f"⚠️ Compaction failed (will retry): {e}")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=_loop, name="delta-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Dataset incremental: base + delta append-only.")
+    parser.add_argument("--brand-col", default="Main niche")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_init = sub.add_parser("init", help="Tạo dataset từ master Parquet hiện có")
+    p_init.add_argument("root")
+    p_init.add_argument("source", nargs="?")
+    p_append = sub.add_parser("append", help="Ingest 1 file (Parquet / CSV) thành delta mới")
+    p_append.add_argument("root")
+    p_append.add_argument("source")
+    p_compact = sub.add_parser("compact", help="Gộp delta (--major: gộp luôn vào base)")
+    p_compact.add_argument("root")
+    p_compact.add_argument("--major", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "init":
+        DeltaTable.create(args.root, args.source, brand_col=args.brand_col)
+        print(f"✅ Created incremental dataset at {args.root}")
+    elif args.command == "append":
+        info = DeltaTable(args.root, args.brand_col).append(args.source)
+        print(f"✅ Appended {info['rows']:,} rows as {info['file']} (data version {info['data_version']})")
+    else:
+        print(DeltaTable(args.root, args.brand_col).compact(major=args.major) or "Nothing to compact")
@@ -0,0 +1,193 @@
+import os
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import polars as pl
+import pyarrow as pa
+
+
+class CursorNotFoundError(KeyError):
+    """Cursor không tồn tại hoặc đã hết hạn (TTL) -> client phải chạy lại query."""
+
+    def __init__(self, cursor: str):
+        self.cursor = cursor
+        super().__init__(cursor)
+
+    def __str__(self):
+        return f"Result cursor '{self.cursor}' does not exist or has expired. Re-run the query."
+
+
+class CursorAccessError(PermissionError):
+    """User lấy page có permission set khác với user đã chạy query."""
+
+
+class _Entry:
+    def __init__(self, path: str, owner: str, rows: int, size: int, schema: pa.Schema,
+                 meta: Dict[str, Any], ttl: float):
+        self.path = path
+        self.owner = owner
+        self.rows = rows
+        self.size = size
+        self.schema = schema
+        self.meta = meta
+        self.ttl = ttl
+        self.expires_at = time.monotonic() + ttl
+        self.lock = threading.Lock()
+        self._reader = None
+
+    def reader(self) -> pa.ipc.RecordBatchFileReader:
+        # Memory-map file Arrow: đọc page = slice zero-copy, không load toàn bộ kết quả vào RAM
+        if self._reader is None:
+            self._reader = pa.ipc.open_file(pa.memory_map(self.path, "r"))
+        return self._reader
+
+    def close(self):
+        self._reader = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class ResultPager:
+    """
+    Kết quả query lớn được spill ra file Arrow IPC (1 file / cursor) để client lấy từng page
+    mà không phải chạy lại query.
+    - TTL trượt: mỗi lần lấy page gia hạn thêm `ttl` giây; hết hạn -> file bị xóa.
+    - `max_bytes`: tổng dung lượng spill tối đa, vượt thì bỏ cursor sắp hết hạn nhất.
+    - Mỗi cursor gắn với `owner` (filter RLS của user đã chạy query); page chỉ trả cho đúng owner đó.
+    """
+
+    def __init__(self, spill_dir: Optional[str] = None, ttl: float = 600.0, max_bytes: int = 2 * 1024 ** 3):
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix="ppc_pages_")
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+    def _drop(self, cursor: str):
+        # Gọi khi đang giữ self._lock
+        entry = self._entries.pop(cursor, None)
+        if entry is not None:
+            self._bytes -= entry.size
+            with entry.lock:
+                entry.close()
+
+    def sweep(self) -> int:
+        """Xóa cursor hết hạn. Returns: số cursor đã xóa."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [c for c, e in self._entries.items() if e.expires_at <= now]
+            for cursor in expired:
+                self._drop(cursor)
+        return len(expired)
+
+    def spill(self, batches: Iterable[pa.RecordBatch], schema: pa.Schema, owner: str,
+              meta: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Ghi các batch (VD: QueryStream) ra file Arrow IPC -> RAM chỉ tốn cỡ 1 batch.
+        Returns: cursor id (ngẫu nhiên, không đoán được).
+        """
+        self.sweep()
+        cursor = secrets.token_urlsafe(16)
+        path = os.path.join(self.spill_dir, f"{cursor}.arrow")
+        rows = 0
+        try:
+            with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+                for batch in batches:
+                    if batch.num_rows:
+                        writer.write_batch(batch)
+                        rows += batch.num_rows
+        except Exception:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            raise
+        entry = _Entry(path, owner, rows, os.path.getsize(path), schema, dict(meta or {}), self.ttl)
+        with self._lock:
+            self._entries[cursor] = entry
+            self._bytes += entry.size
+            # Vượt dung lượng -> bỏ cursor sắp hết hạn nhất (trừ cursor vừa tạo)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                victim = min((c for c in self._entries if c != cursor), key=lambda c: self._entries[c].expires_at)
+                self._drop(victim)
+        return cursor
+
+    def spill_frame(self, df: pl.DataFrame, owner: str, meta: Optional[Dict[str, Any]] = None,
+                    batch_size: int = 65_536) -> str:
+        """Spill DataFrame đã có trong RAM (VD: kết quả của Agent / result cache)."""
+        table = df.to_arrow()
+        return self.spill(table.to_batches(max_chunksize=batch_size), table.schema, owner, meta)
+
+    def page(self, cursor: str, owner: str, offset: int, limit: int) -> Tuple[pl.DataFrame, Dict[str, Any]]:
+        """
+        Page [offset, offset + limit) của cursor. Kiểm tra owner ở MỌI lần lấy page.
+        Returns: (DataFrame, info gồm total_rows / next_offset / expires_in / meta).
+        Raises: CursorNotFoundError, CursorAccessError.
+        """
+        if offset < 0 or limit <= 0:
+            raise ValueError("offset must be >= 0 and page_size > 0")
+        self.sweep()
+        with self._lock:
+            entry = self._entries.get(cursor)
+            if entry is None:
+                raise CursorNotFoundError(cursor)
+            if not secrets.compare_digest(entry.owner, owner):
+                raise CursorAccessError("This result cursor belongs to a different permission set.")
+            entry.expires_at = time.monotonic() + entry.ttl
+        with entry.lock:
+            if not os.path.exists(entry.path):
+                raise CursorNotFoundError(cursor)
+            reader = entry.reader()
+            end = min(offset + limit, entry.rows)
+            batches, start = [], 0
+            for i in range(reader.num_record_batches):
+                if start >= end:
+                    break
+                batch = reader.get_batch(i)
+                stop = start + batch.num_rows
+                if stop > offset:
+                    lo = max(offset - start, 0)
+                    batches.append(batch.slice(lo, min(end, stop) - start - lo))
+                start = stop
+            table = pa.Table.from_batches(batches, schema=entry.schema)
+        df = pl.from_arrow(table)
+        if not isinstance(df, pl.DataFrame):
+            df = df.to_frame()
+        info = {
+            "total_rows": entry.rows,
+            "offset": offset,
+            "next_offset": end if end < entry.rows else None,
+            "expires_in": entry.ttl,
+            **entry.meta,
+        }
+        return df, info
+
+    def close(self, cursor: str, owner: str) -> bool:
+        """Client đã đọc xong -> xóa file ngay, không đợi TTL."""
+        with self._lock:
+            entry = self._entries.get(cursor)
+            if entry is None:
+                return False
+            if not secrets.compare_digest(entry.owner, owner):
+                raise CursorAccessError("This result cursor belongs to a different permission set.")
+            self._drop(cursor)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"cursors": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def shutdown(self):
+        """Xóa toàn bộ file spill (tắt server)."""
+        with self._lock:
+            for cursor in list(self._entries):
+                self._drop(cursor)
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
@@ -0,0 +1,96 @@
+import hashlib
+from functools import lru_cache
+from typing import List, Optional, Union
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+
+DIALECT = "duckdb"
+
+# Query có hàm không tất định (NOW(), RANDOM()...) -> không cache kết quả
+_NONDETERMINISTIC_NODES = tuple(
+    getattr(exp, name)
+    for name in ("Rand", "CurrentDate", "CurrentTimestamp", "CurrentTime", "CurrentDatetime", "Uuid")
+    if hasattr(exp, name)
+)
+_NONDETERMINISTIC_FUNCS = {"now", "random", "uuid", "gen_random_uuid", "today", "get_current_time", "setseed"}
+
+
+class ParsedQuery:
+    """
+    SQL đã parse 1 lần, dùng chung cho validate / result cache / rollup / hiển thị.
+    `ast` là bản dùng chung (có thể nằm trong LRU cache) -> KHÔNG được sửa trực tiếp, cần sửa thì .copy().
+    Parse lỗi -> ast=None, `error` chứa thông báo lỗi.
+    """
+
+    def __init__(self, sql: str, ast: Optional[exp.Expression] = None, error: Optional[str] = None):
+        self.sql = sql
+        self.ast = ast
+        self.error = error
+        self._fingerprint = None
+        self._pretty = None
+
+    @property
+    def ok(self) -> bool:
+        return self.ast is not None
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        """
+        Hash của AST đã normalize (bỏ khác biệt whitespace / hoa-thường keyword & identifier).
+        Tên cột output của DuckDB giữ nguyên cách viết trong query, nên projection (chưa normalize
+        identifier) cũng nằm trong hash -> `SELECT revenue` và `SELECT Revenue` khác fingerprint.
+        """
+        if self._fingerprint is None and self.ok:
+            projections = [e.sql(dialect=DIALECT) for e in getattr(self.ast, "selects", [])]
+            normalized = normalize_identifiers(self.ast.copy(), dialect=DIALECT).sql(dialect=DIALECT, identify=True)
+            payload = "\x1e".join([normalized, "\x1f".join(projections)])
+            self._fingerprint = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+        return self._fingerprint
+
+    @property
+    def pretty(self) -> str:
+        """SQL format đẹp để hiển thị (không parse được thì trả nguyên văn)."""
+        if self._pretty is None:
+            self._pretty = self.ast.sql(dialect=DIALECT, pretty=True) if self.ok else self.sql
+        return self._pretty
+
+    @property
+    def columns(self) -> List[str]:
+        """Các cột được tham chiếu trong query (không phân biệt bảng)."""
+        if not self.ok:
+            return []
+        return sorted({c.name for c in self.ast.find_all(exp.Column) if c.name})
+
+    @property
+    def tables(self) -> List[exp.Table]:
+        return list(self.ast.find_all(exp.Table)) if self.ok else []
+
+    @property
+    def deterministic(self) -> bool:
+        if not self.ok:
+            return False
+        if self.ast.find(*_NONDETERMINISTIC_NODES):
+            return False
+        return not any(fn.name.lower() in _NONDETERMINISTIC_FUNCS for fn in self.ast.find_all(exp.Anonymous))
+
+
+@lru_cache(maxsize=1024)
+def _parse_cached(sql: str) -> ParsedQuery:
+    try:
+        # Parse with DuckDB dialect explicitly to support QUALIFY, etc.
+        return ParsedQuery(sql, sqlglot.parse_one(sql, read=DIALECT))
+    except Exception as e:
+        return ParsedQuery(sql, error=str(e))
+
+
+def parse_query(sql: Union[str, ParsedQuery]) -> ParsedQuery:
+    """Parse SQL (LRU cache theo chuỗi SQL -> SQL lặp lại không phải parse lại)."""
+    if isinstance(sql, ParsedQuery):
+        return sql
+    return _parse_cached(sql)
+
+
+def parse_cache_info():
+    return _parse_cached.cache_info()
@@ -0,0 +1,93 @@
+import os
+import shutil
+from typing import Dict, List, Optional
+from urllib.parse import unquote
+
+import duckdb
+
+from .ingest import is_incremental
+
+# Tên cột partition trên path. Không dùng thẳng brand_col vì DuckDB URL-encode cả tên cột
+# ("Main niche" -> "Main%20niche=...") nhưng không decode lại khi đọc.
+# File Parquet bên trong vẫn giữ nguyên cột brand_col gốc.
+PARTITION_KEY = "brand_key"
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def is_partitioned(path: str) -> bool:
+    """Dataset dạng thư mục Hive-partitioned (thay vì 1 file Parquet / dataset incremental)."""
+    return os.path.isdir(path) and not is_incremental(path)
+
+
+def partition_glob(root: str) -> str:
+    return os.path.join(root, f"{PARTITION_KEY}=*", "*.parquet")
+
+
+def scan_partitions(root: str) -> Dict[Optional[str], List[str]]:
+    """
+    Map giá trị brand -> danh sách file Parquet của partition đó.
+    Partition NULL được map vào key None.
+    """
+    partitions: Dict[Optional[str], List[str]] = {}
+    prefix = f"{PARTITION_KEY}="
+    for entry in sorted(os.listdir(root)):
+        part_dir = os.path.join(root, entry)
+        if not entry.startswith(prefix) or not os.path.isdir(part_dir):
+            continue
+        raw_value = entry[len(prefix):]
+        value = None if raw_value == NULL_PARTITION else unquote(raw_value)
+        files = sorted(
+            os.path.join(part_dir, f) for f in os.listdir(part_dir) if f.endswith(".parquet")
+        )
+        if files:
+            partitions.setdefault(value, []).extend(files)
+    return partitions
+
+
+def write_brand_partitions(source_path: str, target_dir: str, brand_col: str) -> Dict[Optional[str], List[str]]:
+    """
+    INGEST: ghi master Parquet thành thư mục Hive-partitioned theo brand_col
+    (`target_dir/brand_key=<brand>/data_0.parquet`).
+    Ghi vào thư mục tạm rồi mới thay thư mục cũ -> reader không thấy dataset ghi dở.
+    Returns: map brand -> files (giống scan_partitions).
+    """
+    target_dir = os.path.abspath(target_dir)
+    tmp_dir = f"{target_dir}.tmp"
+    old_dir = f"{target_dir}.old"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    safe_source = source_path.replace("'", "''")
+    safe_tmp = tmp_dir.replace("'", "''")
+    con = duckdb.connect(":memory:")
+    try:
+        con.execute(
+            f"""
+            COPY (
+                SELECT *, "{brand_col}" AS {PARTITION_KEY}
+                FROM read_parquet('{safe_source}')
+                ORDER BY "{brand_col}"
+            ) TO '{safe_tmp}' (FORMAT PARQUET, PARTITION_BY ({PARTITION_KEY}), COMPRESSION ZSTD)
+            """
+        )
+    finally:
+        con.close()
+
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(target_dir):
+        os.replace(target_dir, old_dir)
+    os.replace(tmp_dir, target_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return scan_partitions(target_dir)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ghi master Parquet thành dataset partition theo niche.")
+    parser.add_argument("source", help="File master Parquet")
+    parser.add_argument("target", help="Thư mục output (Hive-partitioned)")
+    parser.add_argument("--brand-col", default="Main niche")
+    args = parser.parse_args()
+
+    parts = write_brand_partitions(args.source, args.target, args.brand_col)
+    print(f"✅ Wrote {len(parts)} partitions to {args.target}")
@@ -0,0 +1,151 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+import duckdb
+
+
+class PoolExhaustedError(TimeoutError):
+    """Không mượn được cursor trong thời gian chờ cho phép."""
+
+
+class CursorPool:
+    """
+    Pool cursor giới hạn trên MỘT database DuckDB dùng chung (long-lived).
+
+    - Database gốc được mở lazy ở lần checkout đầu tiên thông qua `factory`
+      (factory tự tạo các view/table dùng chung như raw_sales).
+    - Mỗi request mượn 1 cursor (`root.cursor()` = connection riêng trên cùng database),
+      nên TEMP VIEW (secure_sales) của request này không lộ sang request khác.
+    - Stats: size, số lần phải chờ, latency checkout.
+    """
+
+    def __init__(self, factory: Callable[[], duckdb.DuckDBPyConnection], size: int = 4, timeout: float = 30.0,
+                 on_close: Optional[Callable[[], None]] = None):
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        # Callback sau khi database gốc thực sự đóng (VD: xóa file .duckdb của version cũ)
+        self.on_close = on_close
+
+        self._root = None
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._checkout_latency_total = 0.0
+        self._checkout_latency_max = 0.0
+
+    def _ensure_root(self):
+        # Gọi khi đang giữ self._lock
+        if self._root is None:
+            self._root = self.factory()
+        return self._root
+
+    def open(self):
+        """Mở database gốc ngay (không cần đợi checkout đầu tiên)."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Cursor pool is closed.")
+            self._ensure_root()
+
+    def _acquire(self):
+        t_start = time.perf_counter()
+        waited = False
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Cursor pool is closed.")
+            root = self._ensure_root()
+            try:
+                cursor = self._idle.get_nowait()
+            except queue.Empty:
+                cursor = None
+                if self._created < self.size:
+                    cursor = root.cursor()
+                    self._created += 1
+
+        if cursor is None:
+            # Pool đã đầy -> chờ cursor được trả về
+            waited = True
+            try:
+                cursor = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise PoolExhaustedError(
+                    f"No DuckDB cursor available after {self.timeout}s (pool size={self.size})."
+                )
+
+        latency = time.perf_counter() - t_start
+        with self._lock:
+            self._checkouts += 1
+            self._checkout_latency_total += latency
+            self._checkout_latency_max = max(self._checkout_latency_max, latency)
+            if waited:
+                self._waits += 1
+                self._wait_time_total += latency
+        return cursor
+
+    def _release(self, cursor):
+        with self._lock:
+            if self._closed:
+                cursor.close()
+                self._created -= 1
+                self._maybe_close_root()
+                return
+        self._idle.put(cursor)
+
+    def _maybe_close_root(self):
+        # Gọi khi đang giữ self._lock: chỉ đóng database khi không còn cursor nào đang được mượn
+        if self._created == 0 and self._root is not None:
+            self._root.close()
+            self._root = None
+            if self.on_close is not None:
+                self.on_close()
+
+    @contextmanager
+    def connection(self):
+        """
+        Mượn 1 cursor: `with pool.connection() as con: ...`
+        Cursor luôn được trả lại pool kể cả khi query lỗi.
+        """
+        cursor = self._acquire()
+        try:
+            yield cursor
+        finally:
+            self._release(cursor)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "size": self.size,
+                "created": self._created,
+                "idle": self._idle.qsize(),
+                "in_use": self._created - self._idle.qsize(),
+                "checkouts": checkouts,
+                "waits": self._waits,
+                "wait_time_total": self._wait_time_total,
+                "checkout_latency_avg_ms": (self._checkout_latency_total / checkouts * 1000) if checkouts else 0.0,
+                "checkout_latency_max_ms": self._checkout_latency_max * 1000,
+            }
+
+    def close(self):
+        """
+        Đóng toàn bộ cursor rảnh. Query đang chạy vẫn chạy tiếp trên database cũ;
+        database gốc chỉ bị đóng khi cursor cuối cùng được trả về.
+        """
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                    self._created -= 1
+                except queue.Empty:
+                    break
+            self._maybe_close_root()
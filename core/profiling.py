@@ -0,0 +1,75 @@
+import json
+from typing import Any, Dict, List
+
+# Node gốc mà EXPLAIN ANALYZE thêm vào cây operator (không phải operator của query)
+_EXPLAIN_NODE = "EXPLAIN_ANALYZE"
+
+
+def explain_analyze(con, sql: str) -> str:
+    """
+    Profile JSON của DuckDB cho `sql` qua EXPLAIN (ANALYZE, FORMAT JSON): database đã khóa cấu hình
+    (lock_configuration) nên không bật được `enable_profiling` trên cursor -> query chạy thêm 1 lần để đo.
+    """
+    row = con.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}").fetchone()
+    return row[1]
+
+
+def _ms(seconds) -> float:
+    return round(float(seconds or 0.0) * 1000, 3)
+
+
+def _walk(node: dict, depth: int, out: List[dict]):
+    name = node.get("operator_name") or node.get("operator_type")
+    if name and name != _EXPLAIN_NODE:
+        entry = {
+            "operator": name,
+            "depth": depth,
+            "time_ms": _ms(node.get("operator_timing")),
+            "rows": node.get("operator_cardinality", 0),
+        }
+        if node.get("operator_rows_scanned"):
+            entry["rows_scanned"] = node["operator_rows_scanned"]
+        table = (node.get("extra_info") or {}).get("Table") or (node.get("extra_info") or {}).get("Function")
+        if table and table != name:
+            entry["source"] = table
+        out.append(entry)
+        depth += 1
+    for child in node.get("children", []):
+        _walk(child, depth, out)
+
+
+def summarize_profile(raw: str) -> Dict[str, Any]:
+    """
+    Rút gọn output JSON của profiler thành: tổng latency / CPU, dòng đã scan, RAM buffer đỉnh,
+    và danh sách operator theo thứ tự cây (depth = độ sâu) kèm thời gian + cardinality.
+    """
+    tree = json.loads(raw)
+    if "latency" not in tree:
+        # Query trả lời thẳng từ metadata (VD: COUNT(*) trên Parquet) -> profiler không có operator tree
+        return {"available": False, "operators": []}
+    operators: List[dict] = []
+    for child in tree.get("children", []):
+        _walk(child, 0, operators)
+    return {
+        "available": True,
+        "latency_ms": _ms(tree.get("latency")),
+        "cpu_time_ms": _ms(tree.get("cpu_time")),
+        "rows_scanned": tree.get("cumulative_rows_scanned", 0),
+        "rows_returned": tree.get("rows_returned", 0),
+        "peak_buffer_memory": tree.get("system_peak_buffer_memory", 0),
+        "operators": operators,
+    }
+
+
+def format_profile(profile: Dict[str, Any]) -> str:
+    """Bảng text gọn của profile (Streamlit / log)."""
+    if not profile.get("available", True):
+        return f"No operator profile (answered from metadata) · fetch {profile.get('fetch_ms', 0):.1f} ms"
+    lines = [
+        f"DuckDB {profile['latency_ms']:.1f} ms (CPU {profile['cpu_time_ms']:.1f} ms) · "
+        f"fetch {profile.get('fetch_ms', 0):.1f} ms · scanned {profile['rows_scanned']:,} rows"
+    ]
+    for op in profile["operators"]:
+        source = f" [{op['source']}]" if op.get("source") else ""
+        lines.append(f"{'  ' * op['depth']}{op['operator']}{source}: {op['time_ms']:.2f} ms, {op['rows']:,} rows")
+    return "\n".join(lines)
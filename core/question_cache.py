@@ -0,0 +1,367 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlglot import exp, parse_one
+
+# Số dòng tối đa giữ trong cache (bỏ entry dùng lâu nhất khi vượt)
+DEFAULT_MAX_ENTRIES = 5000
+# Journal được compact khi số dòng vượt max(ngưỡng này, 2 × số entry)
+JOURNAL_COMPACT_MIN = 1000
+NUM_TOKEN = "<num>"
+_NUM_RE = re.compile(r"\d+(?:[.,]\d+)?")
+_NUM_PERM = 64
+_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(20250101)
+# Hệ số (a, b) cố định của 64 hàm hash MinHash -> signature giống nhau giữa các process (persist ra đĩa)
+_A = _rng.integers(1, _PRIME, _NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, _NUM_PERM, dtype=np.uint64)
+
+# Từ đệm (đã bỏ dấu): 2 câu hỏi fuzzy chỉ được coi là một khi phần khác nhau toàn là các từ này.
+# MinHash đo giống nhau theo ký tự -> "cao nhất" / "thấp nhất", "ascending" / "descending" vẫn rất gần,
+# nên cần bước kiểm tra này để không trả nhầm SQL ngược nghĩa.
+FILLER_WORDS = frozenset("""
+    a ah oi nhe nha vay the thi la co cua cho toi minh chung ta hay giup xem voi duoc trong cac nhung mot
+    ban lam on vui long liet ke hien thi
+    the a an is are was s what whats me show list please give tell of all my our can could you i do does
+    get display find us let
+""".split())
+
+
+def strip_diacritics(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.replace("đ", "d").replace("Đ", "D"))
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def normalize_question(question: str) -> Tuple[str, List[str]]:
+    """
+    "Top 10 SKU có doanh thu  cao nhất?" -> ("top <num> sku co doanh thu cao nhat", ["10"]).
+    Chữ thường, bỏ dấu tiếng Việt, bỏ dấu câu, gộp khoảng trắng; số được tách ra thành tham số.
+    """
+    text = strip_diacritics(question.lower())
+    numbers = [n.replace(",", ".") for n in _NUM_RE.findall(text)]
+    text = _NUM_RE.sub(f" {NUM_TOKEN} ", text)
+    text = re.sub(r"[^\w<>]+", " ", text)
+    return " ".join(text.split()), numbers
+
+
+def minhash(text: str) -> np.ndarray:
+    """Signature MinHash (64 giá trị) trên tập shingle 3 ký tự của câu hỏi đã normalize."""
+    padded = f" {text} "
+    shingles = {padded[i:i + 3] for i in range(max(len(padded) - 2, 1))}
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") % _PRIME
+         for s in shingles],
+        dtype=np.uint64,
+    )
+    # (a * h + b) mod p, tính trên object int để không tràn uint64
+    a, b = _A.astype(object)[:, None], _B.astype(object)[:, None]
+    perms = (a * hashes.astype(object)[None, :] + b) % _PRIME
+    return perms.min(axis=1).astype(np.uint64)
+
+
+def _number_literals(ast: exp.Expression, value: str) -> List[exp.Literal]:
+    target = float(value)
+    found = []
+    for lit in ast.find_all(exp.Literal):
+        if lit.is_number:
+            try:
+                if float(lit.this) == target:
+                    found.append(lit)
+            except ValueError:
+                continue
+    return found
+
+
+class CachedQuestion:
+    """
+    1 câu hỏi đã được AI trả lời bằng SQL chạy thành công.
+    Số trong câu hỏi -> tham số: nếu số đó xuất hiện đúng 1 lần trong SQL (VD: LIMIT 10) thì câu hỏi
+    khác số ("top 5 ...") dùng lại được SQL bằng cách thay literal; số không tìm thấy (hoặc xuất hiện
+    nhiều lần, VD: `* 100`) thì bị "ghim" -> chỉ dùng lại khi câu hỏi mới có đúng số đó.
+    """
+
+    def __init__(self, scope: str, text: str, numbers: List[str], sql: str, explanation: Optional[str],
+                 ai_seconds: float, signature: Optional[np.ndarray] = None, hits: int = 0,
+                 last_used: Optional[float] = None):
+        self.scope = scope
+        self.text = text
+        self.numbers = numbers
+        self.sql = sql
+        self.explanation = explanation
+        self.ai_seconds = ai_seconds
+        self.signature = signature if signature is not None else minhash(text)
+        self.hits = hits
+        self.last_used = last_used or time.time()
+
+    def instantiate(self, numbers: List[str]) -> Optional[str]:
+        """SQL cho câu hỏi có các số `numbers` (None nếu không thay được an toàn)."""
+        if numbers == self.numbers:
+            return self.sql
+        if len(numbers) != len(self.numbers):
+            return None
+        try:
+            ast = parse_one(self.sql, read="duckdb")
+        except Exception:
+            return None
+        replacements = []
+        for old, new in zip(self.numbers, numbers):
+            if old == new:
+                continue
+            literals = _number_literals(ast, old)
+            if len(literals) != 1 or self.numbers.count(old) != 1:
+                return None
+            replacements.append((literals[0], new))
+        for lit, new in replacements:
+            lit.replace(exp.Literal.number(new))
+        return ast.sql(dialect="duckdb")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "scope": self.scope,
+            "text": self.text,
+            "numbers": self.numbers,
+            "sql": self.sql,
+            "explanation": self.explanation,
+            "ai_seconds": self.ai_seconds,
+            "hits": self.hits,
+            "last_used": self.last_used,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CachedQuestion":
+        return cls(data["scope"], data["text"], data["numbers"], data["sql"], data.get("explanation"),
+                   data.get("ai_seconds", 0.0), hits=data.get("hits", 0), last_used=data.get("last_used"))
+
+
+class QuestionCache:
+    """
+    Cache NL -> SQL đặt trước AIEngine.generate_sql (AI tốn 10-20s / câu, user hỏi lại cùng câu mỗi ngày).
+    - Key chính xác: schema hash + hash lịch sử chat (history[-4:] mà prompt dùng) + câu hỏi đã normalize.
+    - Không khớp chính xác -> MinHash (64 hàm, shingle 3 ký tự) tìm câu gần nhất cùng schema / history,
+      similarity >= `threshold` VÀ phần khác nhau chỉ là từ đệm thì mới dùng.
+    - Chỉ lưu SQL đã chạy thành công (Agent gọi `put` sau khi execute OK); SQL lấy từ cache chạy lỗi
+      -> `invalidate`.
+    - Persist ra file JSON Lines (`path`) chỉ ghi nối, compact định kỳ (xem `_append`).
+    """
+
+    def __init__(self, path: Optional[str] = None, threshold: float = 0.75,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], List[CachedQuestion]] = {}
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self._journal_lines = 0
+        if path and os.path.exists(path):
+            self._load()
+
+    # --- KEY ---
+
+    @staticmethod
+    def schema_hash(schema_info: str) -> str:
+        return hashlib.sha1(schema_info.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def _scope(schema_info: str, history: Optional[list]) -> str:
+        """Câu hỏi chỉ dùng chung SQL khi cùng schema và cùng ngữ cảnh chat mà AI nhìn thấy."""
+        turns = []
+        for msg in (history or [])[-4:]:
+            text, numbers = normalize_question(str(msg.get("content", "")))
+            turns.append(f"{msg.get('role')}:{text}:{','.join(numbers)}")
+        payload = QuestionCache.schema_hash(schema_info) + "\x1e" + "\x1f".join(turns)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+    # --- LOOKUP ---
+
+    def get(self, question: str, schema_info: str, history: Optional[list] = None) -> Optional[Dict[str, Any]]:
+        """
+        Returns: {"sql", "explanation", "match": "exact" | "fuzzy", "similarity", "saved_s", "lookup_s"}
+        hoặc None (miss -> gọi AI rồi `put`).
+        """
+        started = time.perf_counter()
+        text, numbers = normalize_question(question)
+        scope = self._scope(schema_info, history)
+        with self._lock:
+            match, similarity, sql = None, 1.0, None
+            for entry in self._entries.get((scope, text), []):
+                sql = entry.instantiate(numbers)
+                if sql:
+                    match = entry
+                    break
+            kind = "exact"
+            if match is None:
+                match, similarity, sql = self._fuzzy(scope, text, numbers)
+                kind = "fuzzy"
+            if match is None:
+                self.misses += 1
+                return None
+            match.hits += 1
+            match.last_used = time.time()
+            self.hits += 1
+            if kind == "fuzzy":
+                self.fuzzy_hits += 1
+            lookup_s = time.perf_counter() - started
+            saved = max(match.ai_seconds - lookup_s, 0.0)
+            self.seconds_saved += saved
+        return {
+            "sql": sql,
+            "explanation": match.explanation,
+            "match": kind,
+            "similarity": round(similarity, 3),
+            "saved_s": saved,
+            "lookup_s": lookup_s,
+        }
+
+    def _fuzzy(self, scope: str, text: str, numbers: List[str]):
+        candidates = [e for (s, _), entries in self._entries.items() if s == scope for e in entries
+                      if len(e.numbers) == len(numbers)]
+        if not candidates:
+            return None, 0.0, None
+        signature = minhash(text)
+        sims = (np.stack([e.signature for e in candidates]) == signature).mean(axis=1)
+        words = set(text.split())
+        for i in np.argsort(-sims):
+            if sims[i] < self.threshold:
+                break
+            entry = candidates[i]
+            if not (words ^ set(entry.text.split())) <= FILLER_WORDS:
+                continue
+            sql = entry.instantiate(numbers)
+            if sql:
+                return entry, float(sims[i]), sql
+        return None, 0.0, None
+
+    # --- WRITE ---
+
+    def put(self, question: str, schema_info: str, history: Optional[list], sql: str,
+            explanation: Optional[str] = None, ai_seconds: float = 0.0):
+        """Lưu SQL (đã chạy thành công) của câu hỏi. `ai_seconds`: thời gian AI đã tốn = thời gian tiết kiệm mỗi lần hit."""
+        text, numbers = normalize_question(question)
+        scope = self._scope(schema_info, history)
+        entry = CachedQuestion(scope, text, numbers, sql, explanation, ai_seconds)
+        with self._lock:
+            self._insert(entry)
+            records = [{"op": "put", **entry.to_dict()}]
+            records.extend(self._delete_record(e) for e in self._evict())
+            self._append(records)
+
+    def invalidate(self, question: str, schema_info: str, history: Optional[list], sql: str):
+        """SQL lấy từ cache chạy lỗi -> bỏ mọi entry sinh ra SQL đó cho câu hỏi này."""
+        text, numbers = normalize_question(question)
+        scope = self._scope(schema_info, history)
+        with self._lock:
+            removed = []
+            for key, bucket in list(self._entries.items()):
+                if key[0] != scope:
+                    continue
+                kept = [e for e in bucket if e.instantiate(numbers) != sql]
+                if len(kept) != len(bucket):
+                    removed.extend(e for e in bucket if e not in kept)
+                    if kept:
+                        self._entries[key] = kept
+                    else:
+                        del self._entries[key]
+            if removed:
+                self._append([self._delete_record(e) for e in removed])
+
+    def _insert(self, entry: CachedQuestion):
+        bucket = self._entries.setdefault((entry.scope, entry.text), [])
+        bucket[:] = [e for e in bucket if e.numbers != entry.numbers]
+        bucket.insert(0, entry)
+
+    def _remove(self, scope: str, text: str, numbers: List[str]):
+        bucket = self._entries.get((scope, text))
+        if bucket is None:
+            return
+        bucket[:] = [e for e in bucket if e.numbers != numbers]
+        if not bucket:
+            del self._entries[(scope, text)]
+
+    def _evict(self) -> List[CachedQuestion]:
+        entries = [e for bucket in self._entries.values() for e in bucket]
+        if len(entries) <= self.max_entries:
+            return []
+        evicted = sorted(entries, key=lambda e: e.last_used)[:len(entries) - self.max_entries]
+        for entry in evicted:
+            self._remove(entry.scope, entry.text, entry.numbers)
+        return evicted
+
+    # --- PERSISTENCE ---
+    # File JSON Lines chỉ ghi nối (put / del), mỗi thay đổi = 1 dòng -> put không phải ghi lại cả cache.
+    # Journal dài quá (nhiều dòng put / del đã lỗi thời) -> compact: ghi lại snapshot (file tạm rồi rename).
+
+    @staticmethod
+    def _delete_record(entry: CachedQuestion) -> Dict[str, Any]:
+        return {"op": "del", "scope": entry.scope, "text": entry.text, "numbers": entry.numbers}
+
+    def _append(self, records: List[Dict[str, Any]]):
+        if not self.path:
+            return
+        entries = sum(len(b) for b in self._entries.values())
+        if self._journal_lines + len(records) > max(JOURNAL_COMPACT_MIN, 2 * entries):
+            self._rewrite()
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+            self._journal_lines += len(records)
+        except OSError as e:
+            print(f"⚠️ Question cache save failed: {e}")
+
+    def _rewrite(self):
+        # Entry mới nhất của bucket nằm đầu -> ghi ngược để replay (insert lên đầu) ra đúng thứ tự
+        records = [{"op": "put", **e.to_dict()} for bucket in self._entries.values() for e in reversed(bucket)]
+        tmp_path = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+            os.replace(tmp_path, self.path)
+            self._journal_lines = len(records)
+        except OSError as e:
+            print(f"⚠️ Question cache save failed: {e}")
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    self._journal_lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # dòng cuối ghi dở (process bị kill giữa chừng)
+                    if record.get("op") == "del":
+                        self._remove(record["scope"], record["text"], record["numbers"])
+                    else:
+                        self._insert(CachedQuestion.from_dict(record))
+        except (OSError, KeyError, TypeError) as e:
+            print(f"⚠️ Question cache load failed (starting empty): {e}")
+            self._entries = {}
+
+    # --- MONITORING ---
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": sum(len(b) for b in self._entries.values()),
+                "hits": self.hits,
+                "fuzzy_hits": self.fuzzy_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "seconds_saved": self.seconds_saved,
+            }
@@ -0,0 +1,204 @@
+from typing import List, Optional, Tuple
+
+from sqlglot import exp
+
+# Schema nội bộ chứa các bảng rollup. Rollup chứa data của MỌI niche -> user SQL không được đọc trực tiếp.
+ROLLUP_SCHEMA = "rollup"
+# Cột đếm số dòng gốc của mỗi nhóm (COUNT(*) -> SUM(__rows))
+ROWS_COL = "__rows"
+# Tên bảng mà rewriter nhận diện (view RLS của user)
+SOURCE_TABLE = "secure_sales"
+
+_NUMERIC_PREFIXES = (
+    "TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT", "UINTEGER",
+    "UBIGINT", "UHUGEINT", "FLOAT", "REAL", "DOUBLE", "DECIMAL",
+)
+
+
+def count_col(measure: str) -> str:
+    """Cột đếm giá trị non-NULL của 1 measure (COUNT(x) / AVG(x))."""
+    return f"__count_{measure}"
+
+
+class RollupSpec:
+    """
+    Cấu hình 1 bảng rollup: GROUP BY `dimensions`, SUM + COUNT từng measure.
+    measures=None -> mọi cột số không phải dimension.
+    Rollup phải chứa brand_col trong dimensions thì mới phục vụ được user bị giới hạn quyền.
+    """
+
+    def __init__(self, name: str, dimensions: List[str], measures: Optional[List[str]] = None):
+        self.name = name
+        self.dimensions = list(dimensions)
+        self.measures = list(measures) if measures is not None else None
+
+
+def default_rollups(brand_col: str) -> List[RollupSpec]:
+    """Rollup mặc định: ngày × niche (phần lớn câu hỏi doanh thu / ads spend / ACOS theo ngày hoặc theo niche)."""
+    return [RollupSpec("daily_niche", ["Report_Date", brand_col])]
+
+
+class Rollup:
+    """Rollup đã materialize trong 1 snapshot."""
+
+    def __init__(self, spec: RollupSpec, measures: List[str], rows: int, source_columns: Optional[List[str]] = None):
+        self.name = spec.name
+        self.table = f"{ROLLUP_SCHEMA}.{spec.name}"
+        self.dimensions = spec.dimensions
+        self.measures = measures
+        self.rows = rows
+        self._dims = {d.lower() for d in spec.dimensions}
+        self._measures = {m.lower(): m for m in measures}
+        # Cột của bảng gốc: alias trùng tên cột gốc thì bảng gốc và rollup resolve khác nhau
+        self._source = {c.lower() for c in (source_columns or [])}
+
+    def has_dimension(self, name: str) -> bool:
+        return name.lower() in self._dims
+
+    def measure(self, name: str) -> Optional[str]:
+        return self._measures.get(name.lower())
+
+    def has_source_column(self, name: str) -> bool:
+        return name.lower() in self._source
+
+
+def build_rollups(con, base_table: str, specs: List[RollupSpec]) -> List[Rollup]:
+    """
+    INGEST: materialize các rollup từ bảng gốc (chạy 1 lần khi dựng snapshot).
+    Spec thiếu cột trong data thì bỏ qua. Trả về danh sách rollup, nhỏ nhất trước.
+    """
+    types = {row[0]: row[1] for row in con.execute(f"DESCRIBE {base_table}").fetchall()}
+    built = []
+    con.execute(f"CREATE SCHEMA IF NOT EXISTS {ROLLUP_SCHEMA}")
+    for spec in specs:
+        missing = [d for d in spec.dimensions if d not in types]
+        if missing:
+            print(f"⚠️ Rollup '{spec.name}' skipped: missing columns {missing}")
+            continue
+        measures = spec.measures
+        if measures is None:
+            measures = [c for c, t in types.items()
+                        if c not in spec.dimensions and t.upper().startswith(_NUMERIC_PREFIXES)]
+        measures = [m for m in measures if m in types]
+
+        dims_sql = ", ".join(f'"{d}"' for d in spec.dimensions)
+        aggs = [f'SUM("{m}") AS "{m}", COUNT("{m}") AS "{count_col(m)}"' for m in measures]
+        aggs.append(f"COUNT(*) AS {ROWS_COL}")
+        con.execute(
+            f"CREATE TABLE {ROLLUP_SCHEMA}.{spec.name} AS "
+            f"SELECT {dims_sql}, {', '.join(aggs)} FROM {base_table} GROUP BY ALL ORDER BY {dims_sql}"
+        )
+        rows = con.execute(f"SELECT COUNT(*) FROM {ROLLUP_SCHEMA}.{spec.name}").fetchone()[0]
+        built.append(Rollup(spec, measures, rows, list(types)))
+    return sorted(built, key=lambda r: r.rows)
+
+
+def _bare_column(node) -> Optional[str]:
+    return node.name if isinstance(node, exp.Column) else None
+
+
+def _inside(node: exp.Expression, clauses: List[exp.Expression]) -> bool:
+    parent = node.parent
+    while parent is not None:
+        if any(parent is c for c in clauses):
+            return True
+        parent = parent.parent
+    return False
+
+
+def _rewrite_agg(agg: exp.Expression, rollup: Rollup) -> Optional[exp.Expression]:
+    """Viết lại 1 hàm aggregate trên dòng gốc thành aggregate trên rollup (None nếu không phục vụ được)."""
+    arg = agg.this
+    if isinstance(arg, exp.Distinct):
+        # COUNT(DISTINCT dim) giữ nguyên: tập giá trị của dimension không đổi sau khi rollup
+        cols = [_bare_column(e) for e in arg.expressions]
+        if isinstance(agg, exp.Count) and cols and all(c and rollup.has_dimension(c) for c in cols):
+            return agg.copy()
+        return None
+
+    if isinstance(agg, exp.Count) and isinstance(arg, exp.Star):
+        return exp.cast(exp.Sum(this=exp.column(ROWS_COL)), "BIGINT")
+
+    name = _bare_column(arg)
+    if name is None:
+        return None
+    measure = rollup.measure(name)
+
+    if isinstance(agg, (exp.Min, exp.Max)) and rollup.has_dimension(name):
+        return agg.copy()
+    if measure is None:
+        return None
+    if isinstance(agg, exp.Sum):
+        return exp.Sum(this=exp.column(measure, quoted=True))
+    if isinstance(agg, exp.Count):
+        return exp.cast(exp.Sum(this=exp.column(count_col(measure), quoted=True)), "BIGINT")
+    if isinstance(agg, exp.Avg):
+        return exp.Paren(this=exp.Div(
+            this=exp.Sum(this=exp.column(measure, quoted=True)),
+            expression=exp.Sum(this=exp.column(count_col(measure), quoted=True)),
+        ))
+    return None
+
+
+def rewrite_for_rollup(parsed: exp.Expression, rollup: Rollup) -> Optional[Tuple[exp.Expression, bool]]:
+    """
+    Thử viết lại query aggregate trên secure_sales thành query trên `rollup`.
+    Điều kiện: 1 SELECT duy nhất đọc đúng 1 bảng secure_sales (không join / subquery / window),
+    có aggregate hoặc GROUP BY, mọi cột ngoài aggregate là dimension (hoặc alias của output không trùng
+    tên cột gốc, chỉ ở GROUP BY / HAVING / ORDER BY),
+    aggregate thuộc SUM / COUNT / AVG trên measure, MIN / MAX / COUNT(DISTINCT) trên dimension.
+    Returns: (AST mới với bảng secure_sales giữ nguyên để engine thay bằng nguồn RLS của rollup,
+              có cột output bị đổi tên hay không) hoặc None.
+    """
+    if not isinstance(parsed, exp.Select):
+        return None
+    if parsed.args.get("joins") or parsed.args.get("with") or parsed.find(exp.Window):
+        return None
+    if any(s is not parsed for s in parsed.find_all(exp.Select)):
+        return None
+    tables = list(parsed.find_all(exp.Table))
+    if len(tables) != 1 or tables[0].name.lower() != SOURCE_TABLE or tables[0].db:
+        return None
+    if not parsed.find(exp.AggFunc) and not parsed.args.get("group"):
+        return None
+
+    aliases = {p.alias.lower() for p in parsed.expressions if p.alias}
+    alias_clauses = [parsed.args.get(k) for k in ("group", "having", "order") if parsed.args.get(k)]
+    for star in parsed.find_all(exp.Star):
+        if not isinstance(star.parent, exp.Count):
+            return None
+    for col in parsed.find_all(exp.Column):
+        if col.find_ancestor(exp.AggFunc) or rollup.has_dimension(col.name):
+            continue
+        # Alias chỉ được tham chiếu ở GROUP BY / HAVING / ORDER BY. Ở WHERE (hoặc alias trùng tên cột gốc)
+        # bảng gốc đọc cột thật còn rollup (không có cột đó) lại resolve sang alias -> sai kết quả.
+        if col.table or col.name.lower() not in aliases or rollup.has_source_column(col.name):
+            return None
+        if not _inside(col, alias_clauses):
+            return None
+
+    rewritten = parsed.copy()
+    # Aggregate lồng nhau không hợp lệ trong SQL -> chỉ xét aggregate ngoài cùng
+    for agg in [a for a in rewritten.find_all(exp.AggFunc) if not a.find_ancestor(exp.AggFunc)]:
+        new_agg = _rewrite_agg(agg, rollup)
+        if new_agg is None:
+            return None
+        agg.replace(new_agg)
+    # Cột output không có alias -> DuckDB tự đặt tên theo biểu thức, sau khi rewrite tên sẽ khác
+    renamed_outputs = any(
+        not isinstance(p, (exp.Alias, exp.Column)) and p.find(exp.AggFunc) for p in parsed.expressions
+    )
+    return rewritten, renamed_outputs
+
+
+def source_table(parsed: exp.Expression) -> exp.Table:
+    """Node bảng secure_sales của query đã được rewrite_for_rollup chấp nhận."""
+    return next(parsed.find_all(exp.Table))
+
+
+def eligible_rollups(rollups: List[Rollup], restricted: bool, brand_col: str) -> List[Rollup]:
+    """User bị giới hạn quyền chỉ dùng được rollup có brand_col (để còn lọc RLS)."""
+    if not restricted:
+        return rollups
+    return [r for r in rollups if r.has_dimension(brand_col)]
+
@@ -0,0 +1,166 @@
+from typing import List, Optional, Tuple
+
+from sqlglot import exp
+
+# Schema nội bộ chứa bảng sample (data mọi niche) -> user SQL không được đọc trực tiếp.
+SAMPLE_SCHEMA = "approx"
+SAMPLE_TABLE = f"{SAMPLE_SCHEMA}.sample"
+# Trọng số Horvitz-Thompson của mỗi dòng sample = N_niche / n_niche
+WEIGHT_COL = "_w"
+SOURCE_TABLE = "secure_sales"
+# Hệ số z của khoảng tin cậy 95%
+Z_95 = 1.96
+CI_SUFFIX = "_ci95"
+
+
+class Sample:
+    """Sample phân tầng theo niche đã materialize trong 1 snapshot."""
+
+    def __init__(self, rows: int, total_rows: int):
+        self.table = SAMPLE_TABLE
+        self.rows = rows
+        self.total_rows = total_rows
+
+    @property
+    def fraction(self) -> float:
+        return self.rows / self.total_rows if self.total_rows else 0.0
+
+
+def build_sample(con, base_table: str, brand_col: str, fraction: float, min_rows: int = 200) -> Sample:
+    """
+    INGEST: sample phân tầng theo brand_col. Mỗi niche lấy ceil(N * fraction) dòng ngẫu nhiên
+    (ít nhất `min_rows`, niche nhỏ lấy hết) -> niche nhỏ không bị mất khỏi kết quả xấp xỉ.
+    """
+    con.execute(f"CREATE SCHEMA IF NOT EXISTS {SAMPLE_SCHEMA}")
+    con.execute(
+        f"""
+        CREATE TABLE {SAMPLE_TABLE} AS
+        WITH ranked AS (
+            SELECT *,
+                   row_number() OVER (PARTITION BY "{brand_col}" ORDER BY random()) AS __rn,
+                   COUNT(*) OVER (PARTITION BY "{brand_col}") AS __n
+            FROM {base_table}
+        ), sized AS (
+            SELECT *, LEAST(__n, GREATEST(CEIL(__n * {float(fraction)}), {int(min_rows)})) AS __k FROM ranked
+        )
+        SELECT * EXCLUDE (__rn, __n, __k), __n::DOUBLE / __k AS {WEIGHT_COL}
+        FROM sized WHERE __rn <= __k
+        ORDER BY "{brand_col}"
+        """
+    )
+    rows = con.execute(f"SELECT COUNT(*) FROM {SAMPLE_TABLE}").fetchone()[0]
+    total = con.execute(f"SELECT COUNT(*) FROM {base_table}").fetchone()[0]
+    return Sample(rows, total)
+
+
+def _weight() -> exp.Column:
+    return exp.column(WEIGHT_COL)
+
+
+def _weighted(value: exp.Expression) -> exp.Expression:
+    return exp.Mul(this=exp.Paren(this=value.copy()), expression=_weight())
+
+
+def _weight_if_not_null(value: exp.Expression) -> exp.Expression:
+    return exp.If(this=exp.Not(this=exp.Is(this=value.copy(), expression=exp.Null())), true=_weight(),
+                  false=exp.Literal.number(0))
+
+
+def _minus_one() -> exp.Expression:
+    return exp.Paren(this=exp.Sub(this=_weight(), expression=exp.Literal.number(1)))
+
+
+def _scale_agg(agg: exp.Expression) -> Optional[Tuple[exp.Expression, Optional[exp.Expression]]]:
+    """
+    Estimator Horvitz-Thompson cho 1 aggregate.
+    Returns: (biểu thức ước lượng, phương sai ước lượng hoặc None) / None nếu không ước lượng được.
+    """
+    arg = agg.this
+    if isinstance(arg, exp.Distinct):
+        # COUNT(DISTINCT ...) không scale được từ sample -> chạy chính xác
+        return None
+    if isinstance(agg, exp.Count):
+        star = arg is None or isinstance(arg, exp.Star)
+        weight = _weight() if star else _weight_if_not_null(arg)
+        # Var ≈ Σ w · (w - 1) trên các dòng được đếm
+        variance = exp.Sum(this=exp.Mul(this=weight.copy(), expression=_minus_one()))
+        return exp.cast(exp.Round(this=exp.Sum(this=weight)), "BIGINT"), variance
+    if isinstance(agg, exp.Sum):
+        # Var ≈ Σ x² · w · (w - 1)
+        x = exp.Paren(this=arg.copy())
+        variance = exp.Sum(this=exp.Mul(
+            this=exp.Mul(this=exp.Mul(this=x, expression=x.copy()), expression=_weight()),
+            expression=_minus_one(),
+        ))
+        return exp.Sum(this=_weighted(arg)), variance
+    if isinstance(agg, exp.Avg):
+        # Ratio estimator: Σ x·w / Σ w (trên các dòng x không NULL)
+        return exp.Paren(this=exp.Div(
+            this=exp.Sum(this=_weighted(arg)), expression=exp.Sum(this=_weight_if_not_null(arg)),
+        )), None
+    # MIN / MAX / MEDIAN / QUANTILE...: ước lượng trực tiếp trên sample (không scale)
+    return agg.copy(), None
+
+
+class ApproxPlan:
+    """Query đã viết lại để chạy trên sample + biểu thức phương sai của các cột aggregate."""
+
+    def __init__(self, rewritten: exp.Select, variances: List[Tuple[int, exp.Expression]]):
+        self.rewritten = rewritten
+        self.variances = variances
+
+    def finalize(self, source: exp.Expression, names: List[str]) -> str:
+        """
+        SQL cuối cùng: thay secure_sales bằng `source` (sample đã lọc RLS), giữ tên cột output
+        giống query gốc (`names`) và thêm cột `<tên>_ci95` (nửa độ rộng khoảng tin cậy 95%).
+        """
+        final = self.rewritten.copy()
+        table = next(final.find_all(exp.Table))
+        table.replace(source.subquery(table.alias_or_name))
+        projections = final.expressions
+        for i, name in enumerate(names):
+            node = projections[i]
+            inner = node.this if isinstance(node, exp.Alias) else node
+            projections[i] = exp.alias_(inner.copy(), name, quoted=True)
+        for i, variance in self.variances:
+            ci = exp.Mul(this=exp.Literal.number(Z_95), expression=exp.Sqrt(this=variance.copy()))
+            projections.append(exp.alias_(ci, f"{names[i]}{CI_SUFFIX}", quoted=True))
+        final.set("expressions", projections)
+        return final.sql(dialect="duckdb")
+
+
+def rewrite_approximate(parsed: exp.Expression) -> Optional[ApproxPlan]:
+    """
+    Viết lại query aggregate trên secure_sales để chạy trên sample có trọng số.
+    Điều kiện: 1 SELECT (không DISTINCT / join / subquery / window) đọc đúng bảng secure_sales và có aggregate.
+    SUM / COUNT được scale theo trọng số; cột output là đúng 1 SUM / COUNT thì có thêm khoảng tin cậy.
+    """
+    if not isinstance(parsed, exp.Select) or parsed.args.get("distinct"):
+        return None
+    if parsed.args.get("joins") or parsed.args.get("with") or parsed.find(exp.Window):
+        return None
+    if any(s is not parsed for s in parsed.find_all(exp.Select)):
+        return None
+    tables = list(parsed.find_all(exp.Table))
+    if len(tables) != 1 or tables[0].name.lower() != SOURCE_TABLE or tables[0].db:
+        return None
+    if not parsed.find(exp.AggFunc):
+        return None
+
+    rewritten = parsed.copy()
+    # Cột output là đúng 1 aggregate -> tính thêm khoảng tin cậy
+    variances = []
+    for i, projection in enumerate(rewritten.expressions):
+        inner = projection.this if isinstance(projection, exp.Alias) else projection
+        if isinstance(inner, exp.AggFunc):
+            scaled = _scale_agg(inner)
+            if scaled is not None and scaled[1] is not None:
+                variances.append((i, scaled[1]))
+
+    # Aggregate lồng nhau không hợp lệ trong SQL -> chỉ xét aggregate ngoài cùng
+    for agg in [a for a in rewritten.find_all(exp.AggFunc) if not a.find_ancestor(exp.AggFunc)]:
+        scaled = _scale_agg(agg)
+        if scaled is None:
+            return None
+        agg.replace(scaled[0])
+    return ApproxPlan(rewritten, variances)
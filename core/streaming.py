@@ -0,0 +1,108 @@
+from typing import Callable, Iterator, List, Optional
+
+import polars as pl
+import pyarrow as pa
+
+
+class QueryStream:
+    """
+    Iterator các Arrow RecordBatch của 1 query. Giữ cursor của pool cho tới khi đọc hết
+    hoặc close() -> RAM chỉ tốn cỡ 1 batch, không phụ thuộc kích thước kết quả.
+
+        with engine.execute_query_stream(sql, ctx) as stream:
+            for batch in stream: ...
+    """
+
+    def __init__(self, reader: pa.RecordBatchReader, release: Callable[[], None],
+                 translate: Optional[Callable[[Exception], Exception]] = None):
+        self._reader = reader
+        self._release = release
+        # Đổi lỗi INTERRUPT (deadline / cancel) giữa chừng thành lỗi có cấu trúc
+        self._translate = translate
+        self._closed = False
+        self.schema: pa.Schema = reader.schema
+        self.rows = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> pa.RecordBatch:
+        if self._closed:
+            raise StopIteration
+        try:
+            batch = self._reader.read_next_batch()
+        except StopIteration:
+            self.close()
+            raise
+        except Exception as e:
+            self.close()
+            translated = self._translate(e) if self._translate else e
+            if translated is e:
+                raise
+            raise translated from e
+        self.rows += batch.num_rows
+        return batch
+
+    def close(self):
+        """Trả cursor về pool (gọi nhiều lần không sao)."""
+        if not self._closed:
+            self._closed = True
+            self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        # Fallback: stream bị bỏ dở mà không close() (VD: client ngắt kết nối)
+        self.close()
+
+
+def iter_ndjson(stream: QueryStream) -> Iterator[bytes]:
+    """Encode stream thành NDJSON (mỗi dòng 1 record), mỗi chunk = 1 batch."""
+    try:
+        for batch in stream:
+            if batch.num_rows:
+                yield pl.from_arrow(batch).write_ndjson().encode("utf-8")
+    finally:
+        stream.close()
+
+
+class _ChunkSink:
+    """File-like tối giản để lấy ra từng đoạn bytes mà Arrow IPC writer vừa ghi."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def iter_arrow_ipc(stream: QueryStream) -> Iterator[bytes]:
+    """Encode stream thành Arrow IPC stream format (schema + từng batch)."""
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), stream.schema)
+    try:
+        yield sink.drain()
+        for batch in stream:
+            writer.write_batch(batch)
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+    finally:
+        stream.close()
@@ -0,0 +1,229 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import duckdb
+import numpy as np
+import polars as pl
+
+from .cache import file_fingerprint, fingerprint_version, permission_hash
+from .context import UserContext
+from .dashboard import DATE_COL, REVENUE_COL, SKU_COL, SPEND_COL
+from .ingest import DeltaTable, is_incremental
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class _Partial:
+    """Aggregate theo niche của 1 file nguồn: totals (niche, revenue, spend, rows, first/last date) + SKU active."""
+
+    def __init__(self, totals: pl.DataFrame, skus: Dict[Optional[str], np.ndarray]):
+        self.totals = totals
+        self.skus = skus
+
+
+class KpiSummary:
+    """
+    KPI tổng hợp theo niche (revenue / ads spend / TACOS / số SKU active), duy trì tăng dần theo file:
+    - Mỗi file Parquet của dataset (file đơn, partition theo niche, base + delta của dataset incremental)
+      được aggregate 1 lần (chỉ đọc 4-5 cột) và nhớ theo (path, mtime, size). Ingest delta mới
+      -> chỉ quét file delta đó; file không còn trong dataset (compaction) -> bỏ partial của nó.
+    - SKU active (có revenue hoặc spend > 0) lưu dạng hash 64-bit đã unique theo niche -> đếm distinct
+      chính xác khi gộp nhiều niche / nhiều file (SKU trùng giữa base và delta không bị đếm 2 lần).
+    - Kết quả cho 1 user được cache theo (dataset version, permission hash) -> request lặp lại ~ms,
+      không bao giờ quét raw data.
+    """
+
+    def __init__(self, data_path: str, brand_col: str = "Main niche", sku_col: str = SKU_COL,
+                 revenue_col: str = REVENUE_COL, spend_col: str = SPEND_COL, date_col: str = DATE_COL,
+                 cache_entries: int = 256):
+        self.data_path = data_path
+        self.brand_col = brand_col
+        self.sku_col = sku_col
+        self.revenue_col = revenue_col
+        self.spend_col = spend_col
+        self.date_col = date_col
+        self.cache_entries = cache_entries
+
+        self._lock = threading.Lock()
+        self._partials: Dict[Tuple, _Partial] = {}
+        self._version: Optional[str] = None
+        self._fingerprint = None
+        self._totals: Optional[pl.DataFrame] = None
+        self._skus: Dict[Optional[str], np.ndarray] = {}
+        self._cache: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self.files_scanned = 0
+        self.hits = 0
+        self.misses = 0
+
+    # --- INGEST (tăng dần theo file) ---
+
+    def source_files(self) -> List[str]:
+        path = self.data_path
+        if is_incremental(path):
+            return DeltaTable(path, self.brand_col).files()
+        if os.path.isdir(path):
+            files = []
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, n) for n in names if n.endswith(".parquet"))
+            return sorted(files)
+        return [path]
+
+    def _scan(self, path: str) -> _Partial:
+        """Aggregate 1 file (projection pushdown: DuckDB chỉ đọc các cột cần thiết)."""
+        safe = path.replace("'", "''")
+        source = f"read_parquet('{safe}')"
+        con = duckdb.connect(":memory:")
+        try:
+            cols = {row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()}
+            niche = _q(self.brand_col) if self.brand_col in cols else "CAST(NULL AS VARCHAR)"
+            rev = f"COALESCE({_q(self.revenue_col)}, 0)" if self.revenue_col in cols else "0"
+            spend = f"COALESCE({_q(self.spend_col)}, 0)" if self.spend_col in cols else "0"
+            has_date = self.date_col in cols
+            first = f"MIN(CAST({_q(self.date_col)} AS DATE))" if has_date else "CAST(NULL AS DATE)"
+            last = f"MAX(CAST({_q(self.date_col)} AS DATE))" if has_date else "CAST(NULL AS DATE)"
+            totals = con.execute(f"""
+                SELECT {niche} AS niche, CAST(SUM({rev}) AS DOUBLE) AS revenue, CAST(SUM({spend}) AS DOUBLE) AS spend,
+                       COUNT(*) AS row_count, {first} AS first_date, {last} AS last_date
+                FROM {source} GROUP BY 1
+            """).pl()
+            skus: Dict[Optional[str], np.ndarray] = {}
+            if self.sku_col in cols:
+                sku = _q(self.sku_col)
+                hashed = con.execute(f"""
+                    SELECT niche, list(h ORDER BY h) AS hashes FROM (
+                        SELECT DISTINCT {niche} AS niche, hash({sku}) AS h
+                        FROM {source} WHERE {sku} IS NOT NULL AND ({rev} > 0 OR {spend} > 0)
+                    ) GROUP BY 1
+                """).pl()
+                for value, hashes in hashed.iter_rows():
+                    skus[value] = np.asarray(hashes, dtype=np.uint64)
+        finally:
+            con.close()
+        self.files_scanned += 1
+        return _Partial(totals, skus)
+
+    def refresh(self) -> str:
+        """
+        Đồng bộ với dataset hiện tại (gọi ở mỗi request, rẻ khi data không đổi: chỉ stat file).
+        Returns: dataset version (cùng version tag với DataEngine.dataset_version).
+        """
+        fingerprint = file_fingerprint(self.data_path)
+        with self._lock:
+            if fingerprint == self._fingerprint:
+                return self._version
+            partials = {}
+            for path in self.source_files():
+                st = os.stat(path)
+                key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+                partials[key] = self._partials.get(key) or self._scan(path)
+            self._partials = partials
+
+            frames = [p.totals for p in partials.values() if p.totals.height]
+            if frames:
+                self._totals = pl.concat(frames, how="vertical_relaxed").group_by("niche").agg(
+                    pl.col("revenue").sum(), pl.col("spend").sum(), pl.col("row_count").sum(),
+                    pl.col("first_date").min(), pl.col("last_date").max(),
+                )
+            else:
+                self._totals = None
+            skus: Dict[Optional[str], List[np.ndarray]] = {}
+            for partial in partials.values():
+                for niche, hashes in partial.skus.items():
+                    skus.setdefault(niche, []).append(hashes)
+            self._skus = {n: (arrs[0] if len(arrs) == 1 else np.unique(np.concatenate(arrs)))
+                          for n, arrs in skus.items()}
+
+            self._fingerprint = fingerprint
+            self._version = fingerprint_version(fingerprint)
+            self._cache.clear()
+            return self._version
+
+    # --- QUERY ---
+
+    def _visible(self, context: UserContext) -> Optional[set]:
+        """None = thấy mọi niche (admin, kể cả dòng không có niche)."""
+        if "ALL" in context.allowed_brands:
+            return None
+        return set(context.allowed_brands)
+
+    def _build(self, context: UserContext) -> Dict[str, Any]:
+        visible = self._visible(context)
+        totals = self._totals
+        if totals is not None and visible is not None:
+            totals = totals.filter(pl.col("niche").is_in(list(visible)))
+        niches = []
+        revenue = spend = 0.0
+        rows = 0
+        first = last = None
+        all_skus = []
+        if totals is not None:
+            for niche, n_rev, n_spend, n_rows, _, _ in totals.sort("niche", nulls_last=True).iter_rows():
+                hashes = self._skus.get(niche)
+                if hashes is not None:
+                    all_skus.append(hashes)
+                niches.append({
+                    "niche": niche,
+                    "revenue": n_rev,
+                    "spend": n_spend,
+                    "tacos": (n_spend / n_rev * 100) if n_rev else 0.0,
+                    "active_skus": 0 if hashes is None else int(hashes.size),
+                    "rows": n_rows,
+                })
+                revenue += n_rev or 0.0
+                spend += n_spend or 0.0
+                rows += n_rows
+            first, last = totals["first_date"].min(), totals["last_date"].max()
+        if not all_skus:
+            active = 0
+        elif len(all_skus) == 1:
+            active = int(all_skus[0].size)
+        else:
+            active = int(np.unique(np.concatenate(all_skus)).size)
+        return {
+            "revenue": revenue,
+            "spend": spend,
+            "tacos": (spend / revenue * 100) if revenue else 0.0,
+            "active_skus": active,
+            "rows": rows,
+            "first_date": first.isoformat() if first is not None else None,
+            "last_date": last.isoformat() if last is not None else None,
+            "niches": niches,
+        }
+
+    def summary(self, context: UserContext) -> Dict[str, Any]:
+        """
+        KPI theo quyền của user (RLS: chỉ cộng các niche được phép).
+        Returns: dict revenue / spend / tacos / active_skus / rows / first_date / last_date / niches / version.
+        """
+        self.refresh()
+        with self._lock:
+            # Đọc version trong lock: refresh của thread khác có thể vừa swap sang data mới
+            version = self._version
+            key = (version, permission_hash(context))
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return {**cached, "cached": True}
+            self.misses += 1
+            result = self._build(context)
+            result["version"] = version
+            self._cache[key] = result
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return {**result, "cached": False}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "version": self._version,
+                "files": len(self._partials),
+                "files_scanned": self.files_scanned,
+                "cache_entries": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
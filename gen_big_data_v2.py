@@ -1,69 +1,203 @@
-import duckdb
-import pandas as pd
-import numpy as np
+import argparse
+import math
 import os
 import time
+from typing import Any, Dict, Optional, Sequence
+
+import duckdb
+import pyarrow.parquet as pq
 
 # Config
 SOURCE_FILE = "../scrape_tool/exports/Master_PPC_Data.parquet"
 TARGET_FILE = "../scrape_tool/exports/Big_Master_PPC_Data.parquet"
 TARGET_ROWS = 1_000_000
 
-def generate_big_data():
-    print(f"🚀 Loading original data from {SOURCE_FILE}...")
-    
-    # Load original data
-    con = duckdb.connect()
-    original_df = con.execute(f"SELECT * FROM read_parquet('{SOURCE_FILE}')").df()
-    original_rows = len(original_df)
-    
-    print(f"✅ Loaded {original_rows} rows.")
-    
-    if original_rows == 0:
-        print("❌ Source file is empty!")
-        return
-
-    # Calculate multiplier
-    multiplier = (TARGET_ROWS // original_rows) + 1
-    print(f"🔄 Need to replicate {multiplier} times to reach {TARGET_ROWS} rows...")
-    
-    dfs = []
-    
-    for i in range(multiplier):
-        batch = original_df.copy()
-        
-        # Masking / Randomization
-        # 1. Modify SKU & ASIN to look unique
-        suffix = f"_FAKE_{i}"
-        if "SKU" in batch.columns:
-            batch["SKU"] = batch["SKU"].astype(str) + suffix
-        if "ASIN" in batch.columns:
-            batch["ASIN"] = batch["ASIN"].astype(str) + suffix
-            
-        # 2. Jitter Metrics (Revenue, Spend) +/- 10%
-        if "Revenue (Actual)" in batch.columns:
-            jitter = np.random.uniform(0.9, 1.1, size=len(batch))
-            batch["Revenue (Actual)"] = batch["Revenue (Actual)"] * jitter
-            
-        if "Ads Spend (Actual)" in batch.columns:
-            jitter = np.random.uniform(0.9, 1.1, size=len(batch))
-            batch["Ads Spend (Actual)"] = batch["Ads Spend (Actual)"] * jitter
-
-        dfs.append(batch)
-    
-    print("🧩 Concatenating batches...")
-    big_df = pd.concat(dfs, ignore_index=True)
-    
-    # Trim to exact target
-    big_df = big_df.head(TARGET_ROWS)
-    print(f"📊 Final DataFrame shape: {big_df.shape}")
-    
-    print(f"💾 Saving to {TARGET_FILE}...")
-    start_time = time.time()
-    big_df.to_parquet(TARGET_FILE, compression='snappy')
-    end_time = time.time()
-    
-    print(f"✅ DONE! Saved 1M rows in {end_time - start_time:.2f} seconds.")
+BRAND_COL = "Main niche"
+DATE_COL = "Report_Date"
+UNIQUE_COLS = ("SKU", "ASIN")
+JITTER_COLS = ("Revenue (Actual)", "Ads Spend (Actual)")
+# Số dòng mỗi lần DuckDB sinh + sort (RAM cỡ 1 chunk, không phụ thuộc TARGET_ROWS)
+CHUNK_ROWS = 1_000_000
+ROW_GROUP_ROWS = 122_880
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _lit(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _select_list(types: Dict[str, str], seed: int, jitter: float,
+                 jitter_cols: Sequence[str], date_periods: int, date_span: int,
+                 niches: Optional[int], n_niches: int) -> str:
+    """Biểu thức SELECT cho 1 bản copy `c.k` của dòng nguồn `s` (cùng thứ tự cột với file nguồn)."""
+    exprs = []
+    for j, (col, col_type) in enumerate(types.items()):
+        ref = f"s.{_q(col)}"
+        if col in UNIQUE_COLS:
+            # SKU / ASIN khác nhau giữa các bản copy (giống bản cũ: "<giá trị>_FAKE_<i>")
+            expr = f"CAST({ref} AS VARCHAR) || '_FAKE_' || CAST(c.k AS VARCHAR)"
+        elif col in jitter_cols and jitter:
+            # Nhân hệ số đều trong [1 - jitter, 1 + jitter]; hash(seed, copy, dòng, cột) -> tái lập được
+            rand = f"(hash({seed}, c.k, s.__rid, {j}) % 2000001)::DOUBLE / 1000000.0 - 1.0"
+            expr = f"CAST({ref} * (1.0 + {jitter} * ({rand})) AS {col_type})"
+        elif col == DATE_COL and date_periods > 1:
+            # Bản copy k lùi (k % periods) * span ngày -> lịch sử dài hơn nhưng vẫn giữ mùa vụ của nguồn
+            shift = f"CAST((c.k % {date_periods}) * {date_span} AS INTEGER)"
+            if col_type in ("DATE", "VARCHAR"):
+                expr = f"CAST(CAST({ref} AS DATE) - {shift} AS {col_type})"
+            else:
+                expr = f"{ref} - to_days({shift})"
+        elif col == BRAND_COL and niches and n_niches:
+            expr = "n.name"
+        else:
+            expr = ref
+        exprs.append(f"{expr} AS {_q(col)}")
+    return ",\n    ".join(exprs)
+
+
+def generate_big_data(source: str = SOURCE_FILE, target: str = TARGET_FILE, rows: int = TARGET_ROWS,
+                      seed: int = 42, jitter: float = 0.1, jitter_cols: Sequence[str] = JITTER_COLS,
+                      date_range_days: Optional[int] = None, niches: Optional[int] = None,
+                      chunk_rows: int = CHUNK_ROWS, row_group_rows: int = ROW_GROUP_ROWS,
+                      compression: str = "snappy", memory_limit: str = "1GB") -> Dict[str, Any]:
+    """
+    Nhân bản `source` thành `rows` dòng và ghi streaming ra `target`.
+    - DuckDB sinh từng chunk (~chunk_rows dòng = nhiều bản copy của nguồn), ParquetWriter ghi
+      từng row group -> RAM cỡ nguồn + 1 chunk, không phụ thuộc `rows` (10M-100M dòng vẫn chạy được).
+    - jitter: Revenue / Ads Spend nhân hệ số ngẫu nhiên trong [1 - jitter, 1 + jitter].
+    - date_range_days: giãn Report_Date ra khoảng ~N ngày (các bản copy lùi dần theo độ dài khoảng ngày của nguồn).
+    - niches: số niche khác nhau của output (ít hơn nguồn -> gộp, nhiều hơn -> thêm "<niche> #2", ...).
+    - seed: cùng seed + cùng tham số -> file output giống hệt.
+    Returns: {"rows", "row_groups", "seconds", "path"}.
+    """
+    started = time.time()
+    con = duckdb.connect(":memory:")
+    try:
+        con.execute(f"SET memory_limit = {_lit(memory_limit)}")
+        con.execute("SET preserve_insertion_order = true")
+        con.execute(
+            f"CREATE TEMP TABLE raw AS SELECT * EXCLUDE (file_row_number), file_row_number AS __rid "
+            f"FROM read_parquet({_lit(source)}, file_row_number = true)"
+        )
+        types = {
+            name: col_type
+            for name, col_type, *_ in con.execute("DESCRIBE raw").fetchall()
+            if name != "__rid"
+        }
+        n_src = con.execute("SELECT COUNT(*) FROM raw").fetchone()[0]
+        print(f"✅ Loaded {n_src:,} rows from {source}.")
+        if n_src == 0:
+            raise ValueError("Source file is empty!")
+
+        n_niches = 0
+        if niches and BRAND_COL in types:
+            con.execute(f"""
+                CREATE TEMP TABLE niche_rank AS
+                SELECT niche, CAST(row_number() OVER (ORDER BY niche) - 1 AS BIGINT) AS nr
+                FROM (SELECT DISTINCT {_q(BRAND_COL)} AS niche FROM raw WHERE {_q(BRAND_COL)} IS NOT NULL)
+            """)
+            n_niches = con.execute("SELECT COUNT(*) FROM niche_rank").fetchone()[0]
+            con.execute(f"""
+                CREATE TEMP TABLE niche_names AS
+                SELECT i AS idx, r.niche || CASE WHEN i >= {n_niches} THEN ' #' || CAST(i // {n_niches} + 1 AS VARCHAR) ELSE '' END AS name
+                FROM range({niches}) t(i) JOIN niche_rank r ON r.nr = i % {n_niches}
+            """)
+            con.execute(f"""
+                CREATE TEMP TABLE src AS
+                SELECT raw.*, niche_rank.nr AS __nr FROM raw LEFT JOIN niche_rank ON raw.{_q(BRAND_COL)} = niche_rank.niche
+            """)
+        else:
+            con.execute("CREATE TEMP VIEW src AS SELECT * FROM raw")
+
+        date_periods, date_span = 1, 0
+        if date_range_days and DATE_COL in types:
+            lo, hi = con.execute(
+                f"SELECT MIN(CAST({_q(DATE_COL)} AS DATE)), MAX(CAST({_q(DATE_COL)} AS DATE)) FROM raw"
+            ).fetchone()
+            if lo is not None:
+                date_span = (hi - lo).days + 1
+                date_periods = max(1, math.ceil(date_range_days / date_span))
+
+        select = _select_list(types, seed, jitter, tuple(jitter_cols), date_periods, date_span,
+                              niches, n_niches)
+        join = ""
+        if n_niches:
+            # Niche thứ r của nguồn, bản copy k -> niche số (r + (k % variants) * n) % niches
+            variants = math.ceil(niches / n_niches)
+            join = (f"LEFT JOIN niche_names n "
+                    f"ON n.idx = (s.__nr + (c.k % {variants}) * {n_niches}) % {niches}")
+        copies = math.ceil(rows / n_src)
+        copies_per_chunk = max(1, chunk_rows // n_src)
+        print(f"🔄 Replicating {copies:,} times to reach {rows:,} rows ({copies_per_chunk:,} copies per chunk)...")
+
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        tmp_path = f"{target}.tmp"
+        written = row_groups = 0
+        writer = None
+        try:
+            for first in range(0, copies, copies_per_chunk):
+                last = min(first + copies_per_chunk, copies)
+                result = con.execute(f"""
+                    SELECT
+                        {select}
+                    FROM src s CROSS JOIN range({first}, {last}) c(k) {join}
+                    WHERE c.k * {n_src} + s.__rid < {rows}
+                    ORDER BY c.k, s.__rid
+                """)
+                if hasattr(result, "to_arrow_reader"):
+                    reader = result.to_arrow_reader(row_group_rows)
+                else:
+                    reader = result.fetch_record_batch(row_group_rows)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, reader.schema, compression=compression)
+                for batch in reader:
+                    if batch.num_rows:
+                        writer.write_batch(batch, row_group_size=row_group_rows)
+                        written += batch.num_rows
+                        row_groups += 1
+                print(f"🧩 {written:,}/{rows:,} rows written")
+        except BaseException:
+            if writer is not None:
+                writer.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        writer.close()
+        os.replace(tmp_path, target)
+    finally:
+        con.close()
+
+    seconds = time.time() - started
+    print(f"✅ DONE! Saved {written:,} rows to {target} in {seconds:.2f} seconds.")
+    return {"rows": written, "row_groups": row_groups, "seconds": seconds, "path": target}
+
 
 if __name__ == "__main__":
-    generate_big_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu PPC lớn (streaming) từ master Parquet.")
+    parser.add_argument("--source", default=SOURCE_FILE)
+    parser.add_argument("--target", default=TARGET_FILE)
+    parser.add_argument("--rows", type=int, default=TARGET_ROWS)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--jitter", type=float, default=0.1, help="Biên độ nhiễu Revenue / Ads Spend (0.1 = ±10%%)")
+    parser.add_argument("--date-range-days", type=int, default=None, help="Giãn Report_Date ra ~N ngày")
+    parser.add_argument("--niches", type=int, default=None, help="Số niche khác nhau của output")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--compression", default="snappy")
+    parser.add_argument("--memory-limit", default="1GB")
+    args = parser.parse_args()
+
+    generate_big_data(
+        source=args.source,
+        target=args.target,
+        rows=args.rows,
+        seed=args.seed,
+        jitter=args.jitter,
+        date_range_days=args.date_range_days,
+        niches=args.niches,
+        chunk_rows=args.chunk_rows,
+        compression=args.compression,
+        memory_limit=args.memory_limit,
+    )
@@ -3,6 +3,10 @@ import sys
 import streamlit as st
 from dotenv import load_dotenv
 
+from core.catalog import load_catalog
+from core.context import UserContext, get_user_context
+from core.summary import KpiSummary
+
 load_dotenv()
 
 # Setup page config
@@ -13,18 +17,58 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
+DATA_PATH = os.getenv("DATA_PATH") or load_catalog(os.getenv("CATALOG_PATH")).primary.path
+
+
+# KPI tổng hợp theo niche (cache theo dataset version + quyền) -> trang chủ không quét raw data
+@st.cache_resource
+def init_summary(data_path):
+    return KpiSummary(data_path, "Main niche")
+
+
 # Title (Generic & Clean)
 st.title("🚀 PPC Analytics Hub")
 
+with st.sidebar:
+    token_option = st.selectbox(
+        "Access Role:",
+        ["admin_secret", "group_ab", "group_bc", "group_ac"],
+        format_func=lambda x: {
+            "admin_secret": "👑 Full Admin",
+            "group_ab": "🛒 Sales (Niche A-B)",
+            "group_bc": "🛒 Sales (Niche B-C)",
+            "group_ac": "🛒 Sales (Niche A-C)",
+        }.get(x, x),
+    )
+
+overview = None
+if os.path.exists(DATA_PATH):
+    try:
+        summary = init_summary(DATA_PATH)
+        admin = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+        all_niches = [n["niche"] for n in summary.summary(admin)["niches"] if n["niche"]]
+        overview = summary.summary(get_user_context(token_option, all_niches))
+    except Exception as e:
+        st.error(f"Lỗi đọc dữ liệu: {e}")
+
 # Quick Stats Overview
 st.subheader("📌 System Status")
 col1, col2, col3 = st.columns(3)
-with col1:
-    st.metric(label="Last Sync", value="Today", delta="Ready")
-with col2:
-    st.metric(label="Active SKUs", value="--", delta="N/A")
-with col3:
-    st.metric(label="Ad Spend", value="--", delta="N/A")
+if overview is not None:
+    with col1:
+        st.metric(label="Last Sync", value=overview["last_date"] or "--", delta=f"{overview['rows']:,} rows")
+    with col2:
+        st.metric(label="Active SKUs", value=f"{overview['active_skus']:,}", delta=f"{len(overview['niches'])} niches")
+    with col3:
+        st.metric(label="Ad Spend", value=f"${overview['spend']:,.2f}", delta=f"TACOS {overview['tacos']:.2f}%",
+                  delta_color="off")
+else:
+    with col1:
+        st.metric(label="Last Sync", value="--", delta="No data")
+    with col2:
+        st.metric(label="Active SKUs", value="--", delta="N/A")
+    with col3:
+        st.metric(label="Ad Spend", value="--", delta="N/A")
 
 st.markdown("---")
-st.info("👈 Select **Dashboard** to view reports or **AI Assistant** to query data.")
\ No newline at end of file
+st.info("👈 Select **Dashboard** to view reports or **AI Assistant** to query data.")
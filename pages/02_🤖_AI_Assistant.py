@@ -1,7 +1,6 @@
 import os
 from datetime import datetime
 
-import sqlglot
 import streamlit as st
 from dotenv import load_dotenv
 
@@ -108,6 +107,11 @@ from core.agent import PerformanceAgent
 from core.ai import AIEngine
 from core.context import get_user_context
 from core.engine import DataEngine
+from core.parsed_query import parse_query
+from core.profiling import format_profile
+from core.question_cache import QuestionCache
+from core.rollups import default_rollups
+from core.catalog import load_catalog
 
 
 # --- MOCK ENGINE FOR DEMO ---
@@ -145,12 +149,20 @@ class MockAIEngine:
 # --- CORE INITIALIZATION ---
 @st.cache_resource
 def init_agent(api_key, data_path, use_mock=False):
-    data_engine = DataEngine(data_path, brand_col="Main niche")
+    data_engine = DataEngine(
+        data_path,
+        brand_col="Main niche",
+        rollups=default_rollups("Main niche"),
+        datasets=load_catalog(os.getenv("CATALOG_PATH")).secondary,
+    )
     if use_mock:
         ai_engine = MockAIEngine()
     else:
         ai_engine = AIEngine(api_key)
-    return PerformanceAgent(data_engine, ai_engine)
+    # Mock trả lời tức thì -> không cần cache câu hỏi
+    question_cache = None if use_mock else QuestionCache(
+        os.getenv("QUESTION_CACHE_PATH", "../scrape_tool/exports/question_cache.jsonl"))
+    return PerformanceAgent(data_engine, ai_engine, question_cache=question_cache)
 
 
 @st.cache_data
@@ -196,14 +208,14 @@ def render_export_buttons(df, key_suffix):
 
 # --- SETUP ENV & PATHS ---
 api_key = os.getenv("GEMINI_API_KEY")
-DATA_PATH = os.path.abspath("../scrape_tool/exports/Big_Master_PPC_Data.parquet")
-if not os.path.exists(DATA_PATH):
-    DATA_PATH = os.path.abspath("../scrape_tool/exports/Master_PPC_Data.parquet")
+CATALOG = load_catalog(os.getenv("CATALOG_PATH"))
+DATA_PATH = CATALOG.primary.path
 
 # --- SIDEBAR: SETTINGS ---
 with st.sidebar:
     st.header("Settings")
     use_mock = st.toggle("🛠️ Demo / Mock Mode", value=False)
+    profile_queries = st.toggle("🔬 Profile DuckDB Queries", value=False)
     with st.expander("👤 User Identity", expanded=True):
         token_option = st.selectbox(
             "Access Role:",
@@ -262,15 +274,15 @@ for i, msg in enumerate(st.session_state.messages):
             if "metrics" in msg and msg["metrics"]:
                 m = msg["metrics"]
                 metrics_info = f" | ⏱️ AI: {m.get('ai_thinking', 0):.2f}s | ⚡ DB: {m.get('db_execution', 0):.3f}s"
+                if m.get("rollup"):
+                    metrics_info += f" | 📦 Rollup: {m['rollup']}"
 
             with st.expander(f"Technical Details (SQL){metrics_info}"):
-                try:
-                    formatted_sql = sqlglot.transpile(
-                        msg["sql"], read="duckdb", pretty=True
-                    )[0]
-                except:
-                    formatted_sql = msg["sql"]
+                # Format sẵn từ Agent; tin nhắn cũ thì parse (LRU cache -> rerun không parse lại)
+                formatted_sql = msg.get("sql_pretty") or parse_query(msg["sql"]).pretty
                 st.code(formatted_sql, language="sql")
+                if msg.get("metrics", {}).get("profile"):
+                    st.code(format_profile(msg["metrics"]["profile"]), language="text")
 
 # --- USER INPUT ---
 if prompt := st.chat_input("Nhập câu hỏi..."):
@@ -281,7 +293,7 @@ if prompt := st.chat_input("Nhập câu hỏi..."):
         with st.status("Đang xử lý yêu cầu...", expanded=True) as status:
             st.write("🧠 Đang phân tích ý định (AI Thinking)...")
             response = agent.process_request(
-                prompt, user_ctx, st.session_state.messages
+                prompt, user_ctx, st.session_state.messages, profile=profile_queries
             )
 
             metrics = response.get("metrics", {})
@@ -302,16 +314,14 @@ if prompt := st.chat_input("Nhập câu hỏi..."):
                 render_export_buttons(df, f"new_{int(datetime.now().timestamp())}")
 
                 # Show SQL Expander in new message
+                rollup_info = f" | 📦 Rollup: {metrics['rollup']}" if metrics.get("rollup") else ""
                 with st.expander(
-                    f"Technical Details (SQL) | ⏱️ AI: {ai_time:.2f}s | ⚡ DB: {db_time:.3f}s"
+                    f"Technical Details (SQL) | ⏱️ AI: {ai_time:.2f}s | ⚡ DB: {db_time:.3f}s{rollup_info}"
                 ):
-                    try:
-                        formatted_sql = sqlglot.transpile(
-                            response["sql"], read="duckdb", pretty=True
-                        )[0]
-                    except:
-                        formatted_sql = response["sql"]
+                    formatted_sql = response.get("sql_pretty") or parse_query(response["sql"]).pretty
                     st.code(formatted_sql, language="sql")
+                    if metrics.get("profile"):
+                        st.code(format_profile(metrics["profile"]), language="text")
 
                 st.session_state.messages.append(
                     {
@@ -319,6 +329,7 @@ if prompt := st.chat_input("Nhập câu hỏi..."):
                         "content": response["message"],
                         "data": df,
                         "sql": response["sql"],
+                        "sql_pretty": formatted_sql,
                         "metrics": metrics,
                     }
                 )
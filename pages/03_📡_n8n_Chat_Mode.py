@@ -5,7 +5,9 @@ import json
 from datetime import datetime
 from dotenv import load_dotenv
 import pandas as pd
-import sqlglot
+
+from core.parsed_query import parse_query
+from core.profiling import format_profile
 
 load_dotenv()
 
@@ -107,6 +109,44 @@ st.divider()
 
 # --- CONFIG ---
 DEFAULT_WEBHOOK = os.getenv("N8N_WEBHOOK_URL", "http://localhost:5678/webhook/query-agent")
+# API gốc (FastAPI) -> lấy các page sau page đầu qua /data/page
+API_URL = os.getenv("API_URL", "http://localhost:8001")
+PAGE_FETCH_SIZE = 10000
+
+
+def fetch_remaining_pages(token, cursor, first_page):
+    """Đi theo cursor qua /data/page để lấy nốt các dòng sau page đầu (API kiểm tra lại quyền ở mỗi page)."""
+    auth = requests.post(f"{API_URL}/auth/context", json={"token": token}, timeout=30)
+    auth.raise_for_status()
+    frames, offset = [first_page], len(first_page)
+    while offset is not None:
+        res = requests.post(f"{API_URL}/data/page", json={
+            "cursor": cursor, "user_context": auth.json(), "offset": offset,
+            "page_size": PAGE_FETCH_SIZE, "format": "columnar",
+        }, timeout=60)
+        if res.status_code == 410:
+            raise ValueError("Cursor đã hết hạn, hãy gửi lại câu hỏi.")
+        res.raise_for_status()
+        page = res.json()
+        frames.append(pd.DataFrame(page["data"], columns=page["columns"]))
+        offset = page.get("next_offset")
+    return pd.concat(frames, ignore_index=True)
+
+
+def render_load_all(msg, key):
+    """Kết quả mới có page đầu -> nút tải toàn bộ (thay data của message bằng kết quả đầy đủ)."""
+    data, total = msg.get("data"), msg.get("total_rows")
+    if data is None or not msg.get("cursor") or not total or len(data) >= total:
+        return
+    st.caption(f"Hiển thị {len(data):,} / {total:,} dòng (page đầu).")
+    if st.button(f"⬇️ Tải toàn bộ {total:,} dòng", key=key):
+        with st.spinner("Đang tải các page còn lại..."):
+            try:
+                msg["data"] = fetch_remaining_pages(msg["token"], msg["cursor"], data)
+            except Exception as e:
+                st.error(f"Không tải được toàn bộ kết quả: {e}")
+                return
+        st.rerun()
 
 # --- SESSION STATE ---
 if "n8n_messages" not in st.session_state:
@@ -134,7 +174,7 @@ with st.sidebar:
         st.rerun()
 
 # --- CHAT INTERFACE ---
-for msg in st.session_state.n8n_messages:
+for idx, msg in enumerate(st.session_state.n8n_messages):
     with st.chat_message(msg["role"]):
         st.markdown(msg["content"])
         
@@ -142,11 +182,13 @@ for msg in st.session_state.n8n_messages:
         if "data" in msg and msg["data"] is not None:
             df = msg["data"]
             st.dataframe(df, use_container_width=True, hide_index=True)
+            render_load_all(msg, key=f"all_{idx}")
+            partial = bool(msg.get("total_rows")) and len(df) < msg["total_rows"]
             
             # Download Button
             csv = df.to_csv(index=False).encode('utf-8')
             st.download_button(
-                label="Download CSV",
+                label="Download CSV (page đầu)" if partial else "Download CSV",
                 data=csv,
                 file_name=f"n8n_export_{datetime.now().strftime('%H%M%S')}.csv",
                 mime='text/csv',
@@ -156,11 +198,10 @@ for msg in st.session_state.n8n_messages:
         # Display SQL
         if "sql" in msg and msg["sql"]:
             with st.expander("Technical Details"):
-                try:
-                    fmt_sql = sqlglot.transpile(msg["sql"], read="duckdb", pretty=True)[0]
-                except:
-                    fmt_sql = msg["sql"]
-                st.code(fmt_sql, language="sql")
+                # LRU cache theo SQL -> rerun không parse lại toàn bộ lịch sử chat
+                st.code(parse_query(msg["sql"]).pretty, language="sql")
+                if msg.get("profile"):
+                    st.code(format_profile(msg["profile"]), language="text")
 
 # --- USER INPUT ---
 if prompt := st.chat_input("Gửi yêu cầu..."):
@@ -181,7 +222,12 @@ if prompt := st.chat_input("Gửi yêu cầu..."):
                 payload = {
                     "question": prompt,
                     "token": token_option,
-                    "history": clean_history
+                    "history": clean_history,
+                    # JSON theo cột (nhẹ hơn list dict theo dòng), pd.DataFrame đọc được trực tiếp
+                    "format": "columnar",
+                    # Kết quả lớn: chỉ nhận page đầu (webhook không vượt timeout 30s), phần còn lại
+                    # qua nút "Tải toàn bộ" (/data/page theo cursor)
+                    "page_size": 1000
                 }
                 
                 status.write("Waiting for Workflow response...")
@@ -201,30 +247,40 @@ if prompt := st.chat_input("Gửi yêu cầu..."):
                     message_text = res_json.get("message", "No message.")
                     sql_text = res_json.get("sql")
                     raw_data = res_json.get("data")
+                    # Profile DuckDB (API /query trả trong metrics, /data/execute trả ở top-level)
+                    profile = res_json.get("profile") or (res_json.get("metrics") or {}).get("profile")
                     
                     st.markdown(message_text)
                     
                     display_data = None
+                    reply = {
+                        "role": "assistant",
+                        "content": message_text,
+                        "data": None,
+                        "sql": sql_text,
+                        "profile": profile,
+                        # Page đầu + cursor -> nút "Tải toàn bộ" đi theo /data/page
+                        "cursor": res_json.get("cursor"),
+                        "total_rows": res_json.get("total_rows"),
+                        "token": token_option,
+                    }
                     if raw_data:
                         display_data = pd.DataFrame(raw_data)
+                        reply["data"] = display_data
                         st.dataframe(display_data, use_container_width=True, hide_index=True)
-                        st.download_button("Download CSV", display_data.to_csv(index=False).encode('utf-8'), "n8n_data.csv", "text/csv")
+                        render_load_all(reply, key=f"all_{len(st.session_state.n8n_messages)}")
+                        partial = bool(reply["total_rows"]) and len(display_data) < reply["total_rows"]
+                        st.download_button("Download CSV (page đầu)" if partial else "Download CSV",
+                                           display_data.to_csv(index=False).encode('utf-8'), "n8n_data.csv", "text/csv")
                         
                     if sql_text:
                         with st.expander("Technical Details"):
-                            try:
-                                fmt_sql = sqlglot.transpile(sql_text, read="duckdb", pretty=True)[0]
-                            except:
-                                fmt_sql = sql_text
-                            st.code(fmt_sql, language="sql")
+                            st.code(parse_query(sql_text).pretty, language="sql")
+                            if profile:
+                                st.code(format_profile(profile), language="text")
                     
                     # Save History
-                    st.session_state.n8n_messages.append({
-                        "role": "assistant",
-                        "content": message_text,
-                        "data": display_data,
-                        "sql": sql_text
-                    })
+                    st.session_state.n8n_messages.append(reply)
                     
                 else:
                     status.update(label="Lỗi kết nối", state="error")
@@ -1,56 +1,102 @@
 import streamlit as st
-import polars as pl
 import plotly.express as px
+import datetime
+import math
 import os
 
+from core.catalog import load_catalog
+from core.context import get_user_context
+from core.downsample import downsample
+from core.dashboard import DATE_COL, REVENUE_COL, SPEND_COL, DashboardFilters, DashboardQueries, summary_kpis
+from core.engine import DataEngine
+from core.rollups import default_rollups
+from core.summary import KpiSummary
+
 st.set_page_config(page_title="Dashboard", page_icon="📊", layout="wide")
 
 st.title("📊 Hiệu suất Quảng cáo (PPC Performance)")
 
-# Load Data (Mock path for now, will update to use config)
-DATA_PATH = "../scrape_tool/exports/Master_PPC_Data.parquet"
+DATA_PATH = os.getenv("DATA_PATH") or load_catalog(os.getenv("CATALOG_PATH")).primary.path
+PAGE_SIZE = 100
+# Số điểm tối đa gửi xuống browser cho mỗi chart (LTTB giữ hình dạng đường)
+CHART_MAX_POINTS = 2000
+
+
+# Engine dùng chung cho mọi session: dataset chỉ load 1 lần trong DuckDB,
+# mỗi session chỉ nhận về kết quả aggregate + 1 page chi tiết.
+@st.cache_resource
+def init_engine(data_path):
+    return DataEngine(data_path, brand_col="Main niche", rollups=default_rollups("Main niche"))
+
+
+@st.cache_resource
+def init_summary(data_path):
+    return KpiSummary(data_path, "Main niche")
 
-@st.cache_data
-def load_data():
-    if os.path.exists(DATA_PATH):
-        try:
-            return pl.read_parquet(DATA_PATH)
-        except Exception as e:
-            st.error(f"Lỗi đọc file Parquet: {e}")
-            return None
-    return None
 
-df = load_data()
+if os.path.exists(DATA_PATH):
+    engine = init_engine(DATA_PATH)
+
+    with st.sidebar:
+        token_option = st.selectbox(
+            "Access Role:",
+            ["admin_secret", "group_ab", "group_bc", "group_ac"],
+            format_func=lambda x: {
+                "admin_secret": "👑 Full Admin",
+                "group_ab": "🛒 Sales (Niche A-B)",
+                "group_bc": "🛒 Sales (Niche B-C)",
+                "group_ac": "🛒 Sales (Niche A-C)",
+            }.get(x, x),
+        )
+    user_ctx = get_user_context(token_option, engine.get_all_brands())
+    queries = DashboardQueries(engine, user_ctx)
 
-if df is not None:
     st.write(f"Dữ liệu cập nhật lần cuối: {os.path.getmtime(DATA_PATH)}")
-    
-    # Filter Date
-    dates = df["Report_Date"].unique().sort()
-    
-    # Top Metrics
-    total_rev = df["Revenue (Actual)"].sum()
-    total_spend = df["Ads Spend (Actual)"].sum()
-    tacos = (total_spend / total_rev * 100) if total_rev else 0
-    
+
+    # Filter Date / Niche (khoảng ngày lấy từ KPI summary, không quét data)
+    overview = init_summary(DATA_PATH).summary(user_ctx)
+    lo, hi = (datetime.date.fromisoformat(overview[k]) if overview[k] else None for k in ("first_date", "last_date"))
+    if lo is None:
+        st.warning("⚠️ Không có dữ liệu trong phạm vi quyền của bạn.")
+        st.stop()
+    f1, f2 = st.columns([1, 2])
+    date_range = f1.date_input("Khoảng ngày", value=(lo, hi), min_value=lo, max_value=hi)
+    visible = engine.get_all_brands() if "ALL" in user_ctx.allowed_brands else user_ctx.allowed_brands
+    niches = f2.multiselect("Niche", sorted(visible))
+    start, end = (date_range[0], date_range[-1]) if isinstance(date_range, (list, tuple)) else (date_range, date_range)
+    filters = DashboardFilters(start, end, niches)
+
+    # Top Metrics: cả khoảng ngày -> cộng từ KPI summary; lọc ngày hẹp hơn -> aggregate query (rollup)
+    kpis = summary_kpis(overview, niches) if (start, end) == (lo, hi) else queries.kpis(filters)
     m1, m2, m3 = st.columns(3)
-    m1.metric("Total Revenue", f"${total_rev:,.2f}")
-    m2.metric("Total Ad Spend", f"${total_spend:,.2f}")
-    m3.metric("TACOS", f"{tacos:.2f}%", delta_color="inverse")
-    
+    m1.metric("Total Revenue", f"${kpis['revenue']:,.2f}")
+    m2.metric("Total Ad Spend", f"${kpis['spend']:,.2f}")
+    m3.metric("TACOS", f"{kpis['tacos']:.2f}%", delta_color="inverse")
+
     # Chart
     st.subheader("📈 Xu hướng doanh thu theo ngày")
-    daily_trend = df.group_by("Report_Date").agg([
-        pl.col("Revenue (Actual)").sum(),
-        pl.col("Ads Spend (Actual)").sum()
-    ]).sort("Report_Date")
-    
-    fig = px.line(daily_trend.to_pandas(), x="Report_Date", y=["Revenue (Actual)", "Ads Spend (Actual)"])
+    daily_trend, _ = downsample(queries.daily_trend(filters), CHART_MAX_POINTS, x=DATE_COL, y=[REVENUE_COL, SPEND_COL])
+    fig = px.line(daily_trend.to_pandas(), x=DATE_COL, y=[REVENUE_COL, SPEND_COL])
     st.plotly_chart(fig, use_container_width=True)
-    
-    # Data Table
+
+    # Data Table (keyset pagination phía server: giữ cursor đầu mỗi trang đã xem, đổi filter / quyền -> về trang 1)
     st.subheader("📋 Chi tiết dữ liệu")
-    st.dataframe(df.to_pandas(), use_container_width=True)
+    pages = max(1, math.ceil(kpis["rows"] / PAGE_SIZE))
+    view_key = (token_option, start, end, tuple(niches))
+    if st.session_state.get("detail_view") != view_key:
+        st.session_state.detail_view = view_key
+        st.session_state.detail_cursors = [None]
+    cursors = st.session_state.detail_cursors
+    detail, next_cursor = queries.detail_page(filters, PAGE_SIZE, after=cursors[-1])
+    prev_col, info_col, next_col = st.columns([1, 4, 1])
+    if prev_col.button("◀ Trước", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if next_col.button("Sau ▶", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
+    info_col.caption(f"Trang {len(cursors):,} / {pages:,} · {kpis['rows']:,} dòng · {PAGE_SIZE} dòng / trang")
+    st.dataframe(detail.to_pandas(), use_container_width=True)
 
 else:
     st.warning("⚠️ Chưa có dữ liệu. Vui lòng sang trang 'Data Admin' để cào dữ liệu mới nhất.")
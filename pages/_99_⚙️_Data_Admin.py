@@ -4,6 +4,10 @@ import os
 import subprocess
 from datetime import datetime, timedelta
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from core.dashboard import DATE_COL
+from core.ingest import DeltaTable, is_incremental, read_date_window
+
 # Add parent dir to sys.path to allow importing from scrape_tool if needed
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../scrape_tool')))
 
@@ -23,6 +27,13 @@ if not check_password():
 
 st.success("🔓 Đã xác thực quyền Admin.")
 
+# Dataset incremental (base + delta, xem core/ingest.py). Mỗi lần cào chỉ ghi thêm 1 delta,
+# không ghi đè master -> API chỉ phải đọc thêm dòng mới, cache / reader không bị reset toàn bộ.
+DELTA_ROOT = os.getenv("DATA_PATH") or "../scrape_tool/exports/ppc_incremental"
+# Scraper vẫn ghi lại file master (toàn bộ lịch sử, dùng cho Dashboard / API đọc thẳng master).
+# Ingest delta đọc từ file này nhưng chỉ lấy khoảng ngày vừa cào.
+SCRAPE_OUTPUT = os.getenv("SCRAPE_OUTPUT") or "../scrape_tool/exports/Master_PPC_Data.parquet"
+
 st.subheader("🛠️ Công cụ Cào dữ liệu (Scraper)")
 
 with st.form("scrape_form"):
@@ -34,6 +45,9 @@ with st.form("scrape_form"):
         
     step = st.selectbox("Chế độ gộp (Granularity)", ["day", "month", "total"])
     dry_run = st.checkbox("Chạy thử (Dry Run) - Không lấy data thật")
+    ingest_delta = st.checkbox("Ingest kết quả dạng delta (không ghi đè master)", value=is_incremental(DELTA_ROOT))
+    scrape_output = st.text_input("File output của scraper (Parquet / CSV, chỉ ingest khoảng ngày vừa cào)",
+                                  value=SCRAPE_OUTPUT)
     
     submitted = st.form_submit_button("🚀 Kích hoạt Scraper")
 
@@ -79,8 +93,51 @@ if submitted:
         
         if process.returncode == 0:
             st.success("✅ Hoàn thành nhiệm vụ!")
+            if ingest_delta and not dry_run:
+                if not is_incremental(DELTA_ROOT):
+                    st.warning(f"Chưa có dataset incremental tại {DELTA_ROOT} (tạo ở mục bên dưới).")
+                elif not os.path.exists(scrape_output):
+                    st.warning(f"Không tìm thấy file output của scraper ({scrape_output}) -> bỏ qua ingest.")
+                else:
+                    rows = read_date_window(scrape_output, DATE_COL, start_date, end_date)
+                    info = DeltaTable(DELTA_ROOT).append(rows)
+                    st.success(f"📥 Đã ingest {info['rows']:,} dòng {start_date} → {end_date} ({info['file']}).")
         else:
             st.error("❌ Có lỗi xảy ra. Vui lòng kiểm tra log.")
             
     except Exception as e:
         st.error(f"Lỗi hệ thống: {e}")
+
+st.subheader("📥 Dataset Incremental (Base + Delta)")
+st.caption(f"Thư mục: `{DELTA_ROOT}` (env DATA_PATH). API tự gộp delta ở background khi vượt ngưỡng.")
+
+if not is_incremental(DELTA_ROOT):
+    master_path = st.text_input("Master Parquet dùng làm base", value="../scrape_tool/exports/Master_PPC_Data.parquet")
+    if st.button("🧱 Khởi tạo dataset incremental"):
+        try:
+            DeltaTable.create(DELTA_ROOT, master_path if os.path.exists(master_path) else None)
+            st.success("✅ Đã tạo dataset. Trỏ DATA_PATH của API vào thư mục này.")
+            st.rerun()
+        except Exception as e:
+            st.error(f"Lỗi: {e}")
+else:
+    table = DeltaTable(DELTA_ROOT)
+    stats = table.stats()
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Data version", stats["data_version"])
+    c2.metric("Delta chờ gộp", stats["deltas"], f"{stats['delta_rows']:,} dòng", delta_color="off")
+    c3.metric("Dung lượng delta / base", f"{stats['delta_bytes'] / 1e6:.1f} / {stats['base_bytes'] / 1e6:.1f} MB")
+
+    upload_path = st.text_input("Ingest thủ công 1 file (Parquet / CSV)")
+    c1, c2 = st.columns(2)
+    with c1:
+        if st.button("📥 Ingest file") and upload_path:
+            try:
+                info = table.append(upload_path)
+                st.success(f"Đã ingest {info['rows']:,} dòng ({info['file']}).")
+            except Exception as e:
+                st.error(f"Lỗi: {e}")
+    with c2:
+        if st.button("🗜️ Gộp toàn bộ delta vào base ngay"):
+            result = table.compact(major=True)
+            st.success(f"Đã gộp {result['files']} file." if result else "Không có delta nào để gộp.")
@@ -0,0 +1,92 @@
+import threading
+import time
+import pandas as pd
+import pytest
+from core.admission import AdmissionController, AdmissionRejectedError
+from core.context import UserContext
+from core.deadline import CancelToken, QueryCancelledError
+from core.engine import DataEngine
+
+ADMIN = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+SALES = UserContext(user_id="u1", role="sales_ab", allowed_brands=["Apple"])
+VIEWER = UserContext(user_id="v1", role="viewer", allowed_brands=["Apple"])
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_caps_concurrency():
+    controller = AdmissionController(max_concurrent=2)
+    first = controller.acquire(ADMIN)
+    second = controller.acquire(ADMIN)
+    assert (first.active, second.active) == (1, 2)
+    assert set(second.to_dict()) == {"wait_ms", "queue_depth", "active"}
+    with pytest.raises(AdmissionRejectedError, match="waited"):
+        controller.acquire(ADMIN, timeout=0.05)
+    controller.release()
+    controller.release()
+    stats = controller.stats()
+    assert stats["active"] == 0 and stats["timed_out"] == 1
+
+def test_queue_priority_by_role():
+    controller = AdmissionController(max_concurrent=1)
+    controller.acquire(ADMIN)
+    order = []
+
+    def worker(ctx):
+        with controller.admit(ctx):
+            order.append(ctx.role)
+
+    threads = [threading.Thread(target=worker, args=(ctx,)) for ctx in (VIEWER, SALES, ADMIN)]
+    for i, t in enumerate(threads):
+        t.start()
+        wait_for(lambda: controller.stats()["queue_depth"] == i + 1)
+    controller.release()
+    for t in threads:
+        t.join(2)
+    # Role prefix "sales_ab" -> ưu tiên của "sales"
+    assert order == ["admin", "sales_ab", "viewer"]
+    assert controller.stats()["queue_depth_max"] == 3
+
+def test_bounded_queue_rejects_immediately():
+    controller = AdmissionController(max_concurrent=1, max_queue=1)
+    controller.acquire(ADMIN)
+    waiter = threading.Thread(target=lambda: controller.admit(ADMIN).__enter__())
+    waiter.start()
+    wait_for(lambda: controller.stats()["queue_depth"] == 1)
+    with pytest.raises(AdmissionRejectedError) as exc:
+        controller.acquire(ADMIN)
+    assert exc.value.to_dict()["error"] == "server_busy"
+    assert controller.stats()["rejected"] == 1
+    controller.release()
+    waiter.join(2)
+
+def test_cancel_while_queued():
+    controller = AdmissionController(max_concurrent=1)
+    controller.acquire(ADMIN)
+    token = CancelToken()
+    threading.Timer(0.05, token.cancel).start()
+    with pytest.raises(QueryCancelledError):
+        controller.acquire(SALES, cancel_token=token)
+    assert controller.stats()["queue_depth"] == 0
+
+def test_engine_reports_admission_metrics(tmp_path):
+    p = tmp_path / "sales.parquet"
+    pd.DataFrame({"Main niche": ["Apple", "Banana"], "Revenue": [1.0, 2.0]}).to_parquet(p)
+    controller = AdmissionController(max_concurrent=1)
+    engine = DataEngine(str(p), brand_col="Main niche", admission=controller, threads=2)
+
+    metrics = {}
+    assert engine.execute_query("SELECT SUM(Revenue) FROM secure_sales", SALES, metrics=metrics).item(0, 0) == 1.0
+    assert metrics["admission"]["wait_ms"] == 0.0
+    assert engine.admission_stats()["admitted"] == 1
+
+    # Chờ slot quá deadline của request -> từ chối, kể cả stream (không giữ cursor)
+    controller.acquire(ADMIN)
+    with pytest.raises(AdmissionRejectedError):
+        engine.execute_query_stream("SELECT * FROM secure_sales", ADMIN, timeout=0.05)
+    controller.release()
+    assert engine.admission_stats()["active"] == 0
+    assert engine.pool_stats()["in_use"] == 0
@@ -0,0 +1,266 @@
+import importlib
+import json
+import pytest
+import pandas as pd
+import pyarrow as pa
+from fastapi.testclient import TestClient
+from core.engine import DataEngine
+from core.question_cache import QuestionCache
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    p = tmp_path / "api_sales.parquet"
+    pd.DataFrame({
+        "Main niche": ["Apple", "Banana", "Cherry"] * 1000,
+        "Revenue": [1.0] * 3000
+    }).to_parquet(p)
+
+    # api.server khởi tạo engine/AI ở module level -> cần env trước khi import
+    monkeypatch.setenv("GEMINI_API_KEY", "fake-key")
+    monkeypatch.setenv("DATA_PATH", str(p))
+    monkeypatch.setenv("DATA_RESIDENT", "0")
+    server = importlib.import_module("api.server")
+
+    engine = DataEngine(str(p), brand_col="Main niche")
+    monkeypatch.setattr(server, "data_engine", engine)
+    monkeypatch.setattr(server.agent, "data_engine", engine)
+    monkeypatch.setattr(server, "ALL_NICHES", engine.get_all_brands())
+    # Cache câu hỏi riêng cho từng test, không ghi ra file
+    question_cache = QuestionCache()
+    monkeypatch.setattr(server, "question_cache", question_cache)
+    monkeypatch.setattr(server.agent, "question_cache", question_cache)
+    return server
+
+ADMIN = {"user_id": "admin", "role": "admin", "allowed_brands": ["ALL"]}
+SALES_A = {"user_id": "u1", "role": "sales", "allowed_brands": ["Apple"]}
+
+def test_execute_default_json(api):
+    client = TestClient(api.app)
+    res = client.post("/data/execute", json={"sql": "SELECT COUNT(*) AS n FROM secure_sales", "user_context": SALES_A})
+    assert res.status_code == 200
+    assert res.json()["data"] == [{"n": 1000}]
+
+def test_execute_stream_ndjson(api):
+    client = TestClient(api.app)
+    body = {"sql": "SELECT * FROM secure_sales", "user_context": SALES_A, "stream": "ndjson", "batch_size": 256}
+    with client.stream("POST", "/data/execute", json=body) as res:
+        assert res.status_code == 200
+        assert res.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in res.iter_lines() if line]
+    assert len(rows) == 1000
+    assert {r["Main niche"] for r in rows} == {"Apple"}
+
+def test_execute_stream_arrow(api):
+    client = TestClient(api.app)
+    body = {"sql": "SELECT * FROM secure_sales", "user_context": ADMIN, "stream": "arrow"}
+    res = client.post("/data/execute", json=body)
+    assert res.status_code == 200
+    assert pa.ipc.open_stream(res.content).read_all().num_rows == 3000
+    assert api.data_engine.pool_stats()["in_use"] == 0
+
+def test_execute_stream_error_before_body(api):
+    client = TestClient(api.app)
+    body = {"sql": "DROP TABLE raw_sales", "user_context": ADMIN, "stream": "ndjson"}
+    res = client.post("/data/execute", json=body)
+    assert res.status_code == 400
+    assert "Forbidden" in res.json()["detail"]
+
+def test_execute_timeout_returns_408(api):
+    api.data_engine.cost_budgets = {}
+    client = TestClient(api.app)
+    body = {"sql": "SELECT COUNT(*) FROM range(100000000) a, range(100000) b", "user_context": ADMIN, "timeout": 0.5}
+    res = client.post("/data/execute", json=body)
+    assert res.status_code == 408
+    assert res.json()["detail"]["error"] == "query_timeout"
+
+def test_execute_over_budget_returns_422(api):
+    client = TestClient(api.app)
+    body = {"sql": "SELECT COUNT(*) FROM secure_sales a, secure_sales b, secure_sales c", "user_context": SALES_A}
+    res = client.post("/data/execute", json=body)
+    assert res.status_code == 422
+    assert res.json()["detail"]["error"] == "query_too_expensive"
+
+def test_execute_with_profile(api):
+    client = TestClient(api.app)
+    body = {"sql": "SELECT SUM(Revenue) AS rev FROM secure_sales", "user_context": ADMIN, "profile": True}
+    res = client.post("/data/execute", json=body)
+    assert res.status_code == 200
+    assert res.json()["profile"]["operators"]
+
+def test_execute_busy_returns_503(api):
+    from core.admission import AdmissionController
+    controller = AdmissionController(max_concurrent=1, max_queue=0)
+    api.data_engine.admission = controller
+    controller.acquire(ADMIN)
+    client = TestClient(api.app)
+    res = client.post("/data/execute", json={"sql": "SELECT 1", "user_context": ADMIN})
+    assert res.status_code == 503
+    assert res.headers["retry-after"] == "1"
+    assert res.json()["detail"]["error"] == "server_busy"
+    assert client.get("/system/stats").json()["admission"]["rejected"] == 1
+
+def test_blocking_work_does_not_stall_event_loop(api, monkeypatch):
+    import asyncio
+    import time
+    import httpx
+
+    def slow_llm(question, schema_info, history=None):
+        time.sleep(1.0)
+        return {"sql": "SELECT 1", "explanation": "slow"}
+
+    real_execute = api.data_engine.execute_query
+
+    def slow_execute(*args, **kwargs):
+        time.sleep(1.0)
+        return real_execute(*args, **kwargs)
+
+    monkeypatch.setattr(api.ai_engine, "generate_sql", slow_llm)
+    monkeypatch.setattr(api.data_engine, "execute_query", slow_execute)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            slow = [
+                asyncio.create_task(client.post("/agent/generate-sql", json={"question": "q", "schema_info": ""})),
+                asyncio.create_task(client.post("/data/execute", json={"sql": "SELECT 1 AS x", "user_context": ADMIN})),
+            ]
+            await asyncio.sleep(0.1)
+            t0 = time.perf_counter()
+            auth = await client.post("/auth/context", json={"token": "admin"})
+            schema = await client.post("/agent/schema", json=SALES_A)
+            fast_elapsed = time.perf_counter() - t0
+            assert not any(task.done() for task in slow)
+            results = await asyncio.gather(*slow)
+            return auth, schema, fast_elapsed, results
+
+    auth, schema, fast_elapsed, results = asyncio.run(scenario())
+    assert auth.status_code == 200 and schema.status_code == 200
+    # LLM / DuckDB chạy trong pool riêng -> request nhẹ không phải đợi 1s của request nặng
+    assert fast_elapsed < 0.5
+    assert [r.status_code for r in results] == [200, 200]
+    assert results[1].json()["data"] == [{"x": 1}]
+
+def test_execute_content_negotiation(api):
+    import io
+    import polars as pl
+    client = TestClient(api.app)
+    body = {"sql": 'SELECT "Main niche", Revenue FROM secure_sales', "user_context": SALES_A}
+
+    res = client.post("/data/execute", json=body, headers={"Accept": "application/vnd.ppc.columnar+json"})
+    assert res.headers["content-type"].startswith("application/vnd.ppc.columnar+json")
+    payload = res.json()
+    assert payload["rows"] == 1000 and payload["columns"] == ["Main niche", "Revenue"]
+    assert pd.DataFrame(payload["data"])["Main niche"].unique().tolist() == ["Apple"]
+
+    res = client.post("/data/execute", json=body, headers={"Accept": "application/json;q=0.5, application/vnd.apache.arrow.stream"})
+    assert res.headers["x-rows"] == "1000"
+    assert pa.ipc.open_stream(res.content).read_all().num_rows == 1000
+
+    res = client.post("/data/execute", json={**body, "format": "parquet"})
+    assert res.headers["content-type"] == "application/vnd.apache.parquet"
+    assert pl.read_parquet(io.BytesIO(res.content)).shape == (1000, 2)
+
+    # Mặc định vẫn là list dict theo dòng
+    assert client.post("/data/execute", json=body).json()["data"][0] == {"Main niche": "Apple", "Revenue": 1.0}
+    assert client.post("/data/execute", json={**body, "format": "xml"}).status_code == 400
+
+def test_query_columnar_format(api):
+    client = TestClient(api.app)
+    res = client.post("/query", json={"question": "SELECT SUM(Revenue) AS rev FROM secure_sales",
+                                      "token": "admin_secret", "format": "columnar"})
+    payload = res.json()
+    assert payload["status"] == "success"
+    assert payload["data"] == {"rev": [3000.0]}
+    assert "db_execution" in payload["metrics"]
+
+    res = client.post("/query", json={"question": "SELECT SUM(Revenue) AS rev FROM secure_sales", "token": "admin_secret"},
+                      headers={"Accept": "application/vnd.apache.arrow.stream"})
+    assert res.headers["x-status"] == "success"
+    assert pa.ipc.open_stream(res.content).read_all().column("rev").to_pylist() == [3000.0]
+
+def test_execute_paginated(api):
+    client = TestClient(api.app)
+    body = {"sql": 'SELECT "Main niche", Revenue FROM secure_sales', "user_context": SALES_A, "page_size": 400}
+    res = client.post("/data/execute", json=body).json()
+    assert res["rows"] == 400 and res["total_rows"] == 1000 and res["next_offset"] == 400
+    cursor = res["cursor"]
+
+    page = client.post("/data/page", json={"cursor": cursor, "user_context": SALES_A, "offset": 800, "page_size": 400})
+    assert page.json()["rows"] == 200 and page.json()["next_offset"] is None
+    assert {r["Main niche"] for r in page.json()["data"]} == {"Apple"}
+
+    # Quyền được kiểm tra lại ở mỗi page
+    other = {"user_id": "u2", "role": "sales", "allowed_brands": ["Banana"]}
+    assert client.post("/data/page", json={"cursor": cursor, "user_context": other}).status_code == 403
+
+    page = client.post("/data/page", json={"cursor": cursor, "user_context": SALES_A, "format": "columnar"})
+    assert page.json()["data"]["Revenue"] == [1.0] * 1000 and page.json()["cursor"] == cursor
+
+    assert client.request("DELETE", f"/data/page/{cursor}", json=SALES_A).json() == {"closed": True}
+    assert client.post("/data/page", json={"cursor": cursor, "user_context": SALES_A}).status_code == 410
+
+def test_query_paginated_small_result_has_no_cursor(api):
+    client = TestClient(api.app)
+    res = client.post("/query", json={"question": "SELECT SUM(Revenue) AS rev FROM secure_sales",
+                                      "token": "admin_secret", "page_size": 10}).json()
+    assert res["data"] == [{"rev": 3000.0}]
+    assert res["total_rows"] == 1 and res["cursor"] is None
+
+def test_execute_downsample(api):
+    client = TestClient(api.app)
+    body = {"sql": 'SELECT range AS t, sin(range / 50.0) AS v FROM range(3000)', "user_context": ADMIN,
+            "downsample": {"max_points": 200}}
+    payload = client.post("/data/execute", json=body).json()
+    assert payload["rows"] <= 200
+    assert payload["downsampled"]["original_rows"] == 3000
+    assert payload["data"][0]["t"] == 0 and payload["data"][-1]["t"] == 2999
+
+    body["downsample"] = {"max_points": 200, "method": "minmax", "y": ["missing"]}
+    assert client.post("/data/execute", json=body).status_code == 400
+    body["downsample"] = {"max_points": 200}
+    assert client.post("/data/execute", json={**body, "page_size": 10}).status_code == 400
+
+def test_metrics_summary_rls_and_etag(api, monkeypatch):
+    from core.summary import KpiSummary
+    monkeypatch.setattr(api, "kpi_summary", KpiSummary(api.data_engine.db_path, "Main niche",
+                                                       revenue_col="Revenue"))
+    client = TestClient(api.app)
+    res = client.post("/metrics/summary", json=SALES_A)
+    assert res.status_code == 200
+    payload = res.json()
+    assert payload["revenue"] == 1000.0 and payload["rows"] == 1000
+    assert [n["niche"] for n in payload["niches"]] == ["Apple"]
+    assert client.post("/metrics/summary", json=ADMIN).json()["revenue"] == 3000.0
+
+    etag = res.headers["etag"]
+    assert client.post("/metrics/summary", json=SALES_A, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/system/stats").json()["summary"]["hits"] >= 1
+
+def test_conditional_requests_share_etag_rules(api):
+    client = TestClient(api.app)
+    schema = client.post("/agent/schema", json=SALES_A)
+    summary = client.post("/metrics/summary", json=SALES_A)
+    for path, res in (("/agent/schema", schema), ("/metrics/summary", summary)):
+        etag = res.headers["etag"]
+        bare = etag.strip('"')
+        for header in (etag, bare, f"W/{etag}", f'"stale", {etag}', "*"):
+            again = client.post(path, json=SALES_A, headers={"If-None-Match": header})
+            assert again.status_code == 304 and again.headers["etag"] == etag
+        assert client.post(path, json=SALES_A, headers={"If-None-Match": '"stale", W/"other"'}).status_code == 200
+
+def test_generate_sql_uses_question_cache(api, monkeypatch):
+    calls = []
+
+    def fake_llm(question, schema_info, history=None):
+        calls.append(question)
+        return {"sql": "SELECT * FROM secure_sales LIMIT 10", "explanation": "top rows"}
+
+    monkeypatch.setattr(api.ai_engine, "generate_sql", fake_llm)
+    client = TestClient(api.app)
+    first = client.post("/agent/generate-sql", json={"question": "Cho xem 10 dòng đầu", "schema_info": "s"}).json()
+    second = client.post("/agent/generate-sql", json={"question": "cho xem 5 dong dau", "schema_info": "s"}).json()
+    assert first["cache"] == {"hit": False}
+    assert second["cache"]["hit"] and second["cache"]["match"] == "exact"
+    assert second["sql"] == "SELECT * FROM secure_sales LIMIT 5"
+    assert calls == ["Cho xem 10 dòng đầu"]
+    assert client.get("/system/stats").json()["question_cache"]["hits"] == 1
@@ -0,0 +1,20 @@
+from benchmarks.bench_suite import CORPUS, FakeAI, percentile, run
+
+def test_percentile_interpolates():
+    samples = list(range(1, 101))
+    assert percentile(samples, 50) == 50.5
+    assert percentile(samples, 99) == 99.01
+    assert percentile([7.0], 95) == 7.0
+
+def test_fake_ai_is_deterministic():
+    ai = FakeAI()
+    name, question, sql = CORPUS[0]
+    assert ai.generate_sql(question, "") == {"sql": sql, "explanation": "benchmark"}
+    assert ai.generate_sql("unknown", "")["sql"] is None
+
+def test_suite_smoke(tmp_path):
+    results = run([2000], runs=2, workdir=str(tmp_path), layers=["engine", "agent"], roles=["sales"])
+    assert len(results) == 2 * len(CORPUS)
+    row = results[0]
+    assert {"p50_ms", "p95_ms", "p99_ms", "peak_rss_mb"} <= set(row)
+    assert row["p50_ms"] <= row["p95_ms"] <= row["p99_ms"]
@@ -0,0 +1,104 @@
+import os
+import pytest
+import pandas as pd
+from core.engine import DataEngine
+from core.context import UserContext
+from core.cache import permission_hash
+
+@pytest.fixture
+def cache_data_path(tmp_path):
+    p = tmp_path / "cache_sales.parquet"
+    df = pd.DataFrame({
+        "Brand": ["Brand_A", "Brand_B", "Brand_A"],
+        "Revenue": [100.0, 200.0, 300.0]
+    })
+    df.to_parquet(p)
+    return str(p)
+
+def test_permission_hash_order_insensitive():
+    a = UserContext(user_id="u1", role="sales", allowed_brands=["Brand_A", "Brand_B"])
+    b = UserContext(user_id="u2", role="sales", allowed_brands=["Brand_B", "Brand_A", "Brand_A"])
+    c = UserContext(user_id="u3", role="sales", allowed_brands=["Brand_A"])
+    assert permission_hash(a) == permission_hash(b)
+    assert permission_hash(a) != permission_hash(c)
+
+def test_schema_cache_hit_skips_database(cache_data_path):
+    engine = DataEngine(cache_data_path)
+    ctx = UserContext(user_id="u1", role="sales", allowed_brands=["Brand_A"])
+
+    schema_1, version_1 = engine.get_versioned_schema(ctx)
+    checkouts = engine.pool_stats()["checkouts"]
+    schema_2, version_2 = engine.get_versioned_schema(ctx)
+
+    assert schema_1 == schema_2
+    assert version_1 == version_2
+    assert engine.pool_stats()["checkouts"] == checkouts
+    assert engine.schema_cache.hits == 1
+
+def test_schema_cache_invalidated_on_file_change(cache_data_path):
+    engine = DataEngine(cache_data_path)
+    ctx = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+    _, version_1 = engine.get_versioned_schema(ctx)
+
+    # Scraper ghi đè file -> mtime/size đổi
+    pd.DataFrame({
+        "Brand": ["Brand_A"] * 10,
+        "Revenue": [1.0] * 10
+    }).to_parquet(cache_data_path)
+    os.utime(cache_data_path, ns=(0, 10**18))
+
+    _, version_2 = engine.get_versioned_schema(ctx)
+    assert version_1 != version_2
+    assert engine.schema_cache.misses == 2
+
+def test_result_cache_normalized_hit(cache_data_path):
+    """Khác whitespace / hoa-thường keyword & identifier vẫn dùng chung 1 entry."""
+    engine = DataEngine(cache_data_path)
+    ctx = UserContext(user_id="u1", role="sales", allowed_brands=["Brand_A"])
+
+    m1, m2 = {}, {}
+    df1 = engine.execute_query("SELECT SUM(Revenue) AS total FROM secure_sales WHERE Brand = 'Brand_A'", ctx, metrics=m1)
+    df2 = engine.execute_query("select  sum(Revenue)   as total\n from SECURE_SALES where brand = 'Brand_A'", ctx, metrics=m2)
+
+    assert m1["result_cache_hit"] is False
+    assert m2["result_cache_hit"] is True
+    assert df1.equals(df2)
+    assert engine.pool_stats()["checkouts"] == 1
+
+def test_result_cache_keyed_by_permission(cache_data_path):
+    engine = DataEngine(cache_data_path)
+    ctx_a = UserContext(user_id="u1", role="sales", allowed_brands=["Brand_A"])
+    ctx_b = UserContext(user_id="u2", role="sales", allowed_brands=["Brand_B"])
+
+    sql = "SELECT SUM(Revenue) AS total FROM secure_sales"
+    assert engine.execute_query(sql, ctx_a).item(0, 0) == 400.0
+    # Cùng SQL nhưng quyền khác -> không được trả kết quả của user A
+    assert engine.execute_query(sql, ctx_b).item(0, 0) == 200.0
+
+def test_result_cache_skips_nondeterministic(cache_data_path):
+    engine = DataEngine(cache_data_path)
+    ctx = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+    metrics = {}
+    engine.execute_query("SELECT RANDOM() AS r FROM secure_sales", ctx, metrics=metrics)
+    assert "result_cache_hit" not in metrics
+    assert engine.result_cache_stats()["entries"] == 0
+
+def test_result_cache_byte_budget_lru():
+    import polars as pl
+    from core.cache import ResultCache
+    df = pl.DataFrame({"x": list(range(1000))})
+    cache = ResultCache(max_bytes=10**9)
+    cache.put("probe", df)
+    entry_size = cache.stats()["bytes"]
+
+    cache = ResultCache(max_bytes=entry_size * 2)
+    cache.put("a", df)
+    cache.put("b", df)
+    cache.get("a")          # a thành most-recently-used
+    cache.put("c", df)      # -> evict b
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= entry_size * 2
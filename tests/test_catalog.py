@@ -0,0 +1,87 @@
+import json
+import os
+import pandas as pd
+import pytest
+from core.catalog import Catalog, DatasetSource
+from core.engine import DataEngine
+from core.context import UserContext
+
+ADMIN = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+SALES = UserContext(user_id="u1", role="sales", allowed_brands=["Apple"])
+
+@pytest.fixture
+def engine(tmp_path):
+    master = tmp_path / "master.parquet"
+    pd.DataFrame({"Main niche": ["Apple", "Banana"], "Revenue": [1.0, 2.0]}).to_parquet(master)
+    snapshots = tmp_path / "snapshots"
+    snapshots.mkdir()
+    pd.DataFrame({"Main niche": ["Apple", "Banana", "Apple"], "Total_Rev": [10.0, 20.0, 30.0]}).to_parquet(snapshots / "s1.parquet")
+    targets = tmp_path / "targets.parquet"
+    pd.DataFrame({"Keyword": ["a", "b"], "Bid": [1.0, 2.0]}).to_parquet(targets)
+    datasets = [DatasetSource("snapshots", str(snapshots)), DatasetSource("targets", str(targets), brand_col=None)]
+    return DataEngine(str(master), brand_col="Main niche", datasets=datasets)
+
+def temp_views(engine):
+    snap = engine._current_snapshot()
+    with snap.pool.connection() as con:
+        return {r[0] for r in con.execute("SELECT view_name FROM duckdb_views() WHERE temporary").fetchall()}
+
+def test_datasets_registered_lazily(engine):
+    engine.execute_query("SELECT COUNT(*) FROM secure_sales", SALES)
+    snap = engine._current_snapshot()
+    assert snap.catalog_columns == {}
+    assert "snapshots" not in temp_views(engine)
+
+    df = engine.execute_query("WITH s AS (SELECT * FROM snapshots) SELECT SUM(Total_Rev) AS rev FROM s", SALES)
+    assert df.item(0, 0) == 40.0
+    assert list(snap.catalog_columns) == ["snapshots"]
+
+def test_dataset_rls_and_fail_safe(engine):
+    assert engine.execute_query("SELECT COUNT(*) FROM snapshots", ADMIN).item(0, 0) == 3
+    # Dataset không có cột niche -> chỉ Admin đọc được
+    assert engine.execute_query("SELECT COUNT(*) FROM targets", SALES).item(0, 0) == 0
+    assert engine.execute_query("SELECT COUNT(*) FROM targets", ADMIN).item(0, 0) == 2
+    with pytest.raises(ValueError, match="Forbidden"):
+        engine.execute_query('SELECT * FROM catalog."snapshots"', SALES)
+
+def test_new_snapshot_file_refreshes_view_and_cache(engine, tmp_path):
+    sql = "SELECT COUNT(*) AS n FROM snapshots"
+    assert engine.execute_query(sql, ADMIN).item(0, 0) == 3
+    pd.DataFrame({"Main niche": ["Apple"], "Clicks": [5]}).to_parquet(tmp_path / "snapshots" / "s2.parquet")
+
+    assert engine.execute_query(sql, ADMIN).item(0, 0) == 4
+    df = engine.execute_query("SELECT SUM(Clicks) AS c FROM snapshots", SALES)
+    assert df.item(0, 0) == 5
+
+def test_schema_lists_readable_datasets(engine):
+    assert "Table snapshots" in engine.get_schema_info(SALES)
+    assert "Table targets" not in engine.get_schema_info(SALES)
+    assert "Table targets" in engine.get_schema_info(ADMIN)
+
+def test_schema_version_tracks_catalog_datasets(engine, tmp_path):
+    schema, version = engine.get_versioned_schema(SALES)
+    assert "Clicks" not in schema
+    # Snapshot mới thêm cột -> schema (prompt AI) và version (ETag) phải đổi dù file chính không đổi
+    pd.DataFrame({"Main niche": ["Apple"], "Clicks": [5]}).to_parquet(tmp_path / "snapshots" / "s2.parquet")
+    new_schema, new_version = engine.get_versioned_schema(SALES)
+    assert "Clicks" in new_schema and new_version != version
+    assert engine.get_versioned_schema(SALES) == (new_schema, new_version)
+
+def test_catalog_config_file(tmp_path):
+    (tmp_path / "Master_PPC_Data.parquet").write_bytes(b"")
+    config = tmp_path / "catalog.json"
+    config.write_text(json.dumps({"datasets": [
+        {"name": "sales", "path": ["Big_Master_PPC_Data.parquet", "Master_PPC_Data.parquet"]},
+        {"name": "snapshots", "path": "snapshots", "brand_col": None},
+    ]}))
+    catalog = Catalog.from_file(str(config))
+    assert catalog.primary.path == os.path.join(str(tmp_path), "Master_PPC_Data.parquet")
+    assert [ds.name for ds in catalog.secondary] == ["snapshots"]
+    assert catalog.secondary[0].brand_col is None
+
+@pytest.mark.parametrize("table", ["query_table('catalog.snapshots')", "query('SELECT * FROM catalog.snapshots')"])
+def test_dataset_not_reachable_through_table_functions(engine, table):
+    # Dataset đã được đăng ký (lazy) trước khi thử đọc thẳng
+    engine.execute_query("SELECT COUNT(*) FROM snapshots", SALES)
+    with pytest.raises(ValueError, match="Forbidden"):
+        engine.execute_query(f"SELECT * FROM {table}", SALES)
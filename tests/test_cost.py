@@ -0,0 +1,58 @@
+import duckdb
+import pandas as pd
+import pytest
+from unittest.mock import MagicMock
+from core.cost import QueryTooExpensiveError, estimate_cost
+from core.engine import DataEngine
+from core.agent import PerformanceAgent
+from core.context import UserContext
+
+@pytest.fixture
+def engine(tmp_path):
+    p = tmp_path / "sales.parquet"
+    pd.DataFrame({"Main niche": ["Apple", "Banana"] * 5000, "Revenue": [1.0] * 10000}).to_parquet(p)
+    budgets = {"default": {"max_scan_rows": 1_000_000, "max_intermediate_rows": 1_000_000}}
+    return DataEngine(str(p), brand_col="Main niche", result_cache_bytes=0, cost_budgets=budgets)
+
+SALES = UserContext(user_id="u1", role="sales", allowed_brands=["Apple", "Banana"])
+CROSS_SQL = "SELECT COUNT(*) FROM secure_sales a, secure_sales b"
+
+def test_estimate_cross_product_and_join_shapes():
+    con = duckdb.connect()
+    con.execute("CREATE TABLE t AS SELECT range AS i, range % 10 AS g FROM range(1000)")
+    cost = estimate_cost(con, "SELECT COUNT(*) FROM t a, t b")
+    assert cost.cross_products == 1
+    assert cost.rows_scanned == 2000
+    assert cost.max_intermediate_rows == 1_000_000
+
+    joined = estimate_cost(con, "SELECT COUNT(*) FROM t a JOIN t b USING (g)")
+    assert joined.cross_products == 0 and joined.joins == ["HASH_JOIN"]
+
+def test_over_budget_rejected_before_execution(engine):
+    metrics = {}
+    engine.execute_query("SELECT SUM(Revenue) FROM secure_sales", SALES, metrics=metrics)
+    assert metrics["estimated_cost"]["rows_scanned"] < 20000
+
+    with pytest.raises(QueryTooExpensiveError) as exc:
+        engine.execute_query(CROSS_SQL, SALES)
+    detail = exc.value.to_dict()
+    assert detail["error"] == "query_too_expensive"
+    assert "cross product" in detail["message"]
+
+def test_agent_retries_with_budget_reason(engine):
+    ai = MagicMock()
+    ai.generate_sql.side_effect = [
+        {"sql": CROSS_SQL, "explanation": ""},
+        {"sql": "SELECT COUNT(*) * COUNT(*) AS pairs FROM secure_sales", "explanation": ""},
+    ]
+    result = PerformanceAgent(engine, ai).process_request("How many row pairs?", SALES)
+    assert result["status"] == "success"
+    assert result["data"].item(0, 0) == 10000 * 10000
+    fix_prompt = ai.generate_sql.call_args_list[1].args[0]
+    assert "rejected before execution" in fix_prompt and "cheaper" in fix_prompt
+
+@pytest.mark.parametrize("sql", ["SELECT 1 AS a; SELECT COUNT(*) FROM secure_sales", "CHECKPOINT",
+                                 "DESCRIBE secure_sales"])
+def test_only_single_select_statement_accepted(engine, sql):
+    with pytest.raises(ValueError, match="single SELECT"):
+        engine.execute_query(sql, SALES)
@@ -0,0 +1,104 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from core.context import UserContext
+from core.dashboard import DashboardFilters, DashboardQueries, summary_kpis
+from core.engine import DataEngine
+from core.rollups import default_rollups
+from core.summary import KpiSummary
+
+
+@pytest.fixture
+def engine(tmp_path):
+    p = tmp_path / "master.parquet"
+    n = 120
+    pd.DataFrame({
+        "Report_Date": [datetime.date(2025, 1, 1) + datetime.timedelta(days=i % 10) for i in range(n)],
+        "Main niche": [["Apple", "Banana", "Cherry"][i % 3] for i in range(n)],
+        "SKU": [f"SKU_{i}" for i in range(n)],
+        "Revenue (Actual)": [10.0] * n,
+        "Ads Spend (Actual)": [1.0] * n,
+    }).to_parquet(p)
+    return DataEngine(str(p), brand_col="Main niche", rollups=default_rollups("Main niche"))
+
+
+ADMIN = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+
+
+def test_kpis_and_trend_are_aggregated_in_duckdb(engine):
+    queries = DashboardQueries(engine, ADMIN)
+    assert queries.date_bounds() == (datetime.date(2025, 1, 1), datetime.date(2025, 1, 10))
+
+    kpis = queries.kpis(DashboardFilters())
+    assert kpis == {"revenue": 1200.0, "spend": 120.0, "tacos": 10.0, "rows": 120}
+
+    filters = DashboardFilters(datetime.date(2025, 1, 3), datetime.date(2025, 1, 4), ["Apple", "O'Brien"])
+    assert queries.kpis(filters)["rows"] == 8
+    trend = queries.daily_trend(filters)
+    assert trend.height == 2
+    assert trend["Revenue (Actual)"].to_list() == [40.0, 40.0]
+
+    # KPI / trend đọc rollup daily_niche, không quét bảng gốc
+    metrics = {}
+    engine.execute_query(
+        'SELECT "Report_Date", SUM("Revenue (Actual)") FROM secure_sales GROUP BY 1', ADMIN, metrics=metrics
+    )
+    assert metrics["rollup"] == "daily_niche"
+
+
+def walk_pages(queries, filters, page_size):
+    pages, cursor = [], None
+    while True:
+        page, cursor = queries.detail_page(filters, page_size, after=cursor)
+        pages.append(page)
+        if cursor is None:
+            return pages
+
+
+def test_detail_pages_are_stable_and_respect_rls(engine):
+    queries = DashboardQueries(engine, ADMIN)
+    filters = DashboardFilters()
+    pages = walk_pages(queries, filters, 50)
+    assert [p.height for p in pages] == [50, 50, 20]
+    skus = [s for p in pages for s in p["SKU"].to_list()]
+    assert len(set(skus)) == 120
+    assert pages[0]["Report_Date"][0] == datetime.date(2025, 1, 10)
+    # Page sau chỉ đọc phần "sau khóa cuối" (keyset), không OFFSET sâu
+    _, cursor = queries.detail_page(filters, 50)
+    assert cursor["key"] == list(pages[0].select("Report_Date", "Main niche", "SKU").row(-1))
+
+    sales = UserContext(user_id="u1", role="sales", allowed_brands=["Apple"])
+    restricted = DashboardQueries(engine, sales)
+    assert restricted.kpis(filters)["rows"] == 40
+    assert set(restricted.detail_page(filters, 100)[0]["Main niche"].to_list()) == {"Apple"}
+
+    with pytest.raises(ValueError):
+        queries.detail_page(filters, 0)
+
+
+def test_detail_pages_handle_duplicate_keys_and_nulls(tmp_path):
+    p = tmp_path / "dupes.parquet"
+    n = 90
+    pd.DataFrame({
+        "Report_Date": [datetime.date(2025, 1, 1 + i % 2) if i % 9 else None for i in range(n)],
+        "Main niche": ["Apple" if i % 5 else None for i in range(n)],
+        # Nhiều dòng cùng (ngày, niche, SKU) -> khóa trùng vắt qua nhiều page
+        "SKU": [f"SKU_{i % 3}" for i in range(n)],
+        "Campaign": [f"C{i:03d}" for i in range(n)],
+        "Revenue (Actual)": [float(i) for i in range(n)],
+        "Ads Spend (Actual)": [1.0] * n,
+    }).to_parquet(p)
+    queries = DashboardQueries(DataEngine(str(p), brand_col="Main niche"), ADMIN)
+    pages = walk_pages(queries, DashboardFilters(), 7)
+    campaigns = [c for page in pages for c in page["Campaign"].to_list()]
+    assert sorted(campaigns) == sorted(f"C{i:03d}" for i in range(n))
+    assert pages[-1]["Report_Date"].null_count() > 0  # NULL đứng cuối
+
+
+def test_summary_kpis_match_aggregate_query(engine):
+    queries = DashboardQueries(engine, ADMIN)
+    overview = KpiSummary(engine.db_path, "Main niche").summary(ADMIN)
+    assert summary_kpis(overview) == queries.kpis(DashboardFilters())
+    assert summary_kpis(overview, ["Apple"]) == queries.kpis(DashboardFilters(niches=["Apple"]))
@@ -0,0 +1,61 @@
+import threading
+import time
+import pytest
+import pandas as pd
+from unittest.mock import MagicMock
+from core.engine import DataEngine
+from core.agent import PerformanceAgent
+from core.context import UserContext
+from core.deadline import CancelToken, QueryCancelledError, QueryTimeoutError
+
+# Cross join ~10^13 dòng: chạy vài giờ nếu không bị interrupt
+HEAVY_SQL = "SELECT COUNT(*) FROM range(100000000) a, range(100000) b"
+
+@pytest.fixture
+def engine(tmp_path):
+    p = tmp_path / "sales.parquet"
+    pd.DataFrame({"Main niche": ["Apple", "Banana"] * 50, "Revenue": [1.0] * 100}).to_parquet(p)
+    # cost_budgets={}: tắt guardrail EXPLAIN để query nặng thực sự chạy tới deadline
+    return DataEngine(str(p), brand_col="Main niche", pool_size=1, result_cache_bytes=0, cost_budgets={})
+
+ADMIN = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+
+def test_timeout_interrupts_and_cursor_reusable(engine):
+    metrics = {}
+    t0 = time.time()
+    with pytest.raises(QueryTimeoutError) as exc:
+        engine.execute_query(HEAVY_SQL, ADMIN, metrics=metrics, timeout=0.5)
+    assert time.time() - t0 < 10
+    assert metrics["timeout_s"] == 0.5
+    assert exc.value.to_dict()["error"] == "query_timeout"
+
+    # pool_size=1 -> chính cursor vừa bị interrupt phải chạy tiếp được
+    assert engine.execute_query("SELECT COUNT(*) FROM secure_sales", ADMIN).item(0, 0) == 100
+    assert engine.pool_stats()["in_use"] == 0
+
+def test_role_limit_caps_request_timeout(engine):
+    engine.role_timeouts = {"sales": 5.0}
+    sales = UserContext(user_id="u1", role="sales_ab", allowed_brands=["Apple"])
+    assert engine.resolve_timeout(sales, 60) == 5.0
+    assert engine.resolve_timeout(sales, 1) == 1
+    assert engine.resolve_timeout(ADMIN) == engine.default_timeout
+
+def test_cancel_token_from_other_thread(engine):
+    token = CancelToken()
+    threading.Timer(0.3, token.cancel).start()
+    with pytest.raises(QueryCancelledError):
+        engine.execute_query(HEAVY_SQL, ADMIN, timeout=60, cancel_token=token)
+    assert engine.execute_query("SELECT 1 AS x", ADMIN).item(0, 0) == 1
+
+def test_agent_retry_asks_for_cheaper_query(engine):
+    ai = MagicMock()
+    ai.generate_sql.side_effect = [
+        {"sql": HEAVY_SQL, "explanation": "slow"},
+        {"sql": "SELECT COUNT(*) AS n FROM secure_sales", "explanation": "fixed"},
+    ]
+    agent = PerformanceAgent(engine, ai)
+    result = agent.process_request("How many rows?", ADMIN, timeout=0.5)
+
+    assert result["status"] == "success"
+    fix_prompt = ai.generate_sql.call_args_list[1].args[0]
+    assert "time limit" in fix_prompt and "cheaper" in fix_prompt
@@ -0,0 +1,65 @@
+import datetime
+
+import numpy as np
+import polars as pl
+import pytest
+
+from core.downsample import downsample, lttb_indices
+
+
+@pytest.fixture
+def series():
+    n = 20_000
+    t = np.arange(n)
+    values = np.sin(t / 1000)
+    values[12_345] = 50.0  # spike
+    return pl.DataFrame({
+        "Report_Date": [datetime.datetime(2025, 1, 1) + datetime.timedelta(minutes=int(i)) for i in t],
+        "Revenue": values,
+        "Label": [f"row_{i}" for i in t],
+    })
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_bounded_points_keep_shape(series, method):
+    out, info = downsample(series, 500, method)
+    assert info["x"] == "Report_Date" and info["y"] == ["Revenue"]
+    assert info["original_rows"] == 20_000
+    assert 100 < out.height <= 500
+    assert out.columns == series.columns
+    # Giữ điểm đầu / cuối, spike và thứ tự theo x
+    assert out["Label"][0] == "row_0" and out["Label"][-1] == "row_19999"
+    assert out["Revenue"].max() == 50.0
+    assert out["Report_Date"].is_sorted()
+
+
+def test_small_result_untouched_and_errors(series):
+    small = series.head(100)
+    out, info = downsample(small, 500)
+    assert out.equals(small) and info["rows"] == 100
+    with pytest.raises(ValueError):
+        downsample(series, 500, "average")
+    with pytest.raises(ValueError):
+        downsample(series, 500, x="missing")
+    with pytest.raises(ValueError):
+        downsample(series.select("Label"), 500)
+
+
+def test_grouped_series_share_budget():
+    df = pl.DataFrame({
+        "day": [datetime.date(2025, 1, 1) + datetime.timedelta(days=i % 1000) for i in range(10_000)],
+        "SKU": [f"SKU_{i // 1000}" for i in range(10_000)],
+        "Revenue": np.random.default_rng(0).random(10_000),
+    })
+    out, info = downsample(df, 400, group="SKU")
+    assert info["y"] == ["Revenue"]
+    counts = out.group_by("SKU").len()
+    assert counts.height == 10 and counts["len"].max() <= 40
+    assert out.filter(pl.col("SKU") == "SKU_3")["day"].is_sorted()
+
+
+def test_lttb_indices_line_is_exact_endpoints():
+    x = np.arange(1000, dtype=float)
+    idx = lttb_indices(x, x * 2, 10)
+    assert len(idx) == 10 and idx[0] == 0 and idx[-1] == 999
+    assert (np.diff(idx) > 0).all()
@@ -0,0 +1,74 @@
+import datetime
+import hashlib
+
+import duckdb
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from gen_big_data_v2 import generate_big_data
+
+
+@pytest.fixture
+def source_path(tmp_path):
+    p = tmp_path / "master.parquet"
+    n = 300
+    pd.DataFrame({
+        "Report_Date": [datetime.date(2025, 1, 1) + datetime.timedelta(days=i % 30) for i in range(n)],
+        "Main niche": [f"Niche_{i % 6}" for i in range(n)],
+        "SKU": [f"SKU_{i}" for i in range(n)],
+        "ASIN": [f"B0{i}" for i in range(n)],
+        "Revenue (Actual)": [100.0] * n,
+        "Ads Spend (Actual)": [10.0] * n,
+        "Clicks": list(range(n)),
+    }).to_parquet(p)
+    return str(p)
+
+
+def _digest(path):
+    with open(path, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def test_exact_rows_streamed_in_row_groups(source_path, tmp_path):
+    target = str(tmp_path / "big.parquet")
+    info = generate_big_data(source_path, target, rows=5_050, chunk_rows=1_000, row_group_rows=512)
+    meta = pq.ParquetFile(target).metadata
+    assert info["rows"] == meta.num_rows == 5_050
+    assert meta.num_row_groups > 1
+    assert max(meta.row_group(i).num_rows for i in range(meta.num_row_groups)) <= 512
+    # Không còn file tạm
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["big.parquet", "master.parquet"]
+
+    row = duckdb.sql(f"""
+        SELECT COUNT(DISTINCT SKU), MIN("Revenue (Actual)"), MAX("Revenue (Actual)"), SUM("Clicks")
+        FROM read_parquet('{target}')
+    """).fetchone()
+    assert row[0] == 5_050  # SKU duy nhất giữa các bản copy
+    assert 90.0 <= row[1] < row[2] <= 110.0  # jitter mặc định ±10%
+    assert row[3] == 16 * sum(range(300)) + sum(range(250))  # cột không jitter giữ nguyên
+
+
+def test_same_seed_is_reproducible(source_path, tmp_path):
+    kwargs = dict(rows=2_000, chunk_rows=700, date_range_days=90, niches=10)
+    a = generate_big_data(source_path, str(tmp_path / "a.parquet"), seed=1, **kwargs)["path"]
+    b = generate_big_data(source_path, str(tmp_path / "b.parquet"), seed=1, **kwargs)["path"]
+    c = generate_big_data(source_path, str(tmp_path / "c.parquet"), seed=2, **kwargs)["path"]
+    assert _digest(a) == _digest(b)
+    assert _digest(a) != _digest(c)
+
+
+def test_date_expansion_and_niche_cardinality(source_path, tmp_path):
+    target = str(tmp_path / "big.parquet")
+    generate_big_data(source_path, target, rows=3_000, jitter=0, date_range_days=90, niches=15)
+    lo, hi, niches, revenue = duckdb.sql(f"""
+        SELECT MIN(Report_Date), MAX(Report_Date), COUNT(DISTINCT "Main niche"), MAX("Revenue (Actual)")
+        FROM read_parquet('{target}')
+    """).fetchone()
+    assert hi == datetime.date(2025, 1, 30)
+    assert lo == datetime.date(2025, 1, 1) - datetime.timedelta(days=60)  # 3 khoảng 30 ngày
+    assert niches == 15
+    assert revenue == 100.0
+
+    generate_big_data(source_path, target, rows=3_000, niches=4)
+    assert duckdb.sql(f"""SELECT COUNT(DISTINCT "Main niche") FROM read_parquet('{target}')""").fetchone()[0] == 4
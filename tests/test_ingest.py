@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+import pandas as pd
+import pytest
+from core.engine import DataEngine
+from core.context import UserContext
+from core.ingest import Compactor, DeltaTable, is_incremental, read_date_window
+
+ADMIN = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+SALES = UserContext(user_id="u1", role="sales", allowed_brands=["Apple"])
+TOTAL = 'SELECT "Main niche", SUM(Revenue) AS rev FROM secure_sales GROUP BY 1 ORDER BY 1'
+
+def day(date, rows):
+    return pd.DataFrame({"Report_Date": [date] * len(rows), "Main niche": [r[0] for r in rows],
+                         "Revenue": [r[1] for r in rows]})
+
+@pytest.fixture
+def table(tmp_path):
+    return DeltaTable.create(str(tmp_path / "ppc"), day("2024-01-01", [("Apple", 10.0), ("Banana", 20.0)]))
+
+def test_engine_reads_base_plus_deltas(table):
+    engine = DataEngine(table.root, brand_col="Main niche")
+    assert engine.execute_query(TOTAL, SALES)["rev"].to_list() == [10.0]
+
+    info = table.append(day("2024-01-02", [("Apple", 5.0), ("Banana", 1.0)]))
+    assert info["rows"] == 2 and info["data_version"] == 1
+    # Delta mới được thấy ngay ở request kế tiếp, vẫn áp RLS
+    assert engine.execute_query(TOTAL, SALES)["rev"].to_list() == [15.0]
+    assert engine.execute_query(TOTAL, ADMIN)["rev"].to_list() == [15.0, 21.0]
+
+def test_delta_with_new_column(table):
+    engine = DataEngine(table.root, brand_col="Main niche")
+    extra = day("2024-01-02", [("Apple", 1.0)]).assign(Clicks=[7])
+    table.append(extra)
+    df = engine.execute_query("SELECT SUM(Clicks) AS c, COUNT(*) AS n FROM secure_sales", ADMIN)
+    assert df.row(0) == (7, 3)
+
+def test_compaction_keeps_data_and_version(table):
+    engine = DataEngine(table.root, brand_col="Main niche")
+    for i in range(3):
+        table.append(day(f"2024-01-0{i + 2}", [("Apple", 1.0)]))
+    version = engine.dataset_version()
+    before = engine.execute_query(TOTAL, ADMIN)
+
+    assert table.compact()["mode"] == "minor"
+    assert table.stats()["deltas"] == 1
+    assert table.compact(major=True)["files"] == 2
+    assert table.stats()["deltas"] == 0
+
+    # Compaction không đổi data -> version giữ nguyên, result cache vẫn dùng được
+    metrics = {}
+    assert engine.execute_query(TOTAL, ADMIN, metrics=metrics).equals(before)
+    assert metrics["result_cache_hit"]
+    assert engine.dataset_version() == version
+    assert engine._current_snapshot().manifest["base"] == table.read_manifest()["base"]
+
+def test_vacuum_removes_retired_files(table):
+    table.append(day("2024-01-02", [("Apple", 1.0)]))
+    old = table.files()
+    table.compact(major=True)
+    assert all(os.path.exists(f) for f in old)  # snapshot cũ có thể vẫn đang đọc
+    assert table.vacuum(grace_seconds=0) == 2
+    assert not any(os.path.exists(f) for f in old)
+    assert table.stats()["retired"] == 0
+
+def test_compactor_thresholds(table):
+    compactor = Compactor(table, max_deltas=3, major_ratio=100.0, grace_seconds=0)
+    table.append(day("2024-01-02", [("Apple", 1.0)]))
+    assert compactor.run_once() is None
+    table.append(day("2024-01-03", [("Apple", 1.0)]))
+    table.append(day("2024-01-04", [("Apple", 1.0)]))
+    assert compactor.run_once()["mode"] == "minor"
+
+    compactor.major_ratio = 0.0
+    assert compactor.run_once()["mode"] == "major"
+    assert table.stats()["deltas"] == 0 and table.read_manifest()["base_rows"] == 5
+
+def _slow_merge(monkeypatch, during=None):
+    real_write = DeltaTable._write_parquet
+
+    def slow_write(self, source, rel_path, files=None):
+        if files is not None:
+            time.sleep(0.2)
+            if during:
+                during(self)
+        return real_write(self, source, rel_path, files=files)
+
+    monkeypatch.setattr(DeltaTable, "_write_parquet", slow_write)
+
+def test_concurrent_compactions_do_not_duplicate_rows(table, monkeypatch):
+    for i in range(3):
+        table.append(day(f"2024-01-0{i + 2}", [("Apple", 2.0)]))
+    _slow_merge(monkeypatch)
+    # Compactor minor (API) và nút major (Data Admin) chạy chồng nhau
+    workers = [threading.Thread(target=table.compact), threading.Thread(target=table.compact, kwargs={"major": True})]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    engine = DataEngine(table.root, brand_col="Main niche")
+    assert engine.execute_query(TOTAL, ADMIN)["rev"].to_list() == [16.0, 20.0]
+    rows = table.read_manifest().get("base_rows", 0) + sum(table.read_manifest()["delta_rows"].values())
+    assert rows == 5
+
+def test_compaction_discards_output_when_sources_replaced(table, monkeypatch):
+    table.append(day("2024-01-02", [("Apple", 2.0)]))
+    table.append(day("2024-01-03", [("Apple", 2.0)]))
+
+    def drop_delta(t):
+        # Process khác (không giữ lease) đã gộp mất 1 delta trong lúc ta đang ghi
+        with t._lock():
+            manifest = t.read_manifest()
+            manifest["deltas"] = manifest["deltas"][1:]
+            t._write_manifest(manifest)
+
+    _slow_merge(monkeypatch, during=drop_delta)
+    assert table.compact() is None
+    assert len(table.read_manifest()["deltas"]) == 1
+    assert sorted(os.listdir(os.path.join(table.root, "deltas"))) == ["delta_000002.parquet", "delta_000003.parquet"]
+
+def test_resident_reuses_persisted_base_across_ingest(table, tmp_path):
+    engine = DataEngine(table.root, brand_col="Main niche", resident=True, persist_dir=str(tmp_path / "persist"))
+    assert engine.execute_query(TOTAL, ADMIN)["rev"].to_list() == [10.0, 20.0]
+    base_path = engine._current_snapshot().persist_path
+
+    table.append(day("2024-01-02", [("Apple", 5.0)]))
+    engine.reload()
+    snap = engine._current_snapshot()
+    assert snap.persist_path == base_path and os.path.exists(base_path)
+    assert engine.execute_query(TOTAL, SALES)["rev"].to_list() == [15.0]
+
+    table.compact(major=True)
+    engine.reload()
+    assert engine._current_snapshot().persist_path != base_path
+    assert engine.execute_query(TOTAL, SALES)["rev"].to_list() == [15.0]
+
+def test_is_incremental(table, tmp_path):
+    assert is_incremental(table.root)
+    assert not is_incremental(str(tmp_path))
+    with pytest.raises(ValueError):
+        DeltaTable.create(table.root)
+
+def test_ingest_scraped_date_window_from_master(table, tmp_path):
+    # Scraper ghi lại toàn bộ lịch sử vào master -> chỉ ingest khoảng ngày vừa cào
+    master = tmp_path / "master.parquet"
+    pd.concat([day("2024-01-01", [("Apple", 10.0)]), day("2024-01-02", [("Apple", 5.0)]),
+               day("2024-01-03", [("Banana", 2.0)])]).to_parquet(master)
+    rows = read_date_window(str(master), "Report_Date", "2024-01-02", "2024-01-03")
+    info = table.append(rows)
+    assert info["rows"] == 2
+    engine = DataEngine(table.root, brand_col="Main niche")
+    assert engine.execute_query(TOTAL, ADMIN)["rev"].to_list() == [15.0, 22.0]
@@ -0,0 +1,52 @@
+import os
+import time
+import polars as pl
+import pytest
+from core.pagination import CursorAccessError, CursorNotFoundError, ResultPager
+
+@pytest.fixture
+def pager(tmp_path):
+    return ResultPager(spill_dir=str(tmp_path / "pages"), ttl=60)
+
+FRAME = pl.DataFrame({"id": list(range(2500)), "niche": ["Apple"] * 2500})
+
+def test_pages_across_batches(pager):
+    cursor = pager.spill_frame(FRAME, "owner", meta={"version": "v1"}, batch_size=700)
+    df, info = pager.page(cursor, "owner", 0, 1000)
+    assert df["id"].to_list() == list(range(1000))
+    assert info["total_rows"] == 2500 and info["next_offset"] == 1000 and info["version"] == "v1"
+
+    df, info = pager.page(cursor, "owner", 2000, 1000)
+    assert df["id"].to_list() == list(range(2000, 2500))
+    assert info["next_offset"] is None
+    df, _ = pager.page(cursor, "owner", 3000, 10)
+    assert df.is_empty() and df.columns == ["id", "niche"]
+
+def test_owner_checked_on_every_page(pager):
+    cursor = pager.spill_frame(FRAME, "owner")
+    with pytest.raises(CursorAccessError):
+        pager.page(cursor, "someone-else", 0, 10)
+    with pytest.raises(CursorNotFoundError):
+        pager.page("unknown", "owner", 0, 10)
+
+def test_ttl_and_close_remove_spill_file(pager):
+    cursor = pager.spill_frame(FRAME, "owner")
+    path = os.path.join(pager.spill_dir, f"{cursor}.arrow")
+    assert os.path.exists(path)
+    assert pager.close(cursor, "owner")
+    assert not os.path.exists(path)
+
+    pager.ttl = 0.01
+    cursor = pager.spill_frame(FRAME, "owner")
+    time.sleep(0.05)
+    with pytest.raises(CursorNotFoundError):
+        pager.page(cursor, "owner", 0, 10)
+    assert pager.stats()["cursors"] == 0
+
+def test_max_bytes_evicts_oldest(tmp_path):
+    pager = ResultPager(spill_dir=str(tmp_path), ttl=60, max_bytes=1)
+    first = pager.spill_frame(FRAME, "owner")
+    second = pager.spill_frame(FRAME, "owner")
+    with pytest.raises(CursorNotFoundError):
+        pager.page(first, "owner", 0, 1)
+    assert pager.page(second, "owner", 0, 1)[0].height == 1
@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+from unittest.mock import MagicMock, patch
+from core.parsed_query import parse_query
+from core.engine import DataEngine
+from core.agent import PerformanceAgent
+from core.context import UserContext
+
+def test_fingerprint_and_metadata():
+    a = parse_query('select "Main niche", sum(Revenue) from secure_sales group by 1')
+    b = parse_query('SELECT  "Main niche",\n SUM(Revenue)\nFROM SECURE_SALES GROUP BY 1')
+    assert a.fingerprint == b.fingerprint
+    assert a.columns == ["Main niche", "Revenue"]
+    assert [t.name for t in a.tables] == ["secure_sales"]
+    assert a.pretty.startswith("SELECT\n")
+    # Tên cột output khác cách viết -> khác fingerprint (DuckDB giữ nguyên tên trong kết quả)
+    assert parse_query("SELECT revenue FROM t").fingerprint != parse_query("SELECT Revenue FROM t").fingerprint
+    assert not parse_query("SELECT random() FROM t").deterministic
+
+def test_invalid_sql_keeps_raw_text():
+    q = parse_query("SELEC nope FROM")
+    assert not q.ok and q.error
+    assert q.pretty == "SELEC nope FROM"
+
+def test_repeated_sql_is_not_reparsed(tmp_path):
+    p = tmp_path / "sales.parquet"
+    pd.DataFrame({"Main niche": ["Apple"], "Revenue": [1.0]}).to_parquet(p)
+    engine = DataEngine(str(p), brand_col="Main niche")
+    ctx = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+    ai = MagicMock()
+    ai.generate_sql.return_value = {"sql": "SELECT SUM(Revenue) AS total_rev_parse_once FROM secure_sales", "explanation": ""}
+    agent = PerformanceAgent(engine, ai)
+
+    with patch("core.parsed_query.sqlglot.parse_one", wraps=__import__("sqlglot").parse_one) as parse:
+        first = agent.process_request("Total revenue?", ctx)
+        agent.process_request("Total revenue?", ctx)
+    assert first["status"] == "success"
+    assert first["sql_pretty"].startswith("SELECT")
+    assert parse.call_count == 1
@@ -0,0 +1,76 @@
+import pytest
+import pandas as pd
+from core.engine import DataEngine
+from core.context import UserContext
+from core.partitioning import write_brand_partitions, scan_partitions
+
+@pytest.fixture
+def master_path(tmp_path):
+    p = tmp_path / "master.parquet"
+    df = pd.DataFrame({
+        "Main niche": ["Apple", "Bob's Bar", "A/B Test", "Cat", "Apple", None],
+        "Revenue": [10.0, 20.0, 30.0, 40.0, 50.0, 60.0]
+    })
+    df.to_parquet(p)
+    return str(p)
+
+@pytest.fixture
+def partitioned_dir(master_path, tmp_path):
+    target = str(tmp_path / "partitioned")
+    write_brand_partitions(master_path, target, "Main niche")
+    return target
+
+def test_partition_names_roundtrip(partitioned_dir):
+    parts = scan_partitions(partitioned_dir)
+    assert set(parts) == {"Apple", "Bob's Bar", "A/B Test", "Cat", None}
+    assert all(len(files) == 1 for files in parts.values())
+
+def test_partitioned_engine_rls(partitioned_dir):
+    engine = DataEngine(partitioned_dir, brand_col="Main niche")
+    ctx = UserContext(user_id="u1", role="sales", allowed_brands=["Apple", "Bob's Bar", "Unknown"])
+
+    df = engine.execute_query('SELECT "Main niche", SUM(Revenue) AS rev FROM secure_sales GROUP BY 1 ORDER BY 1', ctx)
+    assert df["Main niche"].to_list() == ["Apple", "Bob's Bar"]
+    assert df["rev"].to_list() == [60.0, 20.0]
+    # raw_sales cũng bị che -> không lách RLS bằng cách query thẳng bảng gốc
+    assert engine.execute_query("SELECT COUNT(*) FROM raw_sales", ctx).item(0, 0) == 3
+
+    admin = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+    assert engine.execute_query("SELECT COUNT(*) FROM secure_sales", admin).item(0, 0) == 6
+    assert sorted(engine.get_all_brands()) == ["A/B Test", "Apple", "Bob's Bar", "Cat"]
+
+def test_partitioned_view_reads_only_allowed_files(partitioned_dir):
+    engine = DataEngine(partitioned_dir, brand_col="Main niche")
+    ctx = UserContext(user_id="u1", role="sales", allowed_brands=["Cat"])
+    snap = engine._current_snapshot()
+
+    with snap.pool.connection() as con:
+        engine._setup_shadow_view(con, ctx, snap)
+        view_sql = con.execute("SELECT sql FROM duckdb_views() WHERE view_name = 'secure_sales'").fetchone()[0]
+
+    assert snap.partitions["Cat"][0] in view_sql
+    assert snap.partitions["Apple"][0] not in view_sql
+
+def test_monolithic_raw_sales_shadowed(master_path):
+    engine = DataEngine(master_path, brand_col="Main niche")
+    ctx = UserContext(user_id="u1", role="sales", allowed_brands=["Cat"])
+    assert engine.execute_query("SELECT COUNT(*) FROM raw_sales", ctx).item(0, 0) == 1
+
+    # Cursor được trả về pool rồi dùng lại cho admin -> phải thấy lại toàn bộ data
+    admin = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+    assert engine.execute_query("SELECT COUNT(*) FROM raw_sales", admin).item(0, 0) == 6
+
+def test_request_path_update_check_is_throttled(partitioned_dir, monkeypatch):
+    import core.engine
+    engine = DataEngine(partitioned_dir, brand_col="Main niche", update_check_interval=60)
+    admin = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+    engine.execute_query("SELECT COUNT(*) FROM secure_sales", admin)
+    calls = []
+    real = core.engine.file_fingerprint
+    monkeypatch.setattr(core.engine, "file_fingerprint", lambda path: calls.append(path) or real(path))
+    for _ in range(5):
+        engine.execute_query("SELECT SUM(Revenue) FROM secure_sales", admin)
+    # Request trong khoảng update_check_interval không stat lại từng file partition
+    assert calls == []
+    engine.check_for_update()
+    assert calls == [partitioned_dir]
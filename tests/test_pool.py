@@ -0,0 +1,79 @@
+import threading
+import pytest
+import pandas as pd
+from core.engine import DataEngine
+from core.context import UserContext
+from core.pool import CursorPool, PoolExhaustedError
+
+@pytest.fixture
+def pool_data_path(tmp_path):
+    p = tmp_path / "pool_sales.parquet"
+    df = pd.DataFrame({
+        "Brand": ["Brand_A", "Brand_B", "Brand_A", "Brand_C"],
+        "Revenue": [100.0, 200.0, 300.0, 400.0]
+    })
+    df.to_parquet(p)
+    return str(p)
+
+def test_cursor_reused_across_requests(pool_data_path):
+    """Database chỉ mở 1 lần, các request tuần tự dùng lại cùng 1 cursor."""
+    engine = DataEngine(pool_data_path, pool_size=2, result_cache_bytes=0)
+    ctx = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+    for _ in range(5):
+        engine.execute_query("SELECT COUNT(*) FROM secure_sales", ctx)
+    engine.get_schema_info(ctx)
+
+    stats = engine.pool_stats()
+    assert stats["created"] == 1
+    assert stats["checkouts"] == 6
+    assert stats["in_use"] == 0
+    assert stats["waits"] == 0
+
+def test_concurrent_contexts_isolated(pool_data_path):
+    """Các request song song với quyền khác nhau không nhìn thấy shadow view của nhau."""
+    engine = DataEngine(pool_data_path, pool_size=3, result_cache_bytes=0)
+    contexts = {
+        "Brand_A": UserContext(user_id="a", role="sales", allowed_brands=["Brand_A"]),
+        "Brand_B": UserContext(user_id="b", role="sales", allowed_brands=["Brand_B"]),
+        "Brand_C": UserContext(user_id="c", role="sales", allowed_brands=["Brand_C"]),
+    }
+    errors = []
+
+    def worker(brand, ctx):
+        for _ in range(20):
+            df = engine.execute_query("SELECT DISTINCT Brand FROM secure_sales", ctx)
+            if df["Brand"].to_list() != [brand]:
+                errors.append((brand, df["Brand"].to_list()))
+
+    threads = [threading.Thread(target=worker, args=item) for item in contexts.items() for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    stats = engine.pool_stats()
+    assert stats["created"] <= 3
+    assert stats["checkouts"] == 120
+
+def test_pool_exhausted_times_out():
+    import duckdb
+    pool = CursorPool(lambda: duckdb.connect(":memory:"), size=1, timeout=0.05)
+    with pool.connection():
+        with pytest.raises(PoolExhaustedError):
+            with pool.connection():
+                pass
+    assert pool.stats()["waits"] == 0
+    with pool.connection() as con:
+        assert con.execute("SELECT 42").fetchone()[0] == 42
+
+def test_shared_database_blocks_ddl(pool_data_path):
+    """Database dùng chung -> user không được phép sửa raw_sales cho người khác."""
+    engine = DataEngine(pool_data_path)
+    ctx = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+    with pytest.raises(ValueError, match="Forbidden"):
+        engine.execute_query("CREATE OR REPLACE VIEW raw_sales AS SELECT 1 AS x", ctx)
+    with pytest.raises(ValueError, match="Forbidden"):
+        engine.execute_query("SET memory_limit='100GB'", ctx)
+    df = engine.execute_query("SELECT COUNT(*) FROM secure_sales", ctx)
+    assert df.item(0, 0) == 4
@@ -0,0 +1,42 @@
+import pandas as pd
+import pytest
+from core.engine import DataEngine
+from core.context import UserContext
+from core.profiling import format_profile
+
+@pytest.fixture
+def engine(tmp_path):
+    p = tmp_path / "sales.parquet"
+    pd.DataFrame({"Main niche": ["Apple", "Banana"] * 5000, "Revenue": [1.0] * 10000}).to_parquet(p)
+    return DataEngine(str(p), brand_col="Main niche", pool_size=1)
+
+SALES = UserContext(user_id="u1", role="sales", allowed_brands=["Apple"])
+SQL = 'SELECT "Main niche", SUM(Revenue) AS rev FROM secure_sales GROUP BY 1'
+
+def test_profile_summary_in_metrics(engine):
+    metrics = {}
+    engine.execute_query(SQL, SALES, metrics=metrics, profile=True)
+    profile = metrics["profile"]
+
+    operators = [op["operator"] for op in profile["operators"]]
+    assert "HASH_GROUP_BY" in operators and "READ_PARQUET" in operators
+    assert profile["rows_scanned"] >= 10000
+    assert profile["operators"][0]["depth"] == 0
+    assert "HASH_GROUP_BY" in format_profile(profile)
+
+def test_profiling_disabled_after_query(engine):
+    engine.execute_query(SQL, SALES, metrics={}, profile=True)
+    # pool_size=1 -> cùng cursor: query sau không bật profiling
+    metrics = {}
+    engine.execute_query("SELECT COUNT(*) FROM secure_sales", SALES, metrics=metrics)
+    assert "profile" not in metrics
+    snap = engine._current_snapshot()
+    with snap.pool.connection() as con:
+        assert con.execute("SELECT current_setting('enable_profiling')").fetchone()[0] in (None, "", "none", "NONE")
+
+def test_metadata_only_query_has_no_operator_tree(engine):
+    admin = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+    metrics = {}
+    assert engine.execute_query("SELECT COUNT(*) FROM secure_sales", admin, metrics=metrics, profile=True).item(0, 0) == 10000
+    assert metrics["profile"]["available"] is False
+    assert "metadata" in format_profile(metrics["profile"])
@@ -0,0 +1,131 @@
+import pandas as pd
+import pytest
+from unittest.mock import MagicMock
+
+from core.agent import PerformanceAgent
+from core.ai import AIEngine
+from core.context import UserContext
+from core.engine import DataEngine
+from core.question_cache import QuestionCache, normalize_question
+
+SCHEMA = "Table: secure_sales\nColumns: Brand, Revenue"
+TOP_SQL = 'SELECT Brand, SUM(Revenue) AS r FROM secure_sales GROUP BY 1 ORDER BY r DESC LIMIT 10'
+
+
+def test_normalize_strips_case_diacritics_and_numbers():
+    text, numbers = normalize_question("  Top 10 Niche có DOANH THU cao nhất đầu năm?? ")
+    assert text == "top <num> niche co doanh thu cao nhat dau nam"
+    assert numbers == ["10"]
+    assert normalize_question("top 10 niche co doanh thu cao nhat dau nam")[0] == text
+
+
+def test_exact_hit_substitutes_numbers():
+    cache = QuestionCache()
+    cache.put("Top 10 niche có doanh thu cao nhất", SCHEMA, None, TOP_SQL, "top", ai_seconds=12.0)
+    hit = cache.get("top 5 niche co doanh thu cao nhat", SCHEMA)
+    assert hit["match"] == "exact"
+    assert hit["sql"].endswith("LIMIT 5")
+    assert hit["saved_s"] > 11.0
+    assert cache.stats()["hits"] == 1
+
+
+def test_fuzzy_hit_only_for_filler_words():
+    cache = QuestionCache()
+    cache.put("Top 10 niche có doanh thu cao nhất", SCHEMA, None, TOP_SQL)
+    hit = cache.get("cho tôi xem top 10 niche có doanh thu cao nhất", SCHEMA)
+    assert hit is not None and hit["match"] == "fuzzy"
+    assert hit["similarity"] >= cache.threshold
+    # Gần giống về chữ nhưng ngược nghĩa -> phải hỏi AI
+    assert cache.get("Top 10 niche có doanh thu thấp nhất", SCHEMA) is None
+    assert cache.stats()["fuzzy_hits"] == 1
+
+
+def test_scope_includes_schema_and_history():
+    cache = QuestionCache()
+    cache.put("tổng doanh thu", SCHEMA, None, "SELECT SUM(Revenue) FROM secure_sales")
+    assert cache.get("tổng doanh thu", SCHEMA + ", Ads Spend") is None
+    history = [{"role": "user", "content": "chỉ xét Brand_A"}]
+    assert cache.get("tổng doanh thu", SCHEMA, history) is None
+    assert cache.get("Tổng doanh thu", SCHEMA) is not None
+
+
+def test_persistence_and_invalidate(tmp_path):
+    path = tmp_path / "qc" / "question_cache.jsonl"
+    cache = QuestionCache(str(path))
+    cache.put("Top 10 niche có doanh thu cao nhất", SCHEMA, None, TOP_SQL, "top", ai_seconds=8.0)
+    reloaded = QuestionCache(str(path))
+    hit = reloaded.get("top 3 niche có doanh thu cao nhất", SCHEMA)
+    assert hit["sql"].endswith("LIMIT 3") and hit["explanation"] == "top"
+
+    reloaded.invalidate("top 3 niche có doanh thu cao nhất", SCHEMA, None, hit["sql"])
+    assert reloaded.stats()["entries"] == 0
+    assert QuestionCache(str(path)).get("Top 10 niche có doanh thu cao nhất", SCHEMA) is None
+
+
+def test_persistence_is_append_only_and_compacts(tmp_path, monkeypatch):
+    import core.question_cache as qc
+    monkeypatch.setattr(qc, "JOURNAL_COMPACT_MIN", 6)
+    path = tmp_path / "question_cache.jsonl"
+    cache = QuestionCache(str(path))
+    cache.put("tổng doanh thu", SCHEMA, None, "SELECT SUM(Revenue) FROM secure_sales")
+    first = path.read_text(encoding="utf-8")
+    cache.put("danh sách brand", SCHEMA, None, "SELECT DISTINCT Brand FROM secure_sales")
+    # put chỉ ghi nối 1 dòng, không ghi lại nội dung cũ
+    assert path.read_text(encoding="utf-8").startswith(first)
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 2
+
+    for i in range(5):
+        cache.put("tổng doanh thu", SCHEMA, None, f"SELECT SUM(Revenue) + {i} FROM secure_sales")
+    # Journal vượt ngưỡng -> ghi lại snapshot chỉ còn entry đang sống
+    assert len(path.read_text(encoding="utf-8").splitlines()) <= 6
+    reloaded = QuestionCache(str(path))
+    assert reloaded.stats()["entries"] == 2
+    assert reloaded.get("tổng doanh thu", SCHEMA)["sql"] == "SELECT SUM(Revenue) + 4 FROM secure_sales"
+
+def test_max_entries_evicts_least_recently_used():
+    cache = QuestionCache(max_entries=2)
+    cache.put("tổng doanh thu", SCHEMA, None, "SELECT SUM(Revenue) FROM secure_sales")
+    cache.put("danh sách brand", SCHEMA, None, "SELECT DISTINCT Brand FROM secure_sales")
+    cache.get("tổng doanh thu", SCHEMA)
+    cache.put("số dòng", SCHEMA, None, "SELECT COUNT(*) FROM secure_sales")
+    assert cache.stats()["entries"] == 2
+    assert cache.get("danh sách brand", SCHEMA) is None
+    assert cache.get("tổng doanh thu", SCHEMA) is not None
+
+
+@pytest.fixture
+def agent_with_cache(tmp_path):
+    p = tmp_path / "sales.parquet"
+    pd.DataFrame({"Brand": ["A", "B", "A"], "Revenue": [100.0, 50.0, 150.0]}).to_parquet(p)
+    mock_ai = MagicMock(spec=AIEngine)
+    agent = PerformanceAgent(DataEngine(str(p), brand_col="Brand"), mock_ai, question_cache=QuestionCache())
+    return agent, mock_ai
+
+
+def test_agent_skips_ai_on_repeated_question(agent_with_cache):
+    agent, mock_ai = agent_with_cache
+    admin = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+    mock_ai.generate_sql.return_value = {"sql": "SELECT SUM(Revenue) AS total FROM secure_sales", "explanation": "sum"}
+
+    first = agent.process_request("Tổng doanh thu là bao nhiêu?", admin)
+    second = agent.process_request("tong doanh thu la bao nhieu", admin)
+    assert first["status"] == second["status"] == "success"
+    assert mock_ai.generate_sql.call_count == 1
+    assert first["metrics"]["question_cache"]["hit"] is False
+    assert second["metrics"]["question_cache"]["hit"] is True
+    assert second["data"]["total"][0] == 300.0
+
+
+def test_agent_invalidates_broken_cached_sql(agent_with_cache):
+    agent, mock_ai = agent_with_cache
+    admin = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+    agent.question_cache.put("tổng doanh thu", agent.data_engine.get_schema_info(admin), None,
+                             "SELECT SUM(Missing) FROM secure_sales")
+    mock_ai.generate_sql.return_value = {"sql": "SELECT SUM(Revenue) AS total FROM secure_sales"}
+
+    result = agent.process_request("tổng doanh thu", admin)
+    assert result["status"] == "success"
+    assert result["sql"] == "SELECT SUM(Revenue) AS total FROM secure_sales"
+    # SQL AI sửa lại thay cho entry hỏng
+    hit = agent.question_cache.get("tổng doanh thu", agent.data_engine.get_schema_info(admin))
+    assert hit["sql"] == result["sql"]
@@ -0,0 +1,106 @@
+import os
+import pytest
+import pandas as pd
+from core.engine import DataEngine
+from core.context import UserContext
+
+ADMIN = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+
+def write_sales(path, rows, mtime_offset=0):
+    pd.DataFrame({
+        "Brand": [f"Brand_{chr(65 + i % 3)}" for i in range(rows)],
+        "Revenue": [float(i) for i in range(rows)]
+    }).to_parquet(path)
+    # Đảm bảo mtime đổi kể cả khi ghi 2 lần trong cùng 1 tick của filesystem
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + mtime_offset * 10**9))
+
+@pytest.fixture
+def sales_path(tmp_path):
+    p = tmp_path / "resident_sales.parquet"
+    write_sales(p, 3)
+    return str(p)
+
+def test_resident_table_survives_source_removal(sales_path):
+    engine = DataEngine(sales_path, resident=True)
+    assert engine.execute_query("SELECT COUNT(*) FROM secure_sales", ADMIN).item(0, 0) == 3
+
+    # File nguồn tạm thời biến mất (đang bị ghi đè) -> vẫn phục vụ từ table trong RAM
+    os.remove(sales_path)
+    df = engine.execute_query("SELECT SUM(Revenue) AS s FROM secure_sales WHERE Brand = 'Brand_A'", ADMIN)
+    assert df.item(0, 0) == 0.0
+
+def test_background_reload_swaps_version_and_notifies(sales_path):
+    engine = DataEngine(sales_path, resident=True)
+    version_1 = engine.dataset_version()
+    seen = []
+    engine.on_reload(seen.append)
+
+    write_sales(sales_path, 6, mtime_offset=10)
+    engine.check_for_update()
+    engine._reload_thread.join(timeout=10)
+
+    assert engine.dataset_version() != version_1
+    assert seen == [engine.dataset_version()]
+    assert engine.execute_query("SELECT COUNT(*) FROM secure_sales", ADMIN).item(0, 0) == 6
+    assert sorted(engine.get_all_brands()) == ["Brand_A", "Brand_B", "Brand_C"]
+
+def test_inflight_query_keeps_old_version(sales_path):
+    engine = DataEngine(sales_path, resident=True)
+    old = engine._current_snapshot()
+
+    with old.pool.connection() as con:
+        engine._setup_shadow_view(con, ADMIN, old)
+        write_sales(sales_path, 9, mtime_offset=10)
+        engine.reload()
+        # Cursor đang mượn vẫn đọc version cũ
+        assert con.execute("SELECT COUNT(*) FROM secure_sales").fetchone()[0] == 3
+
+    assert engine.execute_query("SELECT COUNT(*) FROM secure_sales", ADMIN).item(0, 0) == 9
+    assert old.pool.stats()["created"] == 0
+
+def test_persisted_duckdb_file_reused_and_cleaned(sales_path, tmp_path):
+    persist_dir = str(tmp_path / "resident")
+    engine = DataEngine(sales_path, resident=True, persist_dir=persist_dir)
+    engine.execute_query("SELECT 1", ADMIN)
+    files_v1 = os.listdir(persist_dir)
+    assert len(files_v1) == 1 and files_v1[0].endswith(".duckdb")
+
+    # Restart: engine mới dùng lại file .duckdb đã có
+    engine_2 = DataEngine(sales_path, resident=True, persist_dir=persist_dir)
+    assert engine_2.execute_query("SELECT COUNT(*) FROM secure_sales", ADMIN).item(0, 0) == 3
+    assert os.listdir(persist_dir) == files_v1
+
+    # Version mới -> file cũ bị dọn khi database cũ đóng
+    write_sales(sales_path, 4, mtime_offset=10)
+    engine.reload()
+    assert engine.execute_query("SELECT COUNT(*) FROM secure_sales", ADMIN).item(0, 0) == 4
+    assert files_v1[0] not in os.listdir(persist_dir)
+
+def test_reload_listener_can_trigger_nested_reload(sales_path):
+    import threading
+    # Mode VIEW: file đổi lần nữa ngay trong listener -> get_all_brands reload đồng bộ trên cùng thread
+    engine = DataEngine(sales_path, brand_col="Brand", resident=False)
+    engine.dataset_version()
+    versions, seen, depth = [], [], [0]
+
+    def listener(version):
+        depth[0] += 1
+        assert depth[0] == 1, "listener re-entered"
+        versions.append(version)
+        if len(versions) == 1:
+            write_sales(sales_path, 1, mtime_offset=20)
+            seen.append(engine.get_all_brands(strict=True))
+        depth[0] -= 1
+
+    engine.on_reload(listener)
+    write_sales(sales_path, 6, mtime_offset=10)
+    worker = threading.Thread(target=engine.check_for_update, daemon=True)
+    worker.start()
+    worker.join(timeout=10)
+    assert not worker.is_alive(), "reload deadlocked inside listener"
+    assert seen == [["Brand_A"]]
+    # Reload lồng nhau được báo sau khi listener đầu tiên xong, không đệ quy
+    assert len(versions) == 2 and versions[0] != versions[1]
+    assert versions[1] == engine.dataset_version()
+    assert engine.execute_query("SELECT COUNT(*) FROM secure_sales", ADMIN).item(0, 0) == 1
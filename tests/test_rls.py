@@ -0,0 +1,77 @@
+import duckdb
+import pytest
+import pandas as pd
+from core.engine import DataEngine
+from core.context import UserContext
+
+@pytest.fixture
+def niche_path(tmp_path):
+    p = tmp_path / "niches.parquet"
+    df = pd.DataFrame({
+        "Main niche": [f"Niche_{i}" for i in range(300)],
+        "Revenue": [1.0] * 300
+    })
+    df.to_parquet(p)
+    return str(p)
+
+def view_sql(engine, ctx):
+    snap = engine._current_snapshot()
+    with snap.pool.connection() as con:
+        engine._setup_shadow_view(con, ctx, snap)
+        return con.execute("SELECT sql FROM duckdb_views() WHERE view_name = 'secure_sales'").fetchone()[0]
+
+def test_view_size_flat_as_allowed_list_grows(niche_path):
+    engine = DataEngine(niche_path, brand_col="Main niche")
+    small = UserContext(user_id="u1", role="sales", allowed_brands=["Niche_1", "Niche_2"])
+    # Hàng nghìn niche (phần lớn không tồn tại trong data) + tên có dấu nháy
+    huge = UserContext(user_id="u2", role="sales",
+                       allowed_brands=[f"Niche_{i}" for i in range(0, 300, 3)] + [f"Other's {i}" for i in range(5000)])
+
+    assert len(view_sql(engine, huge)) == len(view_sql(engine, small))
+    assert engine.execute_query("SELECT COUNT(*) FROM secure_sales", small).item(0, 0) == 2
+    assert engine.execute_query("SELECT COUNT(*) FROM secure_sales", huge).item(0, 0) == 100
+
+def test_permission_table_cached_per_permission_set(niche_path):
+    engine = DataEngine(niche_path, brand_col="Main niche", result_cache_bytes=0)
+    ctx = UserContext(user_id="u1", role="sales", allowed_brands=["Niche_7", "Niche_8"])
+    same_set = UserContext(user_id="u9", role="sales", allowed_brands=["Niche_8", "Niche_7"])
+
+    engine.execute_query("SELECT COUNT(*) FROM secure_sales", ctx)
+    engine.execute_query("SELECT COUNT(*) FROM secure_sales", same_set)
+    snap = engine._current_snapshot()
+    assert len(snap.rls_sources) == 1
+    with snap.pool.connection() as con:
+        tables = con.execute("SELECT table_name FROM duckdb_tables() WHERE schema_name = 'rls'").fetchall()
+    assert len(tables) == 1
+
+def test_permission_tables_not_queryable(niche_path):
+    engine = DataEngine(niche_path, brand_col="Main niche")
+    ctx = UserContext(user_id="u1", role="sales", allowed_brands=["Niche_1"])
+    engine.execute_query("SELECT COUNT(*) FROM secure_sales", ctx)
+    with pytest.raises(ValueError, match="Forbidden"):
+        engine.execute_query("SELECT * FROM information_schema.tables t, rls.perm_x p", ctx)
+
+@pytest.mark.parametrize("table", ["main.raw_sales", "memory.main.raw_sales", "memory.raw_sales",
+                                   '"memory"."main"."raw_sales"', "dataset.main.raw_sales", "raw_base",
+                                   "query('SELECT * FROM memory.main.raw_sales')",
+                                   "query_table('memory.main.raw_sales')", "duckdb_tables()", "duckdb_views()",
+                                   "read_text('/etc/hostname')", "read_parquet('niches.parquet')", "'niches.parquet'"])
+def test_qualified_base_table_rejected(niche_path, tmp_path, table):
+    # persist_dir -> bảng gốc nằm trong database gắn ngoài (dataset.main.raw_sales)
+    engine = DataEngine(niche_path, brand_col="Main niche", resident=True, persist_dir=str(tmp_path / "persist"))
+    ctx = UserContext(user_id="u1", role="sales", allowed_brands=["Niche_1"])
+    assert engine.execute_query("SELECT COUNT(*) FROM raw_sales", ctx).item(0, 0) == 1
+    with pytest.raises(ValueError, match="Forbidden"):
+        engine.execute_query(f"SELECT COUNT(*) FROM {table}", ctx)
+
+def test_shared_database_is_locked_down(niche_path):
+    engine = DataEngine(niche_path, brand_col="Main niche")
+    ctx = UserContext(user_id="u1", role="sales", allowed_brands=["Niche_1"])
+    assert engine.execute_query("SELECT * FROM range(3) r(x) CROSS JOIN secure_sales", ctx).height == 3
+    snap = engine._current_snapshot()
+    # Lớp thứ 2 (SQL lọt qua validate_sql): không đọc được file ngoài thư mục data, không đổi được cấu hình
+    with snap.pool.connection() as con:
+        with pytest.raises(duckdb.Error, match="disabled by config"):
+            con.execute("SELECT * FROM read_text('/etc/hostname')").fetchall()
+        with pytest.raises(duckdb.Error, match="locked"):
+            con.execute("SET enable_external_access=true")
@@ -0,0 +1,94 @@
+import pytest
+import pandas as pd
+import polars as pl
+from core.engine import DataEngine
+from core.context import UserContext
+from core.rollups import RollupSpec
+
+@pytest.fixture
+def sales_path(tmp_path):
+    p = tmp_path / "sales.parquet"
+    n = 3000
+    pd.DataFrame({
+        "Report_Date": pd.to_datetime("2024-01-01") + pd.to_timedelta([i % 30 for i in range(n)], unit="D"),
+        "Main niche": [["Apple", "Banana", "Cherry"][i % 3] for i in range(n)],
+        "ASIN": [f"A{i % 50}" for i in range(n)],
+        "Revenue (Actual)": [float(i % 17) if i % 11 else None for i in range(n)],
+        "Ads Spend (Actual)": [float(i % 5) for i in range(n)],
+        "Clicks": [i % 7 for i in range(n)],
+    }).to_parquet(p)
+    return str(p)
+
+def engines(path):
+    spec = [RollupSpec("daily_niche", ["Report_Date", "Main niche"])]
+    return (DataEngine(path, brand_col="Main niche", result_cache_bytes=0, rollups=spec),
+            DataEngine(path, brand_col="Main niche", result_cache_bytes=0))
+
+ADMIN = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+SALES = UserContext(user_id="u1", role="sales", allowed_brands=["Apple", "Cherry"])
+
+ELIGIBLE = [
+    'SELECT "Main niche", SUM("Revenue (Actual)") AS rev, SUM("Ads Spend (Actual)") / SUM("Revenue (Actual)") AS acos '
+    'FROM secure_sales GROUP BY 1 ORDER BY 1',
+    'SELECT Report_Date, COUNT(*), AVG("Revenue (Actual)"), COUNT("Revenue (Actual)") FROM secure_sales '
+    "WHERE Report_Date >= '2024-01-10' GROUP BY Report_Date ORDER BY Report_Date",
+    'SELECT COUNT(DISTINCT "Main niche") AS niches, MAX(Report_Date) AS last_day, SUM(Clicks) FROM secure_sales',
+    'SELECT "Main niche", SUM(Clicks) AS c FROM secure_sales GROUP BY 1 HAVING SUM(Clicks) > 10 ORDER BY c DESC',
+]
+
+INELIGIBLE = [
+    'SELECT ASIN, SUM("Revenue (Actual)") FROM secure_sales GROUP BY 1',   # cột không phải dimension
+    'SELECT SUM("Revenue (Actual)" * 2) FROM secure_sales',                 # aggregate trên biểu thức
+    'SELECT "Main niche", "Revenue (Actual)" FROM secure_sales',            # không aggregate
+    'SELECT MAX("Revenue (Actual)") FROM secure_sales',                     # MIN/MAX trên measure
+    'SELECT COUNT(*) FROM secure_sales WHERE Clicks > 3',                   # filter trên measure
+    'SELECT "Main niche" AS n, SUM(Clicks) AS c FROM secure_sales WHERE n = \'Apple\' GROUP BY 1',  # alias ở WHERE
+    'SELECT "Main niche" AS ASIN, SUM(Clicks) AS c FROM secure_sales GROUP BY 1 ORDER BY ASIN',  # alias trùng cột gốc
+]
+
+@pytest.mark.parametrize("ctx", [ADMIN, SALES])
+@pytest.mark.parametrize("sql", ELIGIBLE)
+def test_rollup_matches_raw(sales_path, sql, ctx):
+    rolled, plain = engines(sales_path)
+    metrics = {}
+    got = rolled.execute_query(sql, ctx, metrics=metrics)
+    expected = plain.execute_query(sql, ctx)
+
+    assert metrics["rollup"] == "daily_niche"
+    assert got.columns == expected.columns
+    assert got.shape == expected.shape
+    for col in expected.columns:
+        if expected[col].dtype.is_numeric():
+            assert got[col].cast(pl.Float64).to_list() == pytest.approx(expected[col].cast(pl.Float64).to_list(), nan_ok=True)
+        else:
+            assert got[col].to_list() == expected[col].to_list()
+
+@pytest.mark.parametrize("sql", INELIGIBLE)
+def test_ineligible_queries_use_raw(sales_path, sql):
+    rolled, _ = engines(sales_path)
+    metrics = {}
+    rolled.execute_query(sql, ADMIN, metrics=metrics)
+    assert metrics["rollup"] is None
+
+def test_alias_shadowing_source_column_is_not_rewritten(sales_path):
+    rolled, plain = engines(sales_path)
+    sql = 'SELECT "Main niche" AS ASIN, SUM(Clicks) AS c FROM secure_sales WHERE ASIN = \'A1\' GROUP BY 1'
+    metrics = {}
+    got = rolled.execute_query(sql, ADMIN, metrics=metrics)
+    # Bảng gốc lọc theo cột ASIN thật; rollup (không có ASIN) sẽ lọc nhầm theo alias
+    assert metrics["rollup"] is None
+    assert got.equals(plain.execute_query(sql, ADMIN))
+
+def test_rollup_rls_and_internal_schema(sales_path):
+    rolled, _ = engines(sales_path)
+    df = rolled.execute_query('SELECT "Main niche", COUNT(*) AS n FROM secure_sales GROUP BY 1 ORDER BY 1', SALES)
+    assert df["Main niche"].to_list() == ["Apple", "Cherry"]
+    with pytest.raises(ValueError, match="Forbidden"):
+        rolled.execute_query("SELECT * FROM rollup.daily_niche", SALES)
+
+@pytest.mark.parametrize("table", ["query_table('rollup.daily_niche')", "query('SELECT * FROM rollup.daily_niche')"])
+def test_rollup_not_reachable_through_table_functions(sales_path, table):
+    rolled, _ = engines(sales_path)
+    rolled.execute_query("SELECT COUNT(*) FROM secure_sales", SALES)
+    with pytest.raises(ValueError, match="Forbidden"):
+        rolled.execute_query(f"SELECT * FROM {table}", SALES)
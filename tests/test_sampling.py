@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+from core.engine import DataEngine
+from core.context import UserContext
+
+@pytest.fixture
+def engine(tmp_path):
+    rng = np.random.default_rng(7)
+    n = 60_000
+    niches = np.where(np.arange(n) % 20 == 0, "Tiny", np.where(np.arange(n) % 2 == 0, "Apple", "Banana"))
+    p = tmp_path / "sales.parquet"
+    pd.DataFrame({
+        "Main niche": niches,
+        "Revenue": rng.gamma(2.0, 50.0, n),
+        "Clicks": rng.integers(0, 20, n),
+    }).to_parquet(p)
+    return DataEngine(str(p), brand_col="Main niche", result_cache_bytes=0, sample_fraction=0.05)
+
+ADMIN = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+SALES = UserContext(user_id="u1", role="sales", allowed_brands=["Apple", "Tiny"])
+SQL = 'SELECT "Main niche", SUM(Revenue) AS rev, COUNT(*) AS n, AVG(Clicks) AS avg_clicks FROM secure_sales GROUP BY 1 ORDER BY 1'
+
+@pytest.mark.parametrize("ctx", [ADMIN, SALES])
+def test_approximate_within_confidence_interval(engine, ctx):
+    exact = engine.execute_query(SQL, ctx)
+    metrics = {}
+    approx = engine.execute_query(SQL, ctx, metrics=metrics, approximate=True)
+
+    assert metrics["approximate"] is True
+    assert 0.04 < metrics["sample_fraction"] < 0.1
+    assert approx.columns == ["Main niche", "rev", "n", "avg_clicks", "rev_ci95", "n_ci95"]
+    assert approx["Main niche"].to_list() == exact["Main niche"].to_list()
+    for got, want, ci in zip(approx["rev"], exact["rev"], approx["rev_ci95"]):
+        # 1.5 × nửa-khoảng tin cậy 95% (~3σ) -> gần như chắc chắn chứa giá trị thật
+        assert abs(got - want) <= 1.5 * ci + 1e-6
+    # Stratified: COUNT(*) của từng niche khớp chính xác (trọng số = N / n)
+    assert approx["n"].to_list() == exact["n"].to_list()
+    assert approx["avg_clicks"].to_list() == pytest.approx(exact["avg_clicks"].to_list(), rel=0.1)
+
+def test_non_estimable_query_runs_exact(engine):
+    metrics = {}
+    df = engine.execute_query('SELECT COUNT(DISTINCT Clicks) AS c FROM secure_sales', ADMIN, metrics=metrics, approximate=True)
+    assert metrics["approximate"] is False
+    assert df.item(0, 0) == 20
+    with pytest.raises(ValueError, match="Forbidden"):
+        engine.execute_query("SELECT * FROM approx.sample", ADMIN)
+
+@pytest.mark.parametrize("table", ["query_table('approx.sample')", "query('SELECT * FROM approx.sample')"])
+def test_sample_not_reachable_through_table_functions(engine, table):
+    engine.execute_query(SQL, SALES, approximate=True)
+    with pytest.raises(ValueError, match="Forbidden"):
+        engine.execute_query(f"SELECT * FROM {table}", SALES)
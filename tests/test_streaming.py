@@ -0,0 +1,55 @@
+import json
+import pytest
+import pandas as pd
+import pyarrow as pa
+from core.engine import DataEngine
+from core.context import UserContext
+from core.streaming import iter_ndjson, iter_arrow_ipc
+
+@pytest.fixture
+def stream_engine(tmp_path):
+    p = tmp_path / "stream_sales.parquet"
+    df = pd.DataFrame({
+        "Brand": ["Brand_A", "Brand_B"] * 5000,
+        "Revenue": [float(i) for i in range(10000)]
+    })
+    df.to_parquet(p)
+    return DataEngine(str(p))
+
+ADMIN = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+
+def test_stream_yields_bounded_batches(stream_engine):
+    ctx = UserContext(user_id="u1", role="sales", allowed_brands=["Brand_A"])
+    with stream_engine.execute_query_stream("SELECT * FROM secure_sales", ctx, batch_size=2048) as stream:
+        sizes = [batch.num_rows for batch in stream]
+    assert sum(sizes) == 5000
+    assert max(sizes) <= 2048
+    assert len(sizes) > 1
+    assert stream_engine.pool_stats()["in_use"] == 0
+
+def test_stream_close_early_releases_cursor(stream_engine):
+    stream = stream_engine.execute_query_stream("SELECT * FROM secure_sales", ADMIN, batch_size=1000)
+    next(stream)
+    assert stream_engine.pool_stats()["in_use"] == 1
+    stream.close()
+    assert stream_engine.pool_stats()["in_use"] == 0
+
+def test_stream_validates_eagerly(stream_engine):
+    with pytest.raises(ValueError, match="Forbidden"):
+        stream_engine.execute_query_stream("DROP TABLE raw_sales", ADMIN)
+    with pytest.raises(Exception):
+        stream_engine.execute_query_stream("SELECT no_such_col FROM secure_sales", ADMIN)
+    assert stream_engine.pool_stats()["in_use"] == 0
+
+def test_ndjson_and_arrow_encoders(stream_engine):
+    sql = "SELECT Brand, Revenue FROM secure_sales ORDER BY Revenue LIMIT 3000"
+
+    lines = b"".join(iter_ndjson(stream_engine.execute_query_stream(sql, ADMIN, batch_size=1000))).splitlines()
+    assert len(lines) == 3000
+    assert json.loads(lines[0]) == {"Brand": "Brand_A", "Revenue": 0.0}
+
+    payload = b"".join(iter_arrow_ipc(stream_engine.execute_query_stream(sql, ADMIN, batch_size=1000)))
+    table = pa.ipc.open_stream(payload).read_all()
+    assert table.num_rows == 3000
+    assert table.column_names == ["Brand", "Revenue"]
+    assert stream_engine.pool_stats()["in_use"] == 0
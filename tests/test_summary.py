@@ -0,0 +1,66 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from core.context import UserContext
+from core.ingest import DeltaTable
+from core.summary import KpiSummary
+
+ADMIN = UserContext(user_id="admin", role="admin", allowed_brands=["ALL"])
+SALES_A = UserContext(user_id="u1", role="sales", allowed_brands=["Apple", "Unknown"])
+
+
+def _frame(niches, skus, revenue, day=1):
+    return pd.DataFrame({
+        "Report_Date": [datetime.date(2025, 1, day)] * len(niches),
+        "Main niche": niches,
+        "SKU": skus,
+        "Revenue (Actual)": revenue,
+        "Ads Spend (Actual)": [1.0] * len(niches),
+    })
+
+
+@pytest.fixture
+def master_path(tmp_path):
+    p = tmp_path / "master.parquet"
+    _frame(["Apple", "Apple", "Apple", "Banana", None],
+           ["S1", "S1", "S2", "S3", "S9"],
+           [10.0, 10.0, 0.0, 20.0, 5.0]).to_parquet(p)
+    return str(p)
+
+
+def test_summary_respects_rls_and_caches(master_path):
+    summary = KpiSummary(master_path)
+    admin = summary.summary(ADMIN)
+    assert admin["revenue"] == 45.0 and admin["spend"] == 5.0 and admin["rows"] == 5
+    assert admin["active_skus"] == 4  # S2 có revenue 0 nhưng spend > 0 -> vẫn active
+    assert admin["tacos"] == pytest.approx(5 / 45 * 100)
+    assert [n["niche"] for n in admin["niches"]] == ["Apple", "Banana", None]
+    assert admin["first_date"] == "2025-01-01" and admin["cached"] is False
+
+    sales = summary.summary(SALES_A)
+    assert sales["revenue"] == 20.0 and sales["active_skus"] == 2
+    assert [n["niche"] for n in sales["niches"]] == ["Apple"]
+
+    again = summary.summary(SALES_A)
+    assert again["cached"] is True and again["version"] == sales["version"]
+    assert summary.stats()["files_scanned"] == 1
+
+
+def test_incremental_dataset_only_scans_new_deltas(tmp_path):
+    root = str(tmp_path / "ppc")
+    table = DeltaTable.create(root, _frame(["Apple", "Banana"], ["S1", "S2"], [10.0, 20.0]))
+    summary = KpiSummary(root)
+    first = summary.summary(ADMIN)
+    assert first["active_skus"] == 2 and summary.stats()["files_scanned"] == 1
+
+    # S1 xuất hiện lại trong delta -> không bị đếm 2 lần
+    table.append(_frame(["Apple", "Cherry"], ["S1", "S4"], [5.0, 7.0], day=2))
+    second = summary.summary(ADMIN)
+    assert second["version"] != first["version"]
+    assert second["revenue"] == 42.0 and second["active_skus"] == 3
+    assert second["last_date"] == "2025-01-02"
+    assert summary.stats()["files_scanned"] == 2
+
+    assert summary.summary(SALES_A)["revenue"] == 15.0